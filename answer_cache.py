@@ -0,0 +1,153 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+# คำลงท้าย/คำสุภาพที่ไม่มีผลต่อความหมายของคำถาม ตัดออกก่อนใช้เป็น key
+_TRAILING_PARTICLES = (
+    "ครับผม", "นะครับ", "นะคะ", "นะค่ะ", "ครับ", "ค่ะ", "คะ", "จ้า", "จ้ะ", "หน่อย",
+)
+_PUNCT_RE = re.compile(r"[\s\?\!\.,;:'\"“”‘’()\[\]{}…~]+")
+
+
+def normalize_question(question: str) -> str:
+    """แปลงคำถามให้อยู่ในรูปมาตรฐานสำหรับใช้เป็น cache key"""
+    text = _PUNCT_RE.sub(" ", question.lower()).strip()
+    text = re.sub(r"\s+", " ", text)
+    changed = True
+    while changed and text:
+        changed = False
+        for particle in _TRAILING_PARTICLES:
+            if text.endswith(particle) and len(text) > len(particle):
+                text = text[: -len(particle)].rstrip()
+                changed = True
+    return text
+
+
+class AnswerCache:
+    """Cache คำตอบ 2 ชั้น
+
+    ชั้นที่ 1: จับคู่คำถามที่ normalize แล้วแบบตรงตัว
+    ชั้นที่ 2: จับคู่คำถามที่ใกล้เคียงกันด้วย cosine similarity ของ query embedding
+    มีการจำกัดขนาดแบบ LRU, TTL และล้างทั้งหมดเมื่อ knowledge base ถูกสร้างใหม่
+    """
+
+    def __init__(self, max_size: int = 512, ttl_seconds: float = 6 * 3600, similarity_threshold: float = 0.95):
+        self.max_size = max(1, max_size)
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.version = None
+        self._entries = OrderedDict()  # key -> (answer, created_at, embedding หรือ None)
+        self._matrix = None
+        self._matrix_keys = []
+        self._lock = threading.Lock()
+
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def _expired(self, created_at: float, now: float) -> bool:
+        return self.ttl_seconds > 0 and now - created_at > self.ttl_seconds
+
+    def _drop(self, key):
+        self._entries.pop(key, None)
+        self._matrix = None
+
+    def peek(self, key: str) -> bool:
+        """มีคำตอบแบบตรงตัวที่ยังไม่หมดอายุหรือไม่ (ไม่นับสถิติ ไม่ขยับลำดับ LRU)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and not self._expired(entry[1], time.monotonic())
+
+    def get(self, key: str):
+        """ค้นหาแบบตรงตัว คืนค่า None ถ้าไม่เจอ (ไม่นับ miss เพื่อให้ค้นชั้นที่ 2 ต่อได้)"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if self._expired(entry[1], now):
+                self._drop(key)
+                self.expirations += 1
+                return None
+            self._entries.move_to_end(key)
+            self.exact_hits += 1
+            return entry[0]
+
+    def get_similar(self, embedding):
+        """ค้นหาคำถามที่ embedding ใกล้เคียงที่สุด คืนค่า None และนับ miss ถ้าไม่ผ่าน threshold"""
+        now = time.monotonic()
+        with self._lock:
+            if embedding is not None and self._entries:
+                if self._matrix is None:
+                    self._rebuild_matrix()
+                if self._matrix is not None:
+                    query = _unit(embedding)
+                    scores = self._matrix @ query
+                    best = int(np.argmax(scores))
+                    if scores[best] >= self.similarity_threshold:
+                        key = self._matrix_keys[best]
+                        entry = self._entries.get(key)
+                        if entry is not None and not self._expired(entry[1], now):
+                            self._entries.move_to_end(key)
+                            self.semantic_hits += 1
+                            return entry[0]
+            self.misses += 1
+            return None
+
+    def _rebuild_matrix(self):
+        keys = [k for k, e in self._entries.items() if e[2] is not None]
+        self._matrix_keys = keys
+        self._matrix = np.vstack([self._entries[k][2] for k in keys]) if keys else None
+
+    def put(self, key: str, answer: str, embedding=None, version=None):
+        """บันทึกคำตอบ ถ้า version ไม่ตรงกับ knowledge base ปัจจุบันจะไม่เก็บ (คำตอบมาจาก index เก่า)"""
+        with self._lock:
+            if version is not None and version != self.version:
+                return
+            vector = _unit(embedding) if embedding is not None else None
+            self._entries[key] = (answer, time.monotonic(), vector)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            self._matrix = None
+
+    def invalidate(self, version=None):
+        """ล้าง cache ทั้งหมด เรียกเมื่อ knowledge base / vector store ถูกสร้างใหม่"""
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+            self._matrix_keys = []
+            self.version = version
+            self.invalidations += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = self.exact_hits + self.semantic_hits
+            lookups = hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl_seconds,
+                "similarity_threshold": self.similarity_threshold,
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "version": self.version,
+            }
+
+
+def _unit(vector):
+    arr = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(arr)
+    return arr / norm if norm else arr
@@ -1,31 +1,58 @@
-from flask import Flask, request, abort
+from flask import Flask, Response, request, abort
 from linebot.v3 import WebhookHandler
 from linebot.v3.exceptions import InvalidSignatureError
 from linebot.v3.messaging import (
     Configuration,
-    ApiClient,
-    MessagingApi,
     ReplyMessageRequest,
+    PushMessageRequest,
     TextMessage,
     ImageMessage,
 )
 from linebot.v3.webhooks import MessageEvent, TextMessageContent
 
 import google.generativeai as genai
+import atexit
+import inspect
 import os
-from rag_handler import answer_question
-from contact_data import contact_info_db
+import time
+from rag_handler import answer_question, ANSWER_CACHE, ANSWER_FLIGHTS, CONTEXT_PACKER, start_rag_build, rag_status, section_index_stats, faq_store_stats
+from rag_handler import LLM_BREAKER, LLM_UNAVAILABLE_MESSAGE, RAG_ERROR_MESSAGE, has_free_answer
+from circuit_breaker import OPEN, CircuitOpenError
+from user_limits import UserLimiter, gemini_usage, record_llm_usage
+from job_queue import BatchRunner, JobQueue, KeyedSerializer, group_by_key
+from reply_deadline import ReplyDeadline
+from line_client import LineClient
+from providers import gemini_client_kwargs
+from metrics import REGISTRY, REPLY_PATHS, ROUTES, USER_LIMITED, count, span
+from log_pipeline import logging_stats
+from intent_router import IntentRouter
+from session_store import SessionStore
+from session_backend import create_session_backend
+from contact_data import contact_info_db, find_contact_mentions
 from dotenv import load_dotenv
 
+try:
+    from linebot.v3.messaging import ShowLoadingAnimationRequest
+except ImportError:  # line-bot-sdk < 3.8 ยังไม่มี loading animation API
+    ShowLoadingAnimationRequest = None
+
 load_dotenv()
 
 app = Flask(__name__)
 
-configuration = Configuration(access_token=os.getenv('LINE_CHANNEL_ACCESS_TOKEN', 'kjoDJiMr9t76qcUAy8BkYWVo1+tpP/su3tYLmvUrI6R67nLGarVh8yOTWJJDJzL6L7fJKO/FCL6SKkSoCYWUoQAiPyFeLEklsS/31cEWZZ3lUW9TMD4ZwcqnI+p4+mV3u/Zy4KNR7yyOoBDdtW1/fAdB04t89/1O/w1cDnyilFU='))
+# LINE_API_ENDPOINT: ส่งคำขอไปยัง LINE API จำลองแทน api.line.me (ดู benchmarks/bench_webhook_load.py)
+configuration = Configuration(host=os.getenv('LINE_API_ENDPOINT') or None, access_token=os.getenv('LINE_CHANNEL_ACCESS_TOKEN', 'kjoDJiMr9t76qcUAy8BkYWVo1+tpP/su3tYLmvUrI6R67nLGarVh8yOTWJJDJzL6L7fJKO/FCL6SKkSoCYWUoQAiPyFeLEklsS/31cEWZZ3lUW9TMD4ZwcqnI+p4+mV3u/Zy4KNR7yyOoBDdtW1/fAdB04t89/1O/w1cDnyilFU='))
 handler = WebhookHandler(os.getenv('LINE_CHANNEL_SECRET', 'fcee06db289c6014ee1d3dd45fdf96b8'))
 
+# MessagingApi ตัวเดียวต่อ worker ใช้ connection pool ร่วมกัน (ไม่ต้อง TLS handshake ใหม่ทุกครั้งที่ตอบ)
+line_client = LineClient(configuration, pool_maxsize=int(os.getenv('LINE_POOL_MAXSIZE', '8')))
+atexit.register(line_client.close)
+
+# สร้าง RAG chain ใน background thread เพื่อให้ Flask รับ request ได้ทันที (ดูความคืบหน้าที่ /ready)
+start_rag_build("kmutnbBuddy.md", background=os.getenv('RAG_BUILD_IN_BACKGROUND', 'true').lower() in ('1', 'true', 'yes'))
+
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-genai.configure(api_key=GEMINI_API_KEY)
+genai.configure(api_key=GEMINI_API_KEY, **gemini_client_kwargs())
 generation_config = {
     "temperature": 1,
     "top_p": 0.95,
@@ -34,221 +61,397 @@ generation_config = {
     "response_mime_type": "text/plain",
 }
 
+# --- โหมดประมวลผล webhook ---
+# WEBHOOK_ASYNC=true: ตรวจ signature แล้วโยน event เข้าคิว ตอบ 200 ให้ LINE ทันที
+# WEBHOOK_ASYNC=false (ค่าเริ่มต้น): ประมวลผลจนตอบกลับเสร็จก่อนคืน response เหมือนเดิม
+WEBHOOK_ASYNC = os.getenv('WEBHOOK_ASYNC', 'false').lower() in ('1', 'true', 'yes')
+webhook_queue = JobQueue(
+    workers=int(os.getenv('WEBHOOK_WORKERS', '4')),
+    maxsize=int(os.getenv('WEBHOOK_QUEUE_SIZE', '100')),
+    name="webhook",
+)
+atexit.register(webhook_queue.shutdown, False)
+# webhook หนึ่งครั้งอาจมีหลาย event: event ของผู้ใช้ต่างคนกันประมวลผลพร้อมกัน (ไม่เกิน WEBHOOK_EVENT_WORKERS
+# thread ต่อ process) ส่วน event ของผู้ใช้คนเดียวกันยังทำทีละข้อความตามลำดับ, 0 = ทีละ event แบบเดิม
+webhook_batches = BatchRunner(workers=int(os.getenv('WEBHOOK_EVENT_WORKERS', '8')), name="webhook-events")
+# ลำดับข้อความของผู้ใช้คนเดียวกันข้าม delivery: LINE อาจส่งข้อความถัดไปมาเป็น webhook ใหม่ขณะข้อความก่อนยังตอบไม่เสร็จ
+user_turns = KeyedSerializer(name="user-turns")
+REGISTRY.gauge("kmutnb_webhook_queue_depth", "Events waiting in the webhook queue (WEBHOOK_ASYNC).", webhook_queue.depth)
+REGISTRY.gauge("kmutnb_llm_circuit_open", "1 while the Gemini circuit breaker rejects calls (open), else 0.",
+               lambda: int(LLM_BREAKER.state == OPEN))
+
+# --- Deadline ของ reply token ---
+# ถ้าคำตอบยังไม่เสร็จภายใน REPLY_DEADLINE_SECONDS (นับจากเวลาที่ LINE ส่ง event, 0 = ปิด ค่าเริ่มต้น)
+# จะส่ง placeholder ไปก่อน แล้วส่งคำตอบจริงด้วย push API เมื่อเสร็จ
+# push นับเป็นโควตาข้อความรายเดือนของ LINE OA (reply ไม่นับ) จึงต้องเปิดเอง จำนวนที่ส่งไปดูได้ที่ /stats
+# REPLY_PLACEHOLDER=text: ตอบข้อความรอด้วย reply token, =loading: แสดง loading animation (ต้องใช้ line-bot-sdk >= 3.8)
+REPLY_DEADLINE_SECONDS = float(os.getenv('REPLY_DEADLINE_SECONDS', '0'))
+REPLY_PLACEHOLDER_TEXT = "KMUTNB Buddy กำลังค้นหาข้อมูลให้อยู่นะคะ รอสักครู่ค่ะ"
+USE_LOADING_ANIMATION = (os.getenv('REPLY_PLACEHOLDER', 'text').lower() == 'loading'
+                         and ShowLoadingAnimationRequest is not None)
+reply_deadline = ReplyDeadline(REPLY_DEADLINE_SECONDS, placeholder_uses_reply_token=not USE_LOADING_ANIMATION)
+
 @app.get('/hello')
 def hello_world():
     return {"hello" : "world"}
 
+@app.get('/ready')
+def ready():
+    status = rag_status()
+    return status, (200 if status["ready"] else 503)
+
+@app.get('/stats')
+def stats():
+    return {
+        "webhook_async": WEBHOOK_ASYNC,
+        "webhook_queue": webhook_queue.stats(),
+        "webhook_batches": webhook_batches.stats(),
+        "user_turns": user_turns.stats(),
+        "reply_deadline": reply_deadline.stats(),
+        "line_client": line_client.stats(),
+        "answer_cache": ANSWER_CACHE.stats(),
+        "answer_coalescing": ANSWER_FLIGHTS.stats(),
+        "llm_breaker": LLM_BREAKER.stats(),
+        "context_packer": CONTEXT_PACKER.stats(),
+        "section_index": section_index_stats(),
+        "faq_store": faq_store_stats(),
+        "intent_router": intent_router.stats(),
+        "sessions": user_gemini_sessions.stats(),
+        "user_limiter": user_limiter.stats(),
+        "session_backend": session_backend.stats(),
+        "logging": logging_stats(),
+    }
+
+@app.get('/metrics')
+def metrics():
+    # Prometheus text format ของ worker ที่รับ request นี้ (METRICS_ENABLED=false = ปิด)
+    if not REGISTRY.enabled:
+        abort(404)
+    return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
 @app.route("/callback", methods=['POST'])
 def callback():
     signature = request.headers['X-Line-Signature']
     body = request.get_data(as_text=True)
-    app.logger.info("Request body: " + body)
+    # body ทั้งก้อนถูก sample (webhook_body) ตัดความยาว และลบ token/user id ใน log_pipeline
+    app.logger.info("Request body: %s", body, extra={"category": "webhook_body"})
 
     try:
-        handler.handle(body, signature)
+        payload = handler.parser.parse(body, signature, as_payload=True)
     except InvalidSignatureError:
         app.logger.info("Invalid signature.")
         abort(400)
+    batches = group_events_by_user(payload.events)
+    destination = payload.destination
+
+    if not WEBHOOK_ASYNC:
+        # รอจนตอบครบทุก event ก่อนคืน response: เวลารวมใกล้กับผู้ใช้ที่ช้าที่สุด ไม่ใช่ผลรวมของทุก event
+        webhook_batches.run_all(lambda batch: dispatch_events(batch, destination), batches)
+        return 'OK'
+
+    for batch in batches:
+        # หนึ่งงานต่อผู้ใช้ และ dispatch_events ต่องานไว้หลังข้อความก่อนหน้าของผู้ใช้คนเดียวกัน
+        # ข้อความของผู้ใช้คนเดียวกันจึงไม่ถูก worker คนละตัวทำพร้อมกัน แม้จะมาคนละ delivery
+        if not webhook_queue.submit(dispatch_events, batch, destination):
+            # คิวเต็ม: ประมวลผลใน request นี้เลยแทนการทิ้ง event (backpressure)
+            app.logger.warning(f"Webhook queue full (depth={webhook_queue.depth()}), handling event inline.")
+            dispatch_events(batch, destination)
 
     return 'OK'
 
-user_gemini_sessions = {}
+def event_order_key(event):
+    """event ที่ key เดียวกันต้องทำตามลำดับ: ผู้ใช้คนเดียวกัน (หรือกลุ่ม/ห้องถ้า LINE ไม่ส่ง user id มา)"""
+    source = getattr(event, "source", None)
+    return (getattr(source, "user_id", None) or getattr(source, "group_id", None)
+            or getattr(source, "room_id", None) or id(event))
+
+def group_events_by_user(events):
+    return group_by_key(events, event_order_key)
+
+def dispatch_events(events, destination=None):
+    """ประมวลผล event ของผู้ใช้คนเดียวกัน (หนึ่งกลุ่มจาก group_events_by_user) ต่อจากข้อความก่อนหน้าของผู้ใช้นั้น
+
+    ถ้า delivery ก่อนหน้ายังทำข้อความของผู้ใช้นี้อยู่ กลุ่มนี้ต่อคิวให้ thread นั้นทำ:
+    โหมด sync รอจนเสร็จก่อนตอบ LINE, โหมด WEBHOOK_ASYNC คืน worker ทันทีไม่ต้องนั่งรอ
+    """
+    if not events:
+        return
+    user_turns.run(event_order_key(events[0]), _dispatch_in_order, events, destination, wait=not WEBHOOK_ASYNC)
+
+def _dispatch_in_order(events, destination):
+    for event in events:
+        dispatch_event(event, destination)
+
+def registered_handler(event):
+    """handler ที่ลงทะเบียนด้วย @handler.add / @handler.default สำหรับ event นี้
+
+    ลำดับเดียวกับ WebhookHandler.handle (callback แยก event ตามผู้ใช้เอง จึงเรียก handle ทั้ง body ไม่ได้):
+    (ชนิด event, ชนิด message) -> ชนิด event -> default
+    """
+    if isinstance(event, MessageEvent):
+        func = handler._handlers.get(f"{type(event).__name__}_{type(event.message).__name__}")
+        if func is not None:
+            return func
+    return handler._handlers.get(type(event).__name__) or handler._default
+
+def dispatch_event(event, destination=None):
+    """ส่ง event ที่ parse แล้วไปยัง handler ที่ลงทะเบียนไว้ (แทน handler.handle)"""
+    func = registered_handler(event)
+    if func is None:
+        app.logger.info(f"No handler for event type {type(event).__name__}, ignored.")
+        return
+    # เรียกแบบเดียวกับ SDK: handler ที่รับ 2 argument ได้ destination ด้วย
+    spec = inspect.getfullargspec(func)
+    if spec.varargs is not None or len(spec.args) == 2:
+        func(event, destination)
+    elif len(spec.args) == 1:
+        func(event)
+    else:
+        func()
+
+user_gemini_sessions = SessionStore(
+    max_users=int(os.getenv('SESSION_MAX_USERS', '1000')),
+    idle_ttl_seconds=float(os.getenv('SESSION_IDLE_TTL_SECONDS', '1800')),
+    max_turns=int(os.getenv('SESSION_MAX_TURNS', '10')),
+)
+
+# ประวัติบทสนทนาที่ทุก gunicorn worker ใช้ร่วมกัน (SESSION_BACKEND=sqlite|memory)
+session_backend = create_session_backend(
+    os.getenv('SESSION_BACKEND', 'sqlite'),
+    path=os.getenv('SESSION_DB_PATH', 'sessions.db'),
+    keep_contents=user_gemini_sessions.max_turns * 2,
+)
+atexit.register(session_backend.close)
+
+# --- จำกัดการใช้งานต่อผู้ใช้ (เฉพาะข้อความที่ต้องเรียก RAG/Gemini) ---
+# USER_RATE_PER_MINUTE/USER_RATE_BURST: token bucket ของจำนวนข้อความ
+# USER_DAILY_TOKEN_BUDGET: token ของ LLM (prompt + output) ต่อผู้ใช้ต่อวัน (0 = ไม่จำกัด) นับต่อ worker
+user_limiter = UserLimiter(
+    rate_per_minute=float(os.getenv('USER_RATE_PER_MINUTE', '6')),
+    burst=int(os.getenv('USER_RATE_BURST', '5')),
+    daily_token_budget=int(os.getenv('USER_DAILY_TOKEN_BUDGET', '100000')),
+    max_users=int(os.getenv('USER_LIMITER_MAX_USERS', '10000')),
+    enabled=os.getenv('USER_LIMITER_ENABLED', 'true').lower() in ('1', 'true', 'yes'),
+)
+USER_LIMIT_MESSAGES = {
+    "rate": "ขออภัยค่ะ คุณส่งคำถามถี่เกินไป รอสักครู่แล้วค่อยถามใหม่นะคะ",
+    "budget": "ขออภัยค่ะ วันนี้คุณใช้โควตาการถามคำถามครบแล้ว พรุ่งนี้มาถามใหม่ได้นะคะ",
+}
 
 def get_or_create_chat_session(user_id):
-    if user_id not in user_gemini_sessions:
+    # head เปลี่ยนเมื่อ worker อื่นเขียนประวัติของผู้ใช้นี้เพิ่ม -> โหลด session ใหม่จาก backend
+    head = session_backend.head(user_id)
+
+    def new_session():
+        turns, _ = session_backend.load(user_id, limit=user_gemini_sessions.max_turns * 2)
         model = genai.GenerativeModel(
             model_name="gemini-2.0-flash-lite",
             generation_config=generation_config,
         )
-        user_gemini_sessions[user_id] = model.start_chat(history=[])
-    return user_gemini_sessions[user_id]
+        return model.start_chat(history=[{"role": role, "parts": [text]} for role, text in turns])
+    return user_gemini_sessions.get_or_create(user_id, new_session, token=head)
 
 
-@handler.add(MessageEvent, message=TextMessageContent)
-def handle_message(event):
-    user_id = event.source.user_id
-    user_message = event.message.text
-    user_message_lower = user_message.lower()
+intent_router = IntentRouter()
 
-    messages_to_reply = []
-    final_bot_text_response = ""
+# --- Intent handlers: คืนค่า (ข้อความตอบ, รายการ message ที่จะส่ง) ---
+# ถ้ารายการ message ว่าง handle_message จะสร้าง TextMessage จากข้อความตอบให้เอง
 
-    gemini_chat_session = get_or_create_chat_session(user_id)
-    responded_by_gemini_direct = False
+@intent_router.handler("greeting")
+def handle_greeting_intent(user_message, user_message_lower):
+    return "สวัสดีค่ะ KMUTNB Buddy ยินดีให้บริการ", []
 
-    # --- Phase 1: Rule-based Responses ---
-    if user_message_lower in ['สวัสดี', 'นี่ใคร'] or user_message_lower.startswith('สวัสดี'):
-        final_bot_text_response = "สวัสดีค่ะ KMUTNB Buddy ยินดีให้บริการ"
-    
-    # 2. ตรวจสอบคำถามที่ต้องการข้อมูลการติดต่อ (ปรับปรุง Logic หลักตรงนี้)
-    elif any(kw in user_message_lower for kw in ['เบอร์โทร', 'โทรศัพท์', 'ติดต่อ', 'อีเมล', 'email', 'ช่องทางติดต่อ', 'เบอร์', 'อาจารย์', 'บุคลากร']):
-        
-        response_parts = []
-        found_actionable_info = False # Flag เพื่อบอกว่าเจอข้อมูลที่นำไปสร้างคำตอบได้แล้ว
-        
-        list_explicit_keywords = ['รายชื่อ', 'ทั้งหมด', 'ทุกคน', 'บุคลากรของ', 'อาจารย์ใน']
-        general_teacher_keywords = ['อาจารย์', 'บุคลากร'] # คำทั่วไปที่ใช้ถามถึงอาจารย์
-
-        # --- Sub-Stage A: ระบุคณะ/ภาควิชาเป้าหมาย (เฉพาะเจาะจง) ก่อนเสมอ ---
-        # ตัวอย่าง: "คณะวิทยาศาสตร์ประยุกต์" หรือ "คณะครุศาสตร์อุตสาหกรรม (ภาคคอมพิวเตอร์ศึกษา)"
-        target_specific_dept_name = None
-        for dept_name, dept_data in contact_info_db.items():
-            if any(k.lower() in user_message_lower for k in dept_data["keywords"]):
-                target_specific_dept_name = dept_name
+# 2. ตรวจสอบคำถามที่ต้องการข้อมูลการติดต่อ (ปรับปรุง Logic หลักตรงนี้)
+@intent_router.handler("contact")
+def handle_contact_intent(user_message, user_message_lower):
+    response_parts = []
+    found_actionable_info = False # Flag เพื่อบอกว่าเจอข้อมูลที่นำไปสร้างคำตอบได้แล้ว
+
+    list_explicit_keywords = ['รายชื่อ', 'ทั้งหมด', 'ทุกคน', 'บุคลากรของ', 'อาจารย์ใน']
+    general_teacher_keywords = ['อาจารย์', 'บุคลากร'] # คำทั่วไปที่ใช้ถามถึงอาจารย์
+
+    # --- Sub-Stage A: ระบุคณะ/ภาควิชาเป้าหมาย (เฉพาะเจาะจง) ก่อนเสมอ ---
+    # ตัวอย่าง: "คณะวิทยาศาสตร์ประยุกต์" หรือ "คณะครุศาสตร์อุตสาหกรรม (ภาคคอมพิวเตอร์ศึกษา)"
+    # ค้นหาคณะและชื่อบุคลากรทั้งหมดในข้อความด้วย automaton ที่ compile ไว้แล้ว (อ่านข้อความรอบเดียว)
+    dept_hits, person_hits = find_contact_mentions(user_message_lower)
+    target_specific_dept_name = dept_hits[0].dept_name if dept_hits else None
+
+    # --- Sub-Stage B: ตรวจสอบกรณี "คณะครุศาสตร์อุตสาหกรรม" แบบกว้างๆ (ต้องแนะนำภาควิชา) ---
+    # หากไม่พบภาควิชาที่เจาะจง และผู้ใช้ถามถึง "ครุศาสตร์" + "อาจารย์/บุคลากร" + "รายชื่อ/ทั้งหมด"
+    if not target_specific_dept_name and \
+       any(gk in user_message_lower for gk in ["ครุศาสตร์อุตสาหกรรม", "ครุศาสตร์"]) and \
+       any(lk in user_message_lower for lk in general_teacher_keywords + list_explicit_keywords):
+
+        response_parts.append("คณะครุศาสตร์อุตสาหกรรมมีหลายภาควิชาค่ะ")
+        response_parts.append("โปรดระบุภาควิชาที่ต้องการให้ชัดเจน เช่น:")
+
+        kru_sart_branches = []
+        for dept_key, dept_val in contact_info_db.items():
+            # ดึงชื่อภาควิชาของคณะครุศาสตร์อุตสาหกรรมทั้งหมด
+            if dept_key.startswith("คณะครุศาสตร์อุตสาหกรรม (") and "ภาค" in dept_key:
+                branch_part = dept_key.replace("คณะครุศาสตร์อุตสาหกรรม (", "").replace(")", "")
+                kru_sart_branches.append(branch_part)
+
+        if kru_sart_branches:
+            # ตัวอย่าง: - คอมพิวเตอร์ศึกษา, เครื่องกล, ไฟฟ้า, โยธา
+            response_parts.append("- " + ", ".join(kru_sart_branches))
+        else:
+            response_parts.append("- คอมพิวเตอร์ศึกษา, เครื่องกล, ไฟฟ้า, โยธา, เป็นต้น") # Fallback หากดึงสาขาไม่ได้
+        response_parts.append("เพื่อฉันจะได้ค้นหาข้อมูลให้คุณได้ถูกต้องค่ะ")
+        found_actionable_info = True # ถือว่าเจอข้อมูลที่ตอบได้แล้ว
+
+    # --- Sub-Stage C: หากไม่ใช่กรณีข้างต้น, ให้ค้นหาบุคลากรเฉพาะเจาะจงด้วยชื่อเต็ม/ชื่อที่ชัดเจน ---
+    # (จะทำงานก็ต่อเมื่อมี target_specific_dept_name และยังไม่พบ actionable info จาก Sub-Stage B)
+    specific_person_match = None
+    if not found_actionable_info and target_specific_dept_name:
+        dept_data = contact_info_db[target_specific_dept_name]
+        for hit in person_hits: # ตรวจสอบชื่อเต็ม (เรียงตามลำดับใน contact_info_db แล้ว)
+            if hit.dept_name == target_specific_dept_name:
+                specific_person_match = (hit.person_name, dept_data["บุคลากร"][hit.person_name], target_specific_dept_name)
                 break
 
-        # --- Sub-Stage B: ตรวจสอบกรณี "คณะครุศาสตร์อุตสาหกรรม" แบบกว้างๆ (ต้องแนะนำภาควิชา) ---
-        # หากไม่พบภาควิชาที่เจาะจง และผู้ใช้ถามถึง "ครุศาสตร์" + "อาจารย์/บุคลากร" + "รายชื่อ/ทั้งหมด"
-        if not target_specific_dept_name and \
-           any(gk in user_message_lower for gk in ["ครุศาสตร์อุตสาหกรรม", "ครุศาสตร์"]) and \
-           any(lk in user_message_lower for lk in general_teacher_keywords + list_explicit_keywords):
-            
-            response_parts.append("คณะครุศาสตร์อุตสาหกรรมมีหลายภาควิชาค่ะ")
-            response_parts.append("โปรดระบุภาควิชาที่ต้องการให้ชัดเจน เช่น:")
-            
-            kru_sart_branches = []
-            for dept_key, dept_val in contact_info_db.items():
-                # ดึงชื่อภาควิชาของคณะครุศาสตร์อุตสาหกรรมทั้งหมด
-                if dept_key.startswith("คณะครุศาสตร์อุตสาหกรรม (") and "ภาค" in dept_key:
-                    branch_part = dept_key.replace("คณะครุศาสตร์อุตสาหกรรม (", "").replace(")", "")
-                    kru_sart_branches.append(branch_part)
-            
-            if kru_sart_branches:
-                # ตัวอย่าง: - คอมพิวเตอร์ศึกษา, เครื่องกล, ไฟฟ้า, โยธา
-                response_parts.append("- " + ", ".join(kru_sart_branches))
-            else:
-                response_parts.append("- คอมพิวเตอร์ศึกษา, เครื่องกล, ไฟฟ้า, โยธา, เป็นต้น") # Fallback หากดึงสาขาไม่ได้
-            response_parts.append("เพื่อฉันจะได้ค้นหาข้อมูลให้คุณได้ถูกต้องค่ะ")
-            found_actionable_info = True # ถือว่าเจอข้อมูลที่ตอบได้แล้ว
-
-        # --- Sub-Stage C: หากไม่ใช่กรณีข้างต้น, ให้ค้นหาบุคลากรเฉพาะเจาะจงด้วยชื่อเต็ม/ชื่อที่ชัดเจน ---
-        # (จะทำงานก็ต่อเมื่อมี target_specific_dept_name และยังไม่พบ actionable info จาก Sub-Stage B)
-        specific_person_match = None
-        if not found_actionable_info and target_specific_dept_name:
-            dept_data = contact_info_db[target_specific_dept_name]
-            for person_name, person_data in dept_data.get("บุคลากร", {}).items():
-                if person_name.lower() in user_message_lower: # ตรวจสอบชื่อเต็ม
-                    specific_person_match = (person_name, person_data, target_specific_dept_name)
-                    break
-        
-        if specific_person_match:
-            person_name, person_data, dept_name = specific_person_match
-            response_parts.append(f"ข้อมูลติดต่อสำหรับ {person_data['ตำแหน่ง']} {person_name} (สังกัด{dept_name}):")
-            
-            contact_details_list = []
-            phone_info = person_data.get("เบอร์โทร")
-            email_info = person_data.get("อีเมล")
-            
-            if phone_info: contact_details_list.append(f"โทร: {phone_info}")
-            if email_info: contact_details_list.append(f"อีเมล: {email_info}")
-            
-            # ปรับการแสดงผล: ไม่ต้องมีวงเล็บรอบทั้งหมด
-            response_parts.append(", ".join(contact_details_list) if contact_details_list else "ไม่พบข้อมูลการติดต่อที่ระบุค่ะ")
-            found_actionable_info = True
+    if specific_person_match:
+        person_name, person_data, dept_name = specific_person_match
+        response_parts.append(f"ข้อมูลติดต่อสำหรับ {person_data['ตำแหน่ง']} {person_name} (สังกัด{dept_name}):")
 
-        # --- Sub-Stage D: หากไม่เจอคนเฉพาะเจาะจง (Sub-Stage C), แต่มีคณะที่เจาะจง และถามถึงอาจารย์/บุคลากรทั้งหมด ---
-        elif not found_actionable_info and target_specific_dept_name and \
-             any(lk in user_message_lower for lk in general_teacher_keywords + list_explicit_keywords):
-            
-            dept_data = contact_info_db[target_specific_dept_name]
-            response_parts.append(f"รายชื่อบุคลากรใน {target_specific_dept_name}:")
-            
-            if dept_data.get("บุคลากร"):
-                for person_name, person_data in dept_data["บุคลากร"].items():
-                    contact_details_list = []
-                    phone_info = person_data.get("เบอร์โทร")
-                    email_info = person_data.get("อีเมล")
-                    if phone_info: contact_details_list.append(f"โทร: {phone_info}")
-                    if email_info: contact_details_list.append(f"อีเมล: {email_info}")
-                    
-                    # ยังคงมีวงเล็บสำหรับแต่ละคนในลิสต์ เพื่อความเป็นระเบียบ
-                    details_str_for_list = ", ".join(contact_details_list) if contact_details_list else "ไม่ระบุ"
-                    response_parts.append(f"- {person_data['ตำแหน่ง']} {person_name} ({details_str_for_list})")
-                found_actionable_info = True
-            else:
-                response_parts.append("ไม่พบข้อมูลบุคลากรในคณะนี้ค่ะ")
-                found_actionable_info = True
-        
-        # --- Sub-Stage E: หากไม่เข้ากรณีใดๆ ข้างต้น แต่มีคณะที่เจาะจง ---
-        # ให้ข้อมูลติดต่อส่วนกลางของคณะ
-        elif not found_actionable_info and target_specific_dept_name:
-            dept_data = contact_info_db[target_specific_dept_name]
-            response_parts.append(f"ข้อมูลติดต่อสำหรับ {target_specific_dept_name}:")
-            if dept_data.get("เบอร์กลาง"):
-                response_parts.append(f"  เบอร์โทรศัพท์ส่วนกลาง: {dept_data['เบอร์กลาง']}")
-            else:
-                response_parts.append("  ไม่พบเบอร์โทรศัพท์ส่วนกลางที่ระบุค่ะ")
-            response_parts.append(f"หากต้องการข้อมูลของบุคลากรเฉพาะเจาะจง หรือรายชื่อทั้งหมด โปรดระบุให้ชัดเจนยิ่งขึ้นค่ะ หรือดูรายละเอียดเพิ่มเติมในเอกสาร '1.2 ข้อมูลการติดต่ออาจารย์และเจ้าหน้าที่คณะต่างๆ'")
+        contact_details_list = []
+        phone_info = person_data.get("เบอร์โทร")
+        email_info = person_data.get("อีเมล")
+
+        if phone_info: contact_details_list.append(f"โทร: {phone_info}")
+        if email_info: contact_details_list.append(f"อีเมล: {email_info}")
+
+        # ปรับการแสดงผล: ไม่ต้องมีวงเล็บรอบทั้งหมด
+        response_parts.append(", ".join(contact_details_list) if contact_details_list else "ไม่พบข้อมูลการติดต่อที่ระบุค่ะ")
+        found_actionable_info = True
+
+    # --- Sub-Stage D: หากไม่เจอคนเฉพาะเจาะจง (Sub-Stage C), แต่มีคณะที่เจาะจง และถามถึงอาจารย์/บุคลากรทั้งหมด ---
+    elif not found_actionable_info and target_specific_dept_name and \
+         any(lk in user_message_lower for lk in general_teacher_keywords + list_explicit_keywords):
+
+        dept_data = contact_info_db[target_specific_dept_name]
+        response_parts.append(f"รายชื่อบุคลากรใน {target_specific_dept_name}:")
+
+        if dept_data.get("บุคลากร"):
+            for person_name, person_data in dept_data["บุคลากร"].items():
+                contact_details_list = []
+                phone_info = person_data.get("เบอร์โทร")
+                email_info = person_data.get("อีเมล")
+                if phone_info: contact_details_list.append(f"โทร: {phone_info}")
+                if email_info: contact_details_list.append(f"อีเมล: {email_info}")
+
+                # ยังคงมีวงเล็บสำหรับแต่ละคนในลิสต์ เพื่อความเป็นระเบียบ
+                details_str_for_list = ", ".join(contact_details_list) if contact_details_list else "ไม่ระบุ"
+                response_parts.append(f"- {person_data['ตำแหน่ง']} {person_name} ({details_str_for_list})")
+            found_actionable_info = True
+        else:
+            response_parts.append("ไม่พบข้อมูลบุคลากรในคณะนี้ค่ะ")
             found_actionable_info = True
 
-        # --- สรุปคำตอบสุดท้ายสำหรับคำถามติดต่อจาก Rule-based ---
-        if found_actionable_info:
-            final_bot_text_response = "\n".join(response_parts)
+    # --- Sub-Stage E: หากไม่เข้ากรณีใดๆ ข้างต้น แต่มีคณะที่เจาะจง ---
+    # ให้ข้อมูลติดต่อส่วนกลางของคณะ
+    elif not found_actionable_info and target_specific_dept_name:
+        dept_data = contact_info_db[target_specific_dept_name]
+        response_parts.append(f"ข้อมูลติดต่อสำหรับ {target_specific_dept_name}:")
+        if dept_data.get("เบอร์กลาง"):
+            response_parts.append(f"  เบอร์โทรศัพท์ส่วนกลาง: {dept_data['เบอร์กลาง']}")
         else:
-            final_bot_text_response = (
-                "ขออภัยค่ะ ฉันไม่พบข้อมูลติดต่อสำหรับสิ่งที่คุณกำลังมองหา\n\n"
-                "คุณสามารถลองระบุชื่อบุคคล ตำแหน่ง หรือชื่อคณะ/ภาควิชาให้ชัดเจนยิ่งขึ้นได้ไหมคะ "
-                "เช่น 'เบอร์โทรอาจารย์ยุพาภรณ์', 'รายชื่ออาจารย์คณะวิทยาศาสตร์ประยุกต์' หรือ 'ติดต่อคณะศิลปศาสตร์ประยุกต์' "
-                "หรือดูในเอกสาร '1.2 ข้อมูลการติดต่ออาจารย์และเจ้าหน้าที่คณะต่างๆ' ค่ะ"
-            )
-    
+            response_parts.append("  ไม่พบเบอร์โทรศัพท์ส่วนกลางที่ระบุค่ะ")
+        response_parts.append(f"หากต้องการข้อมูลของบุคลากรเฉพาะเจาะจง หรือรายชื่อทั้งหมด โปรดระบุให้ชัดเจนยิ่งขึ้นค่ะ หรือดูรายละเอียดเพิ่มเติมในเอกสาร '1.2 ข้อมูลการติดต่ออาจารย์และเจ้าหน้าที่คณะต่างๆ'")
+        found_actionable_info = True
+
+    # --- สรุปคำตอบสุดท้ายสำหรับคำถามติดต่อจาก Rule-based ---
+    if found_actionable_info:
+        return "\n".join(response_parts), []
+    return (
+        "ขออภัยค่ะ ฉันไม่พบข้อมูลติดต่อสำหรับสิ่งที่คุณกำลังมองหา\n\n"
+        "คุณสามารถลองระบุชื่อบุคคล ตำแหน่ง หรือชื่อคณะ/ภาควิชาให้ชัดเจนยิ่งขึ้นได้ไหมคะ "
+        "เช่น 'เบอร์โทรอาจารย์ยุพาภรณ์', 'รายชื่ออาจารย์คณะวิทยาศาสตร์ประยุกต์' หรือ 'ติดต่อคณะศิลปศาสตร์ประยุกต์' "
+        "หรือดูในเอกสาร '1.2 ข้อมูลการติดต่ออาจารย์และเจ้าหน้าที่คณะต่างๆ' ค่ะ"
+    ), []
+
+# --- Intent ที่ตอบด้วย RAG แล้วแนบรูปภาพ: (ข้อความเมื่อ RAG ไม่มีคำตอบ, URL รูปภาพ) ---
+# แยกเป็นตารางเพื่อให้ทั้ง Flask (sync) และ asgi_app (async) ใช้ข้อมูลชุดเดียวกัน
+RAG_IMAGE_INTENTS = {
     # 3. หากเจอคีย์เวิร์ด "การแต่งกาย"
-    elif "การแต่งกาย" in user_message_lower:
-        ai_response_text = answer_question(user_message) 
-        
-        if ai_response_text and ai_response_text.strip() != "":
-            final_bot_text_response = ai_response_text
-        else:
-            final_bot_text_response = "ขออภัยค่ะ ฉันไม่พบข้อมูลการแต่งกายที่เฉพาะเจาะจง"
-        
-        messages_to_reply.append(TextMessage(text=final_bot_text_response))
-        
-        image_urls = [
+    "dress_code": (
+        "ขออภัยค่ะ ฉันไม่พบข้อมูลการแต่งกายที่เฉพาะเจาะจง",
+        [
             "https://i.postimg.cc/pL5wW60S/492254752-1212904400841195-3294721946119439077-n.jpg",
             # เพิ่ม URL รูปภาพการแต่งกายอื่นๆ ที่นี่
-        ]
-        for url in image_urls:
-            messages_to_reply.append(ImageMessage(original_content_url=url, preview_image_url=url))
-
+        ],
+    ),
     # 4. หากเจอคีย์เวิร์ด "แผนที่"
-    elif "แผนที่" in user_message_lower:
-        ai_response_text = answer_question(user_message)
-        
-        if ai_response_text and ai_response_text.strip() != "":
-            final_bot_text_response = ai_response_text
-        else:
-            final_bot_text_response = "นี่คือแผนที่มหาวิทยาลัยเทคโนโลยีพระจอมเกล้าพระนครเหนือค่ะ"
-        
-        messages_to_reply.append(TextMessage(text=final_bot_text_response))
-        
-        map_image_urls = [
-         "https://i.postimg.cc/mrjfJFX0/481452366-3893729620865001-8488278701718064335-n.jpg", # แผนที่หลักของ มจพ.
-        ]
-        for url in map_image_urls:
-            messages_to_reply.append(ImageMessage(original_content_url=url, preview_image_url=url))
-    
-    # 5. สำหรับคำถามอื่นๆ ที่เป็น Generic เช่น ขอบคุณ, จบการสนทนา
-    elif any(keyword in user_message_lower for keyword in ['ขอบคุณ', 'พอแล้ว', 'จบการสนทนา', 'บาย', 'ไปละ']):
-        final_bot_text_response = "ยินดีให้บริการค่ะ หากมีคำถามเพิ่มเติม สามารถสอบถามได้ตลอดนะคะ"
-
-    # --- Phase 2: RAG / Gemini Fallback if no rule-based response yet ---
-    if not final_bot_text_response:
-        app.logger.info(f"No rule-based response for '{user_message}', attempting RAG.")
-        ai_response_text = answer_question(user_message)
-        
-        if ai_response_text and ai_response_text.strip() != "":
-            final_bot_text_response = ai_response_text
-        else:
-            app.logger.info(f"RAG did not find an answer for '{user_message}', falling back to Gemini direct.")
-            try:
-                gemini_response = gemini_chat_session.send_message(user_message)
-                final_bot_text_response = gemini_response.text
-                responded_by_gemini_direct = True
-                app.logger.info(f"Gemini direct response for '{user_message}': {final_bot_text_response[:50]}...")
-            except Exception as e:
-                app.logger.error(f"Error getting direct Gemini response for user {user_id}: {e}")
-                final_bot_text_response = "ขออภัยค่ะ ฉันไม่เข้าใจคำถามของคุณ โปรดลองถามในรูปแบบอื่นนะคะ"
-    
+    "map": (
+        "นี่คือแผนที่มหาวิทยาลัยเทคโนโลยีพระจอมเกล้าพระนครเหนือค่ะ",
+        [
+            "https://i.postimg.cc/mrjfJFX0/481452366-3893729620865001-8488278701718064335-n.jpg", # แผนที่หลักของ มจพ.
+        ],
+    ),
+}
+
+def rag_intent_reply(intent, ai_response_text):
+    """สร้าง (ข้อความตอบ, messages) ของ intent ใน RAG_IMAGE_INTENTS จากคำตอบของ RAG"""
+    fallback_text, image_urls = RAG_IMAGE_INTENTS[intent]
+    if ai_response_text and ai_response_text.strip() != "":
+        final_bot_text_response = ai_response_text
+    else:
+        final_bot_text_response = fallback_text
+
+    messages_to_reply = [TextMessage(text=final_bot_text_response)]
+    for url in image_urls:
+        messages_to_reply.append(ImageMessage(original_content_url=url, preview_image_url=url))
+    return final_bot_text_response, messages_to_reply
+
+@intent_router.handler("dress_code")
+def handle_dress_code_intent(user_message, user_message_lower):
+    return rag_intent_reply("dress_code", answer_question(user_message))
+
+@intent_router.handler("map")
+def handle_map_intent(user_message, user_message_lower):
+    return rag_intent_reply("map", answer_question(user_message))
+
+# 5. สำหรับคำถามอื่นๆ ที่เป็น Generic เช่น ขอบคุณ, จบการสนทนา
+@intent_router.handler("farewell")
+def handle_farewell_intent(user_message, user_message_lower):
+    return "ยินดีให้บริการค่ะ หากมีคำถามเพิ่มเติม สามารถสอบถามได้ตลอดนะคะ", []
+
+intent_router.compile()
+
+
+def event_started_at(event):
+    # เวลาที่ LINE ส่ง event (ms) รวมเวลารอในคิวด้วย ถ้านาฬิกาเครื่องช้ากว่าให้ใช้เวลาปัจจุบัน
+    now = time.time()
+    return min(now, event.timestamp / 1000) if event.timestamp else now
+
+def push_target(source):
+    return getattr(source, "group_id", None) or getattr(source, "room_id", None) or source.user_id
+
+def reply_messages(reply_token, messages):
+    with span("line_reply"):
+        line_client.api().reply_message_with_http_info(
+            ReplyMessageRequest(reply_token=reply_token, messages=messages)
+        )
+
+def push_messages(to, messages):
+    with span("line_push"):
+        line_client.api().push_message_with_http_info(PushMessageRequest(to=to, messages=messages))
+    reply_deadline.record_push(len(messages))
+
+def send_reply_placeholder(event):
+    if USE_LOADING_ANIMATION and getattr(event.source, "type", None) == "user":
+        with span("line_loading_animation"):
+            line_client.api().show_loading_animation(
+                ShowLoadingAnimationRequest(chat_id=event.source.user_id, loading_seconds=20)
+            )
+        return
+    # กลุ่ม/ห้องแสดง loading animation ไม่ได้: ใช้ข้อความรอแทน (reply ของคำตอบจริงจะล้มแล้วไปใช้ push)
+    reply_messages(event.reply_token, [TextMessage(text=REPLY_PLACEHOLDER_TEXT)])
+
+
+def finish_turn(user_id, gemini_chat_session, user_message, final_bot_text_response, messages_to_reply,
+                responded_by_gemini_direct):
+    """Phase 3-4 ของ handle_message (ใช้ร่วมกับ asgi_app): เติมข้อความตอบ บันทึกประวัติ แล้วคืน messages ที่จะส่ง"""
     # --- Phase 3: Ensure a text message is always added to messages_to_reply ---
     if not messages_to_reply and final_bot_text_response:
         messages_to_reply.append(TextMessage(text=final_bot_text_response))
@@ -256,29 +459,117 @@ def handle_message(event):
         final_bot_text_response = "ขออภัยค่ะ ฉันไม่เข้าใจคำถามของคุณ โปรดลองถามในรูปแบบอื่นนะคะ"
         messages_to_reply.append(TextMessage(text=final_bot_text_response))
 
-
     # --- Phase 4: Manually add history to Gemini if not handled by send_message ---
     if not responded_by_gemini_direct:
         if user_message and final_bot_text_response:
             try:
                 gemini_chat_session.history.append(genai.types.Content(parts=[genai.types.TextPart(user_message)], role="user"))
                 gemini_chat_session.history.append(genai.types.Content(parts=[genai.types.TextPart(final_bot_text_response)], role="model"))
-                app.logger.info(f"Manually added user and bot response to Gemini history for user {user_id}.")
+                app.logger.info("Manually added user and bot response to Gemini history for user %s.", user_id,
+                                extra={"category": "message"})
             except Exception as e:
                 app.logger.error(f"Failed to manually add history for user {user_id}: {e}")
     else:
-        app.logger.info(f"Gemini direct response handled history for user {user_id}.")
+        app.logger.info("Gemini direct response handled history for user %s.", user_id, extra={"category": "message"})
+    user_gemini_sessions.trim(gemini_chat_session)
+    if user_message and final_bot_text_response:
+        session_backend.append_turn(user_id, user_message, final_bot_text_response)
+    return messages_to_reply
 
 
-    # ส่งข้อความและ/หรือรูปภาพตอบกลับไปยัง LINE
-    with ApiClient(configuration) as api_client:
-        line_bot_api = MessagingApi(api_client)
-        line_bot_api.reply_message_with_http_info(
-            ReplyMessageRequest(
-                reply_token=event.reply_token,
-                messages=messages_to_reply
-            )
-        )
+@handler.add(MessageEvent, message=TextMessageContent)
+def handle_message(event):
+    # เวลารวมทั้ง event (ไม่นับเวลารอในคิว) แยกย่อยเป็น stage ต่างๆ ด้านล่าง ดูได้ที่ /metrics
+    with span("handle_message"):
+        _handle_message(event)
+
+def _handle_message(event):
+    ticket = reply_deadline.start(event_started_at(event), lambda: send_reply_placeholder(event))
+    user_id = event.source.user_id
+    try:
+        messages_to_reply = compose_reply(user_id, event.message.text)
+    except Exception:
+        # ticket ต้องจบเสมอ: ไม่เช่นนั้น timer จะส่ง placeholder (ใช้ reply token ไปแล้ว) โดยไม่มีคำตอบตามมา
+        messages_to_reply = [TextMessage(text=RAG_ERROR_MESSAGE)]
+        try:
+            deliver_reply(event, ticket, messages_to_reply)
+        except Exception as e:
+            app.logger.error(f"Failed to send the error reply for user {user_id}: {e}")
+        raise
+    deliver_reply(event, ticket, messages_to_reply)
+
+def compose_reply(user_id, user_message):
+    """Phase 1-4: เลือกคำตอบ บันทึกประวัติ แล้วคืน messages ที่จะส่ง (asgi_app มี compose_reply_async คู่กัน)"""
+    user_message_lower = user_message.lower()
+
+    messages_to_reply = []
+    final_bot_text_response = ""
+
+    with span("session"):
+        gemini_chat_session = get_or_create_chat_session(user_id)
+    responded_by_gemini_direct = False
+
+    # --- Phase 1: Rule-based Responses (เลือก intent จากตารางใน intent_router) ---
+    with span("route"):
+        route = intent_router.route(user_message_lower)
+    count(ROUTES, route.intent or "fallback")
+    app.logger.info("Intent '%s' routed in %.3f ms", route.intent or "fallback", route.elapsed_ms, extra={"category": "message"})
+    # ข้อความที่ต้องเรียก RAG/Gemini ต้องผ่าน rate limit และโควตา token รายวันของผู้ใช้ก่อน
+    # (intent อื่น และคำถามที่ตอบได้จาก FAQ store / cache แบบตรงตัวโดยไม่เรียก LLM ตอบได้เสมอ)
+    limited = None
+    if (route.handler is None or route.intent in RAG_IMAGE_INTENTS) and not has_free_answer(user_message):
+        limited = user_limiter.check(user_id)
+    if limited:
+        count(USER_LIMITED, limited)
+        app.logger.info("User %s is over the %s limit, sent the canned reply.", user_id, limited,
+                        extra={"category": "message"})
+        messages_to_reply = [TextMessage(text=USER_LIMIT_MESSAGES[limited])]
+    else:
+        with user_limiter.metered(user_id):
+            if route.handler:
+                with span(f"intent_{route.intent}"):
+                    final_bot_text_response, messages_to_reply = route.handler(user_message, user_message_lower)
+
+            # --- Phase 2: RAG / Gemini Fallback if no rule-based response yet ---
+            if not final_bot_text_response:
+                app.logger.info("No rule-based response for '%s', attempting RAG.", user_message, extra={"category": "message"})
+                with span("rag_answer"):
+                    ai_response_text = answer_question(user_message)
+        
+                if ai_response_text and ai_response_text.strip() != "":
+                    final_bot_text_response = ai_response_text
+                else:
+                    app.logger.info("RAG did not find an answer for '%s', falling back to Gemini direct.", user_message,
+                                    extra={"category": "message"})
+                    try:
+                        with span("gemini_direct"):
+                            gemini_response = LLM_BREAKER.call(gemini_chat_session.send_message, user_message)
+                        final_bot_text_response = gemini_response.text
+                        responded_by_gemini_direct = True
+                        record_llm_usage(*gemini_usage(gemini_response, user_message, final_bot_text_response))
+                        app.logger.info("Gemini direct response for '%s': %s...", user_message, final_bot_text_response[:50],
+                                        extra={"category": "message"})
+                    except CircuitOpenError:
+                        final_bot_text_response = LLM_UNAVAILABLE_MESSAGE
+                    except Exception as e:
+                        app.logger.error(f"Error getting direct Gemini response for user {user_id}: {e}")
+                        final_bot_text_response = "ขออภัยค่ะ ฉันไม่เข้าใจคำถามของคุณ โปรดลองถามในรูปแบบอื่นนะคะ"
+
+        with span("finish_turn"):
+            messages_to_reply = finish_turn(user_id, gemini_chat_session, user_message, final_bot_text_response,
+                                            messages_to_reply, responded_by_gemini_direct)
+    return messages_to_reply
+
+def deliver_reply(event, ticket, messages_to_reply):
+    # ส่งข้อความและ/หรือรูปภาพตอบกลับไปยัง LINE (reply หรือ push ถ้าส่ง placeholder ไปแล้ว)
+    path = reply_deadline.finish(
+        ticket,
+        lambda: reply_messages(event.reply_token, messages_to_reply),
+        lambda: push_messages(push_target(event.source), messages_to_reply),
+    )
+    count(REPLY_PATHS, path)
+    if path != "reply":
+        app.logger.info(f"Answer for user {event.source.user_id} missed the reply deadline, delivered via {path}.")
 
 if __name__ == "__main__":
     port = int(os.environ.get('PORT', 5000))
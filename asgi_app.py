@@ -0,0 +1,296 @@
+"""ASGI entry point: รับ webhook และตอบข้อความแบบ asyncio ทั้งเส้นทาง
+
+รัน: uvicorn asgi_app:app --host 0.0.0.0 --port $PORT
+ใช้ intent router, contact data, session store และ RAG ชุดเดียวกับ app.py (Flask)
+แต่ระหว่างรอ Gemini/LINE API จะไม่ยึด thread ไว้ จึงรับบทสนทนาพร้อมกันได้หลายร้อยรายการใน process เดียว
+"""
+import asyncio
+import copy
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Request, Response
+from linebot.v3.exceptions import InvalidSignatureError
+from linebot.v3.messaging import (
+    AsyncApiClient,
+    AsyncMessagingApi,
+    PushMessageRequest,
+    ReplyMessageRequest,
+    TextMessage,
+)
+from linebot.v3.webhooks import MessageEvent, TextMessageContent
+
+import app as flask_app
+from app import (
+    RAG_IMAGE_INTENTS,
+    REPLY_PLACEHOLDER_TEXT,
+    USE_LOADING_ANIMATION,
+    USER_LIMIT_MESSAGES,
+    ShowLoadingAnimationRequest,
+    event_order_key,
+    event_started_at,
+    finish_turn,
+    get_or_create_chat_session,
+    group_events_by_user,
+    handler,
+    intent_router,
+    push_target,
+    rag_intent_reply,
+    reply_deadline,
+    user_limiter,
+)
+from metrics import REGISTRY, REPLY_PATHS, ROUTES, USER_LIMITED, count, span
+from circuit_breaker import CircuitOpenError
+from rag_handler import (
+    LLM_BREAKER,
+    LLM_UNAVAILABLE_MESSAGE,
+    RAG_ERROR_MESSAGE,
+    answer_question_async,
+    has_free_answer,
+    rag_status,
+)
+from user_limits import gemini_usage, record_llm_usage
+
+logger = logging.getLogger(__name__)
+
+# จำนวน event ที่ประมวลผลพร้อมกันได้สูงสุด และจำนวน connection ไปยัง api.line.me
+ASGI_MAX_CONCURRENT_EVENTS = int(os.getenv('ASGI_MAX_CONCURRENT_EVENTS', '500'))
+ASGI_LINE_POOL_MAXSIZE = int(os.getenv('ASGI_LINE_POOL_MAXSIZE', '32'))
+
+_line_api = None
+_line_api_client = None
+_event_slots = None
+_pending_tasks = set()
+# task ล่าสุดของผู้ใช้แต่ละคน: batch ถัดไปของผู้ใช้คนเดียวกัน (แม้มาคนละ delivery) รอ task นี้จบก่อนเริ่ม
+_user_tails = {}
+
+
+@asynccontextmanager
+async def lifespan(_app):
+    # aiohttp session ต้องสร้างภายใน event loop ของ server (หนึ่งตัวต่อ worker)
+    global _line_api, _line_api_client, _event_slots
+    configuration = copy.deepcopy(flask_app.configuration)
+    configuration.connection_pool_maxsize = ASGI_LINE_POOL_MAXSIZE
+    _line_api_client = AsyncApiClient(configuration)
+    _line_api = AsyncMessagingApi(_line_api_client)
+    _event_slots = asyncio.Semaphore(ASGI_MAX_CONCURRENT_EVENTS)
+    try:
+        yield
+    finally:
+        if _pending_tasks:
+            await asyncio.wait(_pending_tasks, timeout=10)
+        await _line_api_client.close()
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+@app.get('/hello')
+async def hello_world():
+    return {"hello": "world"}
+
+
+@app.get('/ready')
+async def ready(response: Response):
+    status = rag_status()
+    response.status_code = 200 if status["ready"] else 503
+    return status
+
+
+@app.get('/stats')
+async def stats():
+    result = flask_app.stats()
+    result["asgi"] = {
+        "events_in_flight": len(_pending_tasks),
+        "users_in_flight": len(_user_tails),
+        "max_concurrent_events": ASGI_MAX_CONCURRENT_EVENTS,
+    }
+    return result
+
+
+@app.get('/metrics')
+async def metrics():
+    if not REGISTRY.enabled:
+        return Response("Not Found", status_code=404)
+    return Response(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.post('/callback')
+async def callback(request: Request):
+    signature = request.headers.get('X-Line-Signature', '')
+    body = (await request.body()).decode('utf-8')
+    try:
+        events = handler.parser.parse(body, signature)
+    except InvalidSignatureError:
+        logger.info("Invalid signature.")
+        return Response("Invalid signature", status_code=400)
+
+    # ตอบ 200 ให้ LINE ทันที แล้วประมวลผลเป็น task ใน event loop หนึ่ง task ต่อผู้ใช้
+    # ผู้ใช้ต่างคนกันทำพร้อมกัน ส่วนข้อความของผู้ใช้คนเดียวกันทำตามลำดับภายใน task เดียว
+    # และต่อท้าย task ของ delivery ก่อนหน้าของผู้ใช้คนนั้น
+    for batch in group_events_by_user(events):
+        key = event_order_key(batch[0])
+        task = asyncio.create_task(handle_events_async(batch, after=_user_tails.get(key)))
+        _user_tails[key] = task
+        _pending_tasks.add(task)
+        task.add_done_callback(_pending_tasks.discard)
+        task.add_done_callback(lambda t, key=key: _user_tails.pop(key) if _user_tails.get(key) is t else None)
+    return Response('OK')
+
+
+async def handle_events_async(events, after=None):
+    if after is not None:
+        # รอแค่ให้จบ ผลหรือ exception ของ task ก่อนหน้าถูกจัดการในตัวมันเองแล้ว
+        await asyncio.wait({after})
+    for event in events:
+        if isinstance(event, MessageEvent) and isinstance(event.message, TextMessageContent):
+            try:
+                await handle_message_async(event)
+            except Exception as e:
+                # ข้อความถัดไปของผู้ใช้คนเดียวกันยังต้องได้คำตอบ
+                logger.error(f"Handling event failed: {e}", exc_info=True)
+        else:
+            logger.info(f"No handler for event type {type(event).__name__}, ignored.")
+
+
+async def compose_reply_async(user_id, user_message):
+    """Phase 1-4 ของ handle_message ใน app.py โดยรอ RAG/Gemini แบบ async"""
+    user_message_lower = user_message.lower()
+    messages_to_reply = []
+    final_bot_text_response = ""
+
+    # session ใช้ SQLite (head/load) แบบ synchronous: ทำใน thread ไม่ให้บล็อก event loop ของทุกบทสนทนา
+    with span("session"):
+        gemini_chat_session = await asyncio.to_thread(get_or_create_chat_session, user_id)
+    responded_by_gemini_direct = False
+
+    # --- Phase 1: Rule-based Responses ---
+    with span("route"):
+        route = intent_router.route(user_message_lower)
+    count(ROUTES, route.intent or "fallback")
+    logger.info("Intent '%s' routed in %.3f ms", route.intent or "fallback", route.elapsed_ms, extra={"category": "message"})
+    # rate limit และโควตา token รายวันเหมือน handle_message ใน app.py (คำตอบจาก FAQ store / cache ไม่นับ)
+    if (route.handler is None or route.intent in RAG_IMAGE_INTENTS) and not has_free_answer(user_message):
+        limited = user_limiter.check(user_id)
+        if limited:
+            count(USER_LIMITED, limited)
+            return [TextMessage(text=USER_LIMIT_MESSAGES[limited])]
+
+    with user_limiter.metered(user_id):
+        if route.intent in RAG_IMAGE_INTENTS:
+            with span(f"intent_{route.intent}"):
+                final_bot_text_response, messages_to_reply = rag_intent_reply(
+                    route.intent, await answer_question_async(user_message)
+                )
+        elif route.handler:
+            # handler อื่นเป็นงาน CPU สั้นๆ (ไม่มี I/O) เรียกใน event loop ได้เลย
+            with span(f"intent_{route.intent}"):
+                final_bot_text_response, messages_to_reply = route.handler(user_message, user_message_lower)
+
+        # --- Phase 2: RAG / Gemini Fallback ---
+        if not final_bot_text_response:
+            with span("rag_answer"):
+                ai_response_text = await answer_question_async(user_message)
+            if ai_response_text and ai_response_text.strip() != "":
+                final_bot_text_response = ai_response_text
+            else:
+                logger.info("RAG did not find an answer for '%s', falling back to Gemini direct.", user_message,
+                            extra={"category": "message"})
+                try:
+                    with span("gemini_direct"):
+                        gemini_response = await LLM_BREAKER.call_async(gemini_chat_session.send_message_async, user_message)
+                    final_bot_text_response = gemini_response.text
+                    responded_by_gemini_direct = True
+                    record_llm_usage(*gemini_usage(gemini_response, user_message, final_bot_text_response))
+                except CircuitOpenError:
+                    final_bot_text_response = LLM_UNAVAILABLE_MESSAGE
+                except Exception as e:
+                    logger.error(f"Error getting direct Gemini response for user {user_id}: {e}")
+                    final_bot_text_response = "ขออภัยค่ะ ฉันไม่เข้าใจคำถามของคุณ โปรดลองถามในรูปแบบอื่นนะคะ"
+
+    # --- Phase 3-4: ใช้โค้ดเดียวกับ Flask (append_turn ของ SQLite จึงทำใน thread เช่นกัน) ---
+    with span("finish_turn"):
+        return await asyncio.to_thread(finish_turn, user_id, gemini_chat_session, user_message,
+                                       final_bot_text_response, messages_to_reply, responded_by_gemini_direct)
+
+
+async def send_reply_placeholder_async(event):
+    """placeholder แบบเดียวกับ send_reply_placeholder ใน app.py (REPLY_PLACEHOLDER=text|loading)"""
+    if USE_LOADING_ANIMATION and getattr(event.source, "type", None) == "user":
+        with span("line_loading_animation"):
+            await _line_api.show_loading_animation(
+                ShowLoadingAnimationRequest(chat_id=event.source.user_id, loading_seconds=20)
+            )
+        return
+    with span("line_reply"):
+        await _line_api.reply_message_with_http_info(ReplyMessageRequest(
+            reply_token=event.reply_token, messages=[TextMessage(text=REPLY_PLACEHOLDER_TEXT)]
+        ))
+
+
+async def deliver_reply_async(event, messages, placeholder, placeholder_ok):
+    """ส่งคำตอบจริงโดยเลือกเส้นทางแบบเดียวกับ ReplyDeadline.finish คืนชื่อเส้นทางที่ใช้"""
+    async def reply():
+        with span("line_reply"):
+            await _line_api.reply_message_with_http_info(
+                ReplyMessageRequest(reply_token=event.reply_token, messages=messages)
+            )
+
+    async def push():
+        with span("line_push"):
+            await _line_api.push_message_with_http_info(
+                PushMessageRequest(to=push_target(event.source), messages=messages)
+            )
+        reply_deadline.record_push(len(messages))
+
+    if not placeholder:
+        await reply()
+        return "reply"
+    if placeholder_ok and reply_deadline.placeholder_uses_reply_token:
+        await push()
+        return "placeholder_push"
+    # placeholder ไม่ได้ใช้ reply token (loading animation หรือส่งไม่สำเร็จ): ลอง reply ก่อน ถ้าไม่ได้ค่อย push
+    try:
+        await reply()
+        return "placeholder_reply"
+    except Exception as e:
+        logger.warning(f"Reply after placeholder failed ({e}), pushing the answer instead.")
+        await push()
+        return "placeholder_push"
+
+
+async def handle_message_async(event):
+    async with _event_slots:
+        started_at = event_started_at(event)
+        user_id = event.source.user_id
+        compose = asyncio.ensure_future(compose_reply_async(user_id, event.message.text))
+        with span("handle_message"):
+            try:
+                # deadline ของ reply token: เหมือน ReplyDeadline ใน app.py แต่รอด้วย asyncio แทน timer thread
+                timeout = None
+                if reply_deadline.enabled:
+                    timeout = max(0.0, started_at + reply_deadline.deadline_seconds - time.time())
+                done, _ = await asyncio.wait({compose}, timeout=timeout)
+
+                placeholder = compose not in done
+                placeholder_ok = False
+                if placeholder:
+                    try:
+                        await send_reply_placeholder_async(event)
+                        placeholder_ok = True
+                    except Exception as e:
+                        reply_deadline.record_placeholder_failure()
+                        logger.error(f"Failed to send reply placeholder: {e}")
+                try:
+                    messages_to_reply = await compose
+                except Exception as e:
+                    # ยังต้องตอบอะไรสักอย่าง โดยเฉพาะเมื่อส่ง placeholder ไปแล้ว ไม่ให้ผู้ใช้ค้างอยู่ที่ข้อความรอ
+                    logger.error(f"Error composing reply for user {user_id}: {e}", exc_info=True)
+                    messages_to_reply = [TextMessage(text=RAG_ERROR_MESSAGE)]
+                path = await deliver_reply_async(event, messages_to_reply, placeholder, placeholder_ok)
+                reply_deadline.record(path, time.time() - started_at)
+                count(REPLY_PATHS, path)
+            except Exception as e:
+                logger.error(f"Error handling message for user {user_id}: {e}", exc_info=True)
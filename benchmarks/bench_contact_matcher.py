@@ -0,0 +1,78 @@
+"""Benchmark: ค้นหาคณะ/บุคลากรในข้อความด้วย linear scan แบบเดิม เทียบกับ automaton ใน contact_data
+
+รัน: python benchmarks/bench_contact_matcher.py
+ขยาย directory ด้วยบุคลากรสมมติจนถึงหลายพันคน เวลาต่อข้อความของ automaton ควรคงที่
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from contact_data import contact_info_db, build_contact_matcher, find_contact_mentions  # noqa: E402
+
+THAI_CHARS = "กขคงจฉชซญดตถทธนบปผพฟภมยรลวศษสหอฮะาิีึืุูเแโใไ่้๊๋"
+MESSAGES = [
+    "ขอเบอร์โทรอาจารย์ยุพาภรณ์ คณะวิทยาศาสตร์ประยุกต์",
+    "รายชื่ออาจารย์ภาคคอมพิวเตอร์ศึกษาทั้งหมด",
+    "ติดต่อคณะวิศวกรรมศาสตร์ยังไง",
+    "อีเมล ศ.ดร. ณชล ไชยรัตนะ",
+    "เบอร์โทรศัพท์ครุศาสตร์เครื่องกล",
+    "อาจารย์ที่ปรึกษาคือใคร",
+]
+
+
+def synthetic_db(extra_staff: int, seed: int = 0):
+    rng = random.Random(seed)
+    db = {name: {"keywords": list(d["keywords"]), "เบอร์กลาง": d.get("เบอร์กลาง"), "บุคลากร": dict(d.get("บุคลากร", {}))}
+          for name, d in contact_info_db.items()}
+    dept_names = list(db)
+    for i in range(extra_staff):
+        dept = db[dept_names[i % len(dept_names)]]
+        name = "อาจารย์ ดร." + "".join(rng.choice(THAI_CHARS) for _ in range(8)) + f" {i}"
+        dept["บุคลากร"][name] = {"ตำแหน่ง": "อาจารย์", "เบอร์โทร": None, "อีเมล": None}
+    return db
+
+
+def linear_scan(db, message_lower):
+    """ตรรกะเดิมใน handle_message: วนทุกคณะ ทุก keyword แล้ววนทุกชื่อในคณะนั้น"""
+    target = None
+    for dept_name, dept_data in db.items():
+        if any(k.lower() in message_lower for k in dept_data["keywords"]):
+            target = dept_name
+            break
+    person = None
+    if target:
+        for person_name in db[target].get("บุคลากร", {}):
+            if person_name.lower() in message_lower:
+                person = person_name
+                break
+    return target, person
+
+
+def time_per_message(func, rounds: int) -> float:
+    messages = [m.lower() for m in MESSAGES]
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for m in messages:
+            func(m)
+    return (time.perf_counter() - start) / (rounds * len(messages)) * 1e6
+
+
+def main():
+    print(f"{'staff':>8} {'linear µs/msg':>15} {'automaton µs/msg':>18} {'build ms':>10}")
+    for extra in (0, 500, 2000, 5000, 10000):
+        db = synthetic_db(extra)
+        staff = sum(len(d["บุคลากร"]) for d in db.values())
+        t0 = time.perf_counter()
+        matcher = build_contact_matcher(db)
+        build_ms = (time.perf_counter() - t0) * 1000
+        rounds = 200 if extra <= 2000 else 40
+        linear = time_per_message(lambda m: linear_scan(db, m), rounds)
+        automaton = time_per_message(lambda m: find_contact_mentions(m, matcher), rounds)
+        print(f"{staff:>8} {linear:>15.1f} {automaton:>18.1f} {build_ms:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
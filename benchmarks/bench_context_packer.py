@@ -0,0 +1,69 @@
+"""Benchmark: จำนวน token ของ context ก่อน/หลัง ContextPacker และคำตอบที่ยังอยู่ใน context
+
+รัน: python benchmarks/bench_context_packer.py
+สร้าง index ผ่าน rag_handler.setup_rag_chain (local embeddings, stub LLM, offline) แล้วใช้ retriever และ
+CONTEXT_PACKER ตัวเดียวกับที่แอปใช้จริง คำถามชุดเดียวกับ bench_retrieval_hybrid
+merged = จำนวน chunk ที่ถูกรวมกับ chunk ข้างเคียง (ถ้าเป็น 0 แปลว่า packer ไม่รู้ลำดับ chunk ของเอกสาร)
+"""
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault("RAG_EMBEDDINGS_PROVIDER", "local")
+os.environ.setdefault("RAG_LLM_PROVIDER", "stub")
+os.environ.setdefault("RAG_RETRIEVER", "hybrid")
+os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+os.environ.setdefault("CHROMA_PERSIST_DIRECTORY", tempfile.mkdtemp(prefix="bench_context_packer_"))
+
+import logging  # noqa: E402
+
+logging.disable(logging.WARNING)
+
+import rag_handler  # noqa: E402
+from bench_retrieval_hybrid import QUERIES  # noqa: E402
+from context_packer import estimate_tokens  # noqa: E402
+
+
+def evaluate(name, retrieve, packer):
+    raw_tokens, packed_tokens, pack_ms = [], [], []
+    raw_hits = packed_hits = 0
+    merged_before = packer.stats()["chunks_merged"]
+    for question, expected in QUERIES:
+        docs = retrieve(question)
+        start = time.perf_counter()
+        packed = packer.pack(docs)
+        pack_ms.append((time.perf_counter() - start) * 1000)
+        raw_tokens.append(sum(estimate_tokens(d.page_content) for d in docs))
+        packed_tokens.append(sum(estimate_tokens(d.page_content) for d in packed))
+        raw_hits += any(expected.lower() in d.page_content.lower() for d in docs)
+        packed_hits += any(expected.lower() in d.page_content.lower() for d in packed)
+    saved = 1 - sum(packed_tokens) / sum(raw_tokens)
+    print(f"{name:<24} {statistics.mean(raw_tokens):>8.0f} {statistics.mean(packed_tokens):>8.0f} {saved:>7.1%} "
+          f"{raw_hits / len(QUERIES):>8.1%} {packed_hits / len(QUERIES):>8.1%} {statistics.median(pack_ms):>8.3f} "
+          f"{packer.stats()['chunks_merged'] - merged_before:>7}")
+
+
+def main():
+    if rag_handler.RAG_CONTEXT_TOKEN_BUDGET <= 0:
+        raise SystemExit("RAG_CONTEXT_TOKEN_BUDGET must be > 0 for the packer to be part of the chain")
+    rag_handler.setup_rag_chain(os.path.join(ROOT, "kmutnbBuddy.md"))
+    # retrieval = hybrid retriever | CONTEXT_PACKER.pack ตามที่ setup_rag_chain ประกอบไว้
+    hybrid = rag_handler.RAG_RETRIEVAL.first
+    vectorstore = hybrid.vectorstore
+    packer = rag_handler.CONTEXT_PACKER
+    print(f"{'retriever / budget':<24} {'raw tok':>8} {'packed':>8} {'saved':>7} "
+          f"{'hit raw':>8} {'hit pack':>8} {'pack ms':>8} {'merged':>7}")
+    for budget in (100000, 2000, 1200):
+        packer.token_budget = budget
+        label = "no budget" if budget >= 100000 else str(budget)
+        evaluate(f"vector k=16 / {label}", lambda q: vectorstore.similarity_search(q, k=16), packer)
+        evaluate(f"hybrid k={hybrid.k} / {label}", hybrid.get_relevant_documents, packer)
+
+
+if __name__ == "__main__":
+    main()
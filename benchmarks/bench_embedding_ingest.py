@@ -0,0 +1,171 @@
+"""Benchmark: embedding ingestion กับ fake embedding server ในเครื่อง
+
+รัน: python benchmarks/bench_embedding_ingest.py
+server จำลอง latency ต่อ request และ rate limit (ตอบ 429 เมื่อเกินโควตาต่อวินาที)
+แสดง chunks/sec ของแต่ละ batch size / จำนวน worker และการ resume หลัง build ถูกขัดจังหวะ
+"""
+import hashlib
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from embedding_ingest import ingest_documents  # noqa: E402
+from incremental_index import assign_chunk_ids, sync_vectorstore  # noqa: E402
+
+DIM = 64
+
+
+class FakeEmbeddingServer:
+    """HTTP server ที่คืน vector แบบ deterministic พร้อม latency และ rate limit ที่ตั้งค่าได้"""
+
+    def __init__(self, latency: float = 0.05, per_text_latency: float = 0.001, requests_per_sec: float = 0,
+                 fail_after: int = 0):
+        self.latency = latency
+        self.per_text_latency = per_text_latency
+        self.requests_per_sec = requests_per_sec
+        self.fail_after = fail_after
+        self.requests = 0
+        self.rejected = 0
+        self._window = []
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                status = server._admit()
+                if status != 200:
+                    self.send_response(status)
+                    self.end_headers()
+                    return
+                texts = body["texts"]
+                time.sleep(server.latency + server.per_text_latency * len(texts))
+                vectors = [[b / 255 for b in hashlib.sha256(t.encode()).digest()] * (DIM // 32) for t in texts]
+                payload = json.dumps({"vectors": vectors}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}/embed"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def _admit(self) -> int:
+        with self._lock:
+            self.requests += 1
+            if self.fail_after and self.requests > self.fail_after:
+                return 503
+            if self.requests_per_sec:
+                now = time.monotonic()
+                self._window = [t for t in self._window if now - t < 1.0]
+                if len(self._window) >= self.requests_per_sec:
+                    self.rejected += 1
+                    return 429
+                self._window.append(now)
+            return 200
+
+    def close(self):
+        self.httpd.shutdown()
+
+
+class HTTPEmbeddings:
+    def __init__(self, url):
+        self.url = url
+
+    def embed_documents(self, texts):
+        req = urllib.request.Request(self.url, data=json.dumps({"texts": texts}).encode(),
+                                     headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(req, timeout=30) as resp:
+            return json.loads(resp.read())["vectors"]
+
+
+class FakeCollection:
+    def __init__(self):
+        self.rows = {}
+
+    def upsert(self, ids, embeddings, metadatas, documents):
+        for i, e in zip(ids, embeddings):
+            self.rows[i] = e
+
+
+class FakeVectorStore:
+    def __init__(self, embeddings):
+        self.embeddings = embeddings
+        self._collection = FakeCollection()
+
+    def get(self, include=None):
+        return {"ids": list(self._collection.rows)}
+
+    def delete(self, ids):
+        for i in ids:
+            self._collection.rows.pop(i, None)
+
+
+class Doc:
+    def __init__(self, text, header):
+        self.page_content = text
+        self.metadata = {"Header 1": header}
+
+
+def make_docs(n):
+    return assign_chunk_ids([Doc(f"เนื้อหาทดสอบลำดับที่ {i} " * 20, f"บทที่ {i // 50}") for i in range(n)])
+
+
+def run(server, docs, batch_size, workers, max_retries=6, base_delay=0.05):
+    store = FakeVectorStore(HTTPEmbeddings(server.url))
+    ids = [d.metadata["chunk_id"] for d in docs]
+    return store, ingest_documents(store, docs, ids, batch_size=batch_size, workers=workers,
+                                   max_retries=max_retries, base_delay=base_delay, max_delay=1.0)
+
+
+def main(n_chunks: int = 480):
+    logging.basicConfig(level=logging.ERROR)
+    logging.getLogger("embedding_ingest").setLevel(logging.CRITICAL)
+    logging.getLogger("incremental_index").setLevel(logging.CRITICAL)
+    docs = make_docs(n_chunks)
+    print(f"chunks={n_chunks}")
+    print(f"{'scenario':<34} {'batch':>6} {'workers':>8} {'chunks/s':>10} {'retries':>8} {'429s':>6}")
+    for batch_size, workers, rps in ((1, 1, 0), (32, 1, 0), (32, 4, 0), (32, 8, 0), (32, 8, 10)):
+        server = FakeEmbeddingServer(requests_per_sec=rps)
+        _, stats = run(server, docs, batch_size, workers)
+        name = f"rate limit {rps} req/s" if rps else "no rate limit"
+        print(f"{name:<34} {batch_size:>6} {workers:>8} {stats['chunks_per_sec']:>10.1f} "
+              f"{stats['retries']:>8} {server.rejected:>6}")
+        server.close()
+
+    # --- build ถูกขัดจังหวะ (server ล่มหลัง 5 request) แล้ว resume ด้วย sync_vectorstore ---
+    persist_dir = tempfile.mkdtemp()
+    broken = FakeEmbeddingServer(fail_after=5)
+    store = FakeVectorStore(HTTPEmbeddings(broken.url))
+
+    def add(vs, d, i):
+        return ingest_documents(vs, d, i, batch_size=32, workers=4, max_retries=1, base_delay=0.01)
+    first = sync_vectorstore(store, docs, persist_dir, "bench.md", "v1", add_documents=add)
+    broken.close()
+    healthy = FakeEmbeddingServer()
+    store.embeddings = HTTPEmbeddings(healthy.url)
+    second = sync_vectorstore(store, docs, persist_dir, "bench.md", "v1", add_documents=add)
+    healthy.close()
+    print()
+    print(f"interrupted build: embedded {first['ingest']['embedded']}/{n_chunks}, "
+          f"failed batches {first['ingest']['failed_batches']}")
+    print(f"resumed build    : embedded {second['added']} remaining chunks, "
+          f"{len(store._collection.rows)}/{n_chunks} in store")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""Micro-benchmark: เลือก intent ด้วย if/elif แบบเดิม เทียบกับ IntentRouter (automaton เดียว)
+
+รัน: python benchmarks/bench_intent_router.py
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from intent_router import INTENT_TABLE, IntentRouter  # noqa: E402
+
+# ข้อความตัวอย่างที่ใกล้เคียงกับ log จริง (ผสมทุก branch รวมถึงคำถามที่ตกไป RAG)
+CORPUS = [
+    "สวัสดีค่ะ",
+    "สวัสดี",
+    "นี่ใคร",
+    "ขอเบอร์โทรอาจารย์ยุพาภรณ์หน่อยค่ะ",
+    "รายชื่ออาจารย์คณะวิทยาศาสตร์ประยุกต์",
+    "ติดต่อคณะวิศวกรรมศาสตร์ยังไง",
+    "อีเมลของภาคคอมพิวเตอร์ศึกษา",
+    "การแต่งกายของนักศึกษาชายเป็นอย่างไร",
+    "ขอดูการแต่งกายที่ถูกระเบียบ",
+    "ขอแผนที่มหาวิทยาลัย",
+    "แผนที่อาคาร 81 อยู่ตรงไหน",
+    "ขอบคุณมากค่ะ",
+    "บาย",
+    "ปฏิทินการศึกษาภาคเรียนที่ 1 ปีนี้เริ่มวันไหน",
+    "ค่าเทอมคณะเทคโนโลยีสารสนเทศเท่าไหร่",
+    "ลงทะเบียนเรียนล่าช้าต้องทำอย่างไร",
+    "หอพักนักศึกษามีกี่แห่ง",
+    "ทุนการศึกษาสำหรับนักศึกษาปีหนึ่งมีอะไรบ้าง",
+    "ห้องสมุดเปิดกี่โมง",
+    "มจพ. ก่อตั้งเมื่อปีไหน",
+]
+
+
+def legacy_chain(m):
+    """เงื่อนไขเดิมใน handle_message (สร้าง list ใหม่ทุกครั้งเหมือนโค้ดเดิม)"""
+    if m in ['สวัสดี', 'นี่ใคร'] or m.startswith('สวัสดี'):
+        return "greeting"
+    elif any(kw in m for kw in ['เบอร์โทร', 'โทรศัพท์', 'ติดต่อ', 'อีเมล', 'email', 'ช่องทางติดต่อ', 'เบอร์', 'อาจารย์', 'บุคลากร']):
+        return "contact"
+    elif "การแต่งกาย" in m:
+        return "dress_code"
+    elif "แผนที่" in m:
+        return "map"
+    elif any(keyword in m for keyword in ['ขอบคุณ', 'พอแล้ว', 'จบการสนทนา', 'บาย', 'ไปละ']):
+        return "farewell"
+    return None
+
+
+def synthetic_table(extra_intents: int, keywords_per_intent: int = 10, seed: int = 0):
+    """ตาราง intent จริง + intent สมมติ เพื่อดูว่าเวลาต่อข้อความโตตามจำนวน intent แค่ไหน"""
+    rng = random.Random(seed)
+    chars = "กขคงจฉชซญดตถทธนบปผพฟภมยรลวศษสหอฮะาิีึืุูเแโใไ"
+    table = list(INTENT_TABLE)
+    for i in range(extra_intents):
+        keywords = ["".join(rng.choice(chars) for _ in range(6)) for _ in range(keywords_per_intent)]
+        table.append({"name": f"synthetic_{i}", "contains": keywords})
+    return table
+
+
+def linear_table_scan(table):
+    """เทียบเท่า if/elif ที่ยาวขึ้นเรื่อยๆ: ไล่ทีละ intent ทีละ keyword"""
+    def route(m):
+        for spec in table:
+            if m in spec.get("exact", []) or any(m.startswith(k) for k in spec.get("prefix", [])):
+                return spec["name"]
+            if any(k in m for k in spec.get("contains", [])):
+                return spec["name"]
+        return None
+    return route
+
+
+def bench(func, messages, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for m in messages:
+            func(m)
+    return (time.perf_counter() - start) / (rounds * len(messages)) * 1e6
+
+
+def main(rounds: int = 5000):
+    router = IntentRouter().compile()
+    messages = [m.lower() for m in CORPUS]
+
+    mismatches = [m for m in messages if router.match(m) != legacy_chain(m)]
+    if mismatches:
+        print("WARNING: router disagrees with legacy chain on:", mismatches)
+
+    legacy = bench(legacy_chain, messages, rounds)
+    routed = bench(router.match, messages, rounds)
+    print(f"messages={len(messages)} rounds={rounds}")
+    print(f"legacy if/elif chain : {legacy:8.2f} µs/msg")
+    print(f"IntentRouter.match   : {routed:8.2f} µs/msg")
+
+    print()
+    print(f"{'intents':>8} {'linear µs/msg':>15} {'router µs/msg':>15}")
+    for extra in (0, 20, 100, 500):
+        table = synthetic_table(extra)
+        scaled_router = IntentRouter(table).compile()
+        linear = bench(linear_table_scan(table), messages, max(50, rounds // (extra + 1)))
+        routed = bench(scaled_router.match, messages, max(50, rounds // 10))
+        print(f"{len(table):>8} {linear:>15.2f} {routed:>15.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""Benchmark: ApiClient ใหม่ทุกครั้งที่ reply (แบบเดิม) เทียบกับ LineClient ที่ใช้ connection pool ร่วมกัน
+
+รัน: python benchmarks/bench_line_client.py
+ใช้ HTTPS server จำลองใน localhost (self-signed cert จาก openssl) แทน api.line.me
+HANDSHAKE_DELAY_MS จำลองเวลาเดินทางของ TCP + TLS handshake (localhost แทบไม่มี latency ของ network)
+"""
+import json
+import os
+import ssl
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from linebot.v3.messaging import (  # noqa: E402
+    ApiClient, Configuration, MessagingApi, ReplyMessageRequest, TextMessage,
+)
+
+from line_client import LineClient  # noqa: E402
+
+HANDSHAKE_DELAY_MS = float(os.getenv("HANDSHAKE_DELAY_MS", "0"))
+RESPONSE = json.dumps({"sentMessages": [{"id": "1", "quoteToken": "q"}]}).encode()
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(RESPONSE)))
+        self.end_headers()
+        self.wfile.write(RESPONSE)
+
+    def log_message(self, *args):
+        pass
+
+
+class StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+    connections = 0
+
+    def get_request(self):
+        sock, addr = super().get_request()
+        StandInServer.connections += 1
+        return sock, addr
+
+    def finish_request(self, request, client_address):
+        if HANDSHAKE_DELAY_MS:
+            time.sleep(HANDSHAKE_DELAY_MS / 1000)
+        request.do_handshake()
+        super().finish_request(request, client_address)
+
+
+def make_cert(directory):
+    cert, key = os.path.join(directory, "cert.pem"), os.path.join(directory, "key.pem")
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1", "-subj", "/CN=127.0.0.1",
+         "-addext", "subjectAltName=IP:127.0.0.1", "-keyout", key, "-out", cert],
+        check=True, capture_output=True,
+    )
+    return cert, key
+
+
+def start_server(cert, key):
+    server = StandInServer(("127.0.0.1", 0), StandInHandler)
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert, key)
+    server.socket = context.wrap_socket(server.socket, server_side=True, do_handshake_on_connect=False)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def make_configuration(port, cert):
+    configuration = Configuration(access_token="bench", host=f"https://127.0.0.1:{port}")
+    configuration.ssl_ca_cert = cert
+    return configuration
+
+
+def reply(api):
+    api.reply_message_with_http_info(ReplyMessageRequest(reply_token="t", messages=[TextMessage(text="hi")]))
+
+
+def per_call(configuration):
+    with ApiClient(configuration) as api_client:
+        reply(MessagingApi(api_client))
+
+
+def run(name, func, n, concurrency):
+    StandInServer.connections = 0
+    latencies = []
+
+    def one(_):
+        start = time.perf_counter()
+        func()
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        list(executor.map(one, range(n)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    print(f"{name:<26} {concurrency:>4} {n / elapsed:>9.0f} {statistics.median(latencies):>8.2f} "
+          f"{latencies[int(len(latencies) * 0.95) - 1]:>8.2f} {StandInServer.connections:>6}")
+
+
+def main(n=400):
+    directory = tempfile.mkdtemp()
+    cert, key = make_cert(directory)
+    server = start_server(cert, key)
+    port = server.server_address[1]
+    print(f"HTTPS stand-in on 127.0.0.1:{port}  replies={n}  handshake delay={HANDSHAKE_DELAY_MS}ms")
+    print(f"{'client':<26} {'conc':>4} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'conns':>6}")
+    for concurrency in (1, 8):
+        run("ApiClient per reply", lambda: per_call(make_configuration(port, cert)), n, concurrency)
+        pooled = LineClient(make_configuration(port, cert), pool_maxsize=8)
+        pooled.api()  # สร้าง client ก่อน (เหมือน worker ที่รับ request แรกไปแล้ว)
+        run("LineClient (pooled)", lambda: reply(pooled.api()), n, concurrency)
+        pooled.close()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""Benchmark: ต้นทุนของ logging ต่อ request บน request thread ก่อน/หลังใช้ log_pipeline
+
+รัน: python benchmarks/bench_logging.py [--requests 20000] [--threads 1] [--out file|devnull]
+จำลอง log ที่ข้อความหนึ่งข้อความ (ตกไป RAG) เขียนจริงใน callback/handle_message/answer_question/ContextPacker
+แบบเดิม = logging.basicConfig (StreamHandler เขียนและ flush ทุก record ภายใต้ lock เดียว) + f-string + body เต็มก้อน
+เวลาที่วัดคือเวลาที่ request thread เสียไปกับ logging เท่านั้น ส่วน async ต้องรอ writer thread เขียนที่ค้างในคิว
+(คอลัมน์ drain s) ซึ่งไม่อยู่บนเส้นทางของ request, bytes/req = ขนาด log ที่เขียนลงไฟล์จริงต่อ request
+--threads มากกว่า 1 ทุก thread วนแต่ logging (ไม่มี I/O ให้ปล่อย GIL) p99 จึงถูกกำหนดโดยช่วงสลับ GIL (5 ms) ทุกแบบ
+dropped = record ที่ทิ้งเพราะคิวเต็ม: loop นี้สร้าง record เร็วกว่า traffic จริงหลายร้อยเท่า writer จึงตามไม่ทันถ้าไม่ sample
+"""
+import argparse
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from log_pipeline import (  # noqa: E402
+    LOG_CALLER_INFO,
+    LOG_SAMPLE_RATES,
+    BackgroundLogHandler,
+    SamplingFilter,
+    create_handler,
+    parse_sample_rates,
+)
+
+USER_ID = "U4af4980629a0f3e1b2c3d4e5f6a7b8c9"
+QUESTION = "ลงทะเบียนเรียนล่าช้าต้องทำอย่างไร และต้องจ่ายค่าปรับเท่าไหร่"
+ANSWER = "การลงทะเบียนล่าช้าทำได้ที่ reg.kmutnb.ac.th ภายในช่วงเวลาที่กำหนดในปฏิทินการศึกษา " * 3
+
+
+def webhook_body(seq):
+    event = {
+        "type": "message", "mode": "active", "timestamp": 1700000000000 + seq,
+        "source": {"type": "user", "userId": USER_ID},
+        "webhookEventId": f"01HBENCH{seq:018d}", "deliveryContext": {"isRedelivery": False},
+        "replyToken": f"{seq:032x}", "message": {"id": str(seq), "type": "text", "quoteToken": f"q{seq:040d}",
+                                                 "text": QUESTION},
+    }
+    return json.dumps({"destination": "U" + "0" * 32, "events": [event]}, ensure_ascii=False)
+
+
+def legacy_request(body, app_log, rag_log, packer_log):
+    """log ของหนึ่งข้อความตามโค้ดก่อน log_pipeline (f-string, ไม่มี category)"""
+    app_log.info("Request body: " + body)
+    app_log.info(f"Intent '{'fallback'}' routed in {0.021:.3f} ms")
+    app_log.info(f"No rule-based response for '{QUESTION}', attempting RAG.")
+    rag_log.info(f"Invoking RAG chain with question: '{QUESTION}'")
+    packer_log.info(
+        f"Context packed: {8} chunks -> {7} blocks, ~{2101} -> ~{1989} tokens "
+        f"(saved ~{112}; merged {0}, duplicates {0}, over budget {1})"
+    )
+    app_log.info(f"Manually added user and bot response to Gemini history for user {USER_ID}.")
+
+
+def pipeline_request(body, app_log, rag_log, packer_log):
+    """log ชุดเดียวกันหลังย้ายมาใช้ %-args + category (format เกิดใน writer thread และเฉพาะ record ที่เก็บ)"""
+    message = {"category": "message"}
+    app_log.info("Request body: %s", body, extra={"category": "webhook_body"})
+    app_log.info("Intent '%s' routed in %.3f ms", "fallback", 0.021, extra=message)
+    app_log.info("No rule-based response for '%s', attempting RAG.", QUESTION, extra=message)
+    rag_log.info("Invoking RAG chain with question: '%s'", QUESTION, extra=message)
+    packer_log.info(
+        "Context packed: %d chunks -> %d blocks, ~%d -> ~%d tokens (saved ~%d; merged %d, duplicates %d, over budget %d)",
+        8, 7, 2101, 1989, 112, 0, 0, 1, extra=message,
+    )
+    app_log.info("Manually added user and bot response to Gemini history for user %s.", USER_ID, extra=message)
+
+
+def run(label, handler, request_fn, args, path):
+    root = logging.getLogger("bench")
+    root.handlers = [handler]
+    root.setLevel(logging.INFO)
+    root.propagate = False
+    loggers = (logging.getLogger("bench.app"), logging.getLogger("bench.rag_handler"),
+               logging.getLogger("bench.context_packer"))
+
+    per_thread = args.requests // args.threads
+    samples = [[] for _ in range(args.threads)]
+    barrier = threading.Barrier(args.threads + 1)
+
+    def worker(index):
+        out = samples[index]
+        bodies = [webhook_body(index * per_thread + i) for i in range(per_thread)]
+        barrier.wait()
+        for body in bodies:
+            start = time.perf_counter()
+            request_fn(body, *loggers)
+            out.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.threads)]
+    for t in threads:
+        t.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - start
+
+    drain_start = time.perf_counter()
+    dropped = 0
+    if isinstance(handler, BackgroundLogHandler):
+        dropped = handler.stats()["dropped"]
+    handler.close()
+    drain = time.perf_counter() - drain_start
+
+    latencies = sorted(sample * 1e6 for thread_samples in samples for sample in thread_samples)
+    size = os.path.getsize(path) if os.path.exists(path) else 0
+    total = len(latencies)
+    print(f"  {label:<38} {statistics.mean(latencies):>8.1f} {latencies[total // 2]:>8.1f} "
+          f"{latencies[int(total * 0.99)]:>8.1f} {total / wall:>10.0f} {drain:>8.2f} "
+          f"{size / total:>9.0f} {dropped:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-request logging overhead: basicConfig vs log_pipeline")
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--threads", type=int, default=1)
+    parser.add_argument("--out", choices=("file", "devnull"), default="file")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_logging_")
+    rates = parse_sample_rates(LOG_SAMPLE_RATES)
+    print(f"{args.requests} requests x 6 records, {args.threads} threads, output={args.out}, sample rates={rates}")
+    print(f"  {'':<38} {'mean µs':>8} {'p50 µs':>8} {'p99 µs':>8} {'req/s':>10} {'drain s':>8} "
+          f"{'bytes/req':>9} {'dropped':>8}")
+
+    # configure_logging ปิดการหา caller (logging._srcfile = None) ถ้าไม่ได้ตั้ง LOG_CALLER_INFO=true
+    srcfile = logging._srcfile
+    variants = [
+        ("before: basicConfig text, sync", None, legacy_request),
+        ("json, sync, no sampling", dict(log_format="json", async_writes=False, sampler=None), pipeline_request),
+        ("json, sync, sampled", dict(log_format="json", async_writes=False), pipeline_request),
+        ("json, background writer, no sampling", dict(log_format="json", async_writes=True, sampler=None),
+         pipeline_request),
+        ("after: json, background writer, sampled", dict(log_format="json", async_writes=True), pipeline_request),
+    ]
+    for index, (label, options, request_fn) in enumerate(variants):
+        path = os.devnull if args.out == "devnull" else os.path.join(workdir, f"log_{index}.txt")
+        stream = open(path, "a", encoding="utf-8")
+        logging._srcfile = srcfile if options is None or LOG_CALLER_INFO else None
+        if options is None:
+            handler = logging.StreamHandler(stream)
+            handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+        else:
+            if options.get("sampler", True) is not None:
+                options["sampler"] = SamplingFilter(rates)
+            handler = create_handler(stream, **options)
+        run(label, handler, request_fn, args, path)
+        stream.close()
+
+
+if __name__ == "__main__":
+    main()
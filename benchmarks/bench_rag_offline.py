@@ -0,0 +1,59 @@
+"""Benchmark: สร้าง index และตอบคำถามผ่าน RAG pipeline ทั้งหมดแบบ offline
+
+รัน: python benchmarks/bench_rag_offline.py
+ใช้ HashingNgramEmbeddings + StubChatModel (ไม่ต้องใช้ network หรือ API key)
+"""
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("RAG_EMBEDDINGS_PROVIDER", "local")
+os.environ.setdefault("RAG_LLM_PROVIDER", "stub")
+os.environ.setdefault("CHROMA_PERSIST_DIRECTORY", os.path.join(tempfile.mkdtemp(), "chroma_db"))
+os.environ.setdefault("ANSWER_CACHE_SIZE", "1")
+os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+
+import logging  # noqa: E402
+
+logging.disable(logging.INFO)
+
+import rag_handler  # noqa: E402
+
+QUESTIONS = [
+    "ชุดนักศึกษาแต่งกายอย่างไร",
+    "ปฏิทินการศึกษาภาคเรียนที่ 1",
+    "แผนที่อาคารในมหาวิทยาลัย",
+    "ประวัติการก่อตั้งมหาวิทยาลัย",
+    "เบอร์โทรคณะวิทยาศาสตร์ประยุกต์",
+    "คณะวิศวกรรมศาสตร์มีภาควิชาอะไรบ้าง",
+    "การเดินทางมามหาวิทยาลัยด้วยรถเมล์สายอะไร",
+    "หลักสูตรคณะเทคโนโลยีสารสนเทศและนวัตกรรมดิจิทัล",
+]
+
+
+def main(rounds: int = 5):
+    start = time.perf_counter()
+    rag_handler.start_rag_build(os.path.join(ROOT, "kmutnbBuddy.md"), background=False)
+    cold = time.perf_counter() - start
+    status = rag_handler.rag_status()
+    print(f"cold build: {cold:.2f}s  phase={status['phase']}  sync={status.get('index_sync')}")
+
+    latencies = []
+    for _ in range(rounds):
+        for question in QUESTIONS:
+            rag_handler.ANSWER_CACHE.invalidate(rag_handler.ANSWER_CACHE.version)
+            t0 = time.perf_counter()
+            rag_handler.answer_question(question)
+            latencies.append((time.perf_counter() - t0) * 1000)
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(f"answer_question (uncached): n={len(latencies)} "
+          f"p50={statistics.median(latencies):.1f}ms p95={p95:.1f}ms max={latencies[-1]:.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Benchmark: recall และ latency ของ retriever แบบ vector (k=16 เดิม) เทียบกับ hybrid BM25 + vector
+
+รัน: python benchmarks/bench_retrieval_hybrid.py
+ใช้ embeddings ตาม RAG_EMBEDDINGS_PROVIDER (ค่าเริ่มต้นของสคริปต์นี้คือ local เพื่อรันแบบ offline ได้)
+ผลกับ embeddings จริงของ Google จะต่างออกไป ควรรันซ้ำด้วย RAG_EMBEDDINGS_PROVIDER=google ก่อนปรับค่า production
+"""
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("RAG_EMBEDDINGS_PROVIDER", "local")
+os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+
+import logging  # noqa: E402
+
+logging.disable(logging.WARNING)
+
+from langchain_community.vectorstores import Chroma  # noqa: E402
+
+from lexical_index import HybridRetriever, LexicalIndex  # noqa: E402
+from providers import get_embeddings  # noqa: E402
+from rag_handler import split_markdown  # noqa: E402
+
+# คำถามที่มีตัวระบุตรงตัว (ชื่อบุคลากร, เลขหัวข้อ, ชื่อบริการ) กับข้อความที่ต้องอยู่ใน chunk ที่ถูกต้อง
+QUERIES = [
+    ("เบอร์ติดต่อ ผศ.ดร.นวพร วิสิฐพงศ์พันธ์", "นวพร วิสิฐพงศ์พันธ์"),
+    ("อ.ดร.ปิยะ กรกชจินตนาการ ติดต่อยังไง", "ปิยะ กรกชจินตนาการ"),
+    ("รศ.ดร.กิตติวุฒิ ศุทธิวิโรจน์ เบอร์อะไร", "กิตติวุฒิ ศุทธิวิโรจน์"),
+    ("ข้อ 1.2.3 มีใครบ้าง", "1.2.3.1"),
+    ("หัวข้อ 2.2.1 ขั้นตอนการลงทะเบียนเรียน", "2.2.1 ขั้นตอนการลงทะเบียนเรียน"),
+    ("ICIT Account คืออะไร", "ICIT Account"),
+    ("ใช้ Eduroam ยังไง", "Eduroam"),
+    ("SOLIDWORKS Simulation สำหรับนักศึกษา", "SOLIDWORKS"),
+    ("MATLAB Campus Wide License", "MATLAB"),
+    ("Google Workspace Education Plus", "Google Workspace"),
+    ("ชมรมหุ่นยนต์", "ชมรมหุ่นยนต์"),
+    ("ลงรถไฟที่สถานีบางซื่อแล้วต่อรถอะไร", "บางซื่อ"),
+    ("คำปรึกษาด้าน กยศ.", "กยศ"),
+    ("ชุดช็อปต้องแต่งอย่างไร", "ชุดช็อป"),
+    ("ภาควิชาวิศวกรรมขนถ่ายวัสดุและโลจิสติกส์", "ขนถ่ายวัสดุและโลจิสติกส์"),
+    ("ภาควิชาสถาปัตยกรรม Department of Architecture", "Department of Architecture"),
+]
+
+
+def evaluate(name, retrieve, k):
+    hits = 0
+    latencies = []
+    for question, expected in QUERIES:
+        start = time.perf_counter()
+        docs = retrieve(question)
+        latencies.append((time.perf_counter() - start) * 1000)
+        if any(expected.lower() in doc.page_content.lower() for doc in docs[:k]):
+            hits += 1
+    latencies.sort()
+    print(f"{name:<28} {k:>4} {hits / len(QUERIES):>9.2%} {statistics.median(latencies):>9.2f} {latencies[-1]:>9.2f}")
+
+
+def main():
+    with open(os.path.join(ROOT, "kmutnbBuddy.md"), encoding="utf-8") as f:
+        splits = split_markdown(f.read())
+    vectorstore = Chroma.from_documents(
+        splits, get_embeddings(), ids=[d.metadata["chunk_id"] for d in splits],
+        persist_directory=tempfile.mkdtemp(),
+    )
+    start = time.perf_counter()
+    lexical = LexicalIndex(splits)
+    print(f"chunks={len(splits)}  lexical index build={(time.perf_counter() - start) * 1000:.1f}ms  "
+          f"terms={len(lexical.postings)}  embeddings={os.environ['RAG_EMBEDDINGS_PROVIDER']}")
+    print(f"{'retriever':<28} {'k':>4} {'recall@k':>9} {'p50 ms':>9} {'max ms':>9}")
+    for k in (16, 8, 4):
+        evaluate("vector", lambda q, k=k: vectorstore.similarity_search(q, k=k), k)
+    for k in (8, 4):
+        evaluate("bm25 only", lambda q, k=k: [d for d, _ in lexical.search(q, k=k)], k)
+        hybrid = HybridRetriever(vectorstore=vectorstore, lexical_index=lexical, k=k, fetch_k=20)
+        evaluate("hybrid (rrf)", hybrid.get_relevant_documents, k)
+
+
+if __name__ == "__main__":
+    main()
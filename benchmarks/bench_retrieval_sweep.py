@@ -0,0 +1,177 @@
+"""Benchmark: กวาดค่า chunk_size / chunk_overlap / retriever / k แล้ววัดกับชุดคำถาม golden
+
+รัน: python benchmarks/bench_retrieval_sweep.py [--chunk-sizes 500,750,1000,1500] [--overlaps 0,100,200]
+                                              [--k 4,8,16] [--retrievers vector,hybrid] [--csv out.csv]
+ชุดคำถามอยู่ที่ benchmarks/golden/retrieval_golden_v1.json (เพิ่มคำถาม = ออกเวอร์ชันใหม่ ไม่แก้ไฟล์เดิม
+เพื่อให้ผลของแต่ละรอบเทียบกันได้) chunk_id เปลี่ยนตามค่า splitter จึงระบุคำตอบด้วยหัวข้อ (header_path)
++ ข้อความที่ต้องอยู่ใน chunk แทน แล้วแปลงเป็น chunk ที่ถูกต้องของแต่ละ config ตอนวัด
+embeddings ตาม RAG_EMBEDDINGS_PROVIDER (ค่าเริ่มต้นของสคริปต์นี้คือ local) ผลกับ embeddings ของ Google จะต่างออกไป
+
+คอลัมน์: recall@k = สัดส่วนคำถามที่มี chunk ถูกต้องใน k อันดับแรก, MRR = ค่าเฉลี่ย 1/อันดับของ chunk ถูกต้องอันแรก,
+ctx tok = token โดยประมาณของ k chunk ที่ส่งเข้า prompt (ก่อน ContextPacker), miss = คำถามที่ไม่มี chunk ใดถูกต้องเลย
+(ข้อความคำตอบถูกตัดแยกไปคนละ chunk)
+"""
+import argparse
+import csv
+import hashlib
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("RAG_EMBEDDINGS_PROVIDER", "local")
+os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+
+import logging  # noqa: E402
+
+logging.disable(logging.WARNING)
+
+from langchain_community.vectorstores import Chroma  # noqa: E402
+
+from context_packer import estimate_tokens  # noqa: E402
+from lexical_index import HybridRetriever, LexicalIndex  # noqa: E402
+from providers import get_embeddings  # noqa: E402
+from rag_handler import split_markdown  # noqa: E402
+
+GOLDEN_PATH = os.path.join(ROOT, "benchmarks", "golden", "retrieval_golden_v1.json")
+# ค่าที่ setup_rag_chain ใช้อยู่ (ทำเครื่องหมาย * ในตาราง)
+PRODUCTION = {"chunk_size": 1000, "chunk_overlap": 200, "retriever": "hybrid", "k": 8}
+
+
+def int_list(text):
+    return [int(part) for part in text.split(",") if part.strip()]
+
+
+def directory_size(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def is_relevant(doc, item):
+    return item["section"] in doc.metadata.get("header_path", "") and item["evidence"].lower() in doc.page_content.lower()
+
+
+def build_index(full_text, chunk_size, chunk_overlap, embeddings, workdir):
+    start = time.perf_counter()
+    splits = split_markdown(full_text, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    persist_directory = os.path.join(workdir, f"chroma_{chunk_size}_{chunk_overlap}")
+    vectorstore = Chroma.from_documents(
+        splits, embeddings, ids=[doc.metadata["chunk_id"] for doc in splits],
+        persist_directory=persist_directory,
+    )
+    lexical = LexicalIndex(splits)
+    build_seconds = time.perf_counter() - start
+    return splits, vectorstore, lexical, build_seconds, directory_size(persist_directory)
+
+
+def evaluate(retrieve, golden, k):
+    hits = 0
+    reciprocal_ranks = []
+    latencies = []
+    context_tokens = []
+    for item in golden:
+        start = time.perf_counter()
+        docs = retrieve(item["question"])[:k]
+        latencies.append((time.perf_counter() - start) * 1000)
+        context_tokens.append(sum(estimate_tokens(doc.page_content) for doc in docs))
+        rank = next((i + 1 for i, doc in enumerate(docs) if is_relevant(doc, item)), None)
+        if rank is not None:
+            hits += 1
+        reciprocal_ranks.append(1.0 / rank if rank else 0.0)
+    latencies.sort()
+    return {
+        "recall": hits / len(golden),
+        "mrr": statistics.mean(reciprocal_ranks),
+        "ctx_tokens": statistics.mean(context_tokens),
+        "p50_ms": latencies[len(latencies) // 2],
+        "p95_ms": latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep splitter/retriever settings against the golden set")
+    parser.add_argument("--golden", default=GOLDEN_PATH)
+    parser.add_argument("--chunk-sizes", type=int_list, default=[500, 750, 1000, 1500])
+    parser.add_argument("--overlaps", type=int_list, default=[0, 100, 200])
+    parser.add_argument("--k", type=int_list, default=[4, 8, 16])
+    parser.add_argument("--retrievers", default="vector,hybrid")
+    parser.add_argument("--fetch-k", type=int, default=20, help="candidates per list before RRF (hybrid)")
+    parser.add_argument("--csv", help="also write the rows to this CSV file")
+    args = parser.parse_args()
+
+    with open(args.golden, encoding="utf-8") as f:
+        golden_set = json.load(f)
+    golden = golden_set["questions"]
+    source_path = os.path.join(ROOT, golden_set["source"])
+    with open(source_path, encoding="utf-8") as f:
+        full_text = f.read()
+    source_sha256 = hashlib.sha256(full_text.encode("utf-8")).hexdigest()
+    print(f"golden set v{golden_set['version']}: {len(golden)} questions  "
+          f"embeddings={os.environ['RAG_EMBEDDINGS_PROVIDER']}")
+    if source_sha256 != golden_set["source_sha256"]:
+        print(f"WARNING: {golden_set['source']} changed since the golden set was written; "
+              f"check the 'miss' column and update the set (new version) if answers moved")
+
+    retrievers = [name.strip() for name in args.retrievers.split(",") if name.strip()]
+    embeddings = get_embeddings()
+    workdir = tempfile.mkdtemp(prefix="bench_retrieval_sweep_")
+    rows = []
+    header = (f"  {'size':>5} {'ovlp':>5} {'retriever':<9} {'k':>3} {'chunks':>6} {'build s':>8} {'index KB':>9} "
+              f"{'miss':>5} {'recall@k':>9} {'MRR':>6} {'ctx tok':>8} {'p50 ms':>7} {'p95 ms':>7}")
+    print(header)
+    try:
+        for chunk_size in args.chunk_sizes:
+            for chunk_overlap in args.overlaps:
+                if chunk_overlap >= chunk_size:
+                    continue
+                splits, vectorstore, lexical, build_seconds, index_bytes = build_index(
+                    full_text, chunk_size, chunk_overlap, embeddings, workdir
+                )
+                missing = sum(1 for item in golden if not any(is_relevant(doc, item) for doc in splits))
+                for retriever_name in retrievers:
+                    for k in args.k:
+                        if retriever_name == "vector":
+                            retrieve = lambda q, k=k: vectorstore.similarity_search(q, k=k)  # noqa: E731
+                        elif retriever_name == "hybrid":
+                            retrieve = HybridRetriever(
+                                vectorstore=vectorstore, lexical_index=lexical, k=k, fetch_k=max(k, args.fetch_k),
+                            ).get_relevant_documents
+                        else:
+                            raise SystemExit(f"Unknown retriever '{retriever_name}'")
+                        result = evaluate(retrieve, golden, k)
+                        row = {
+                            "chunk_size": chunk_size, "chunk_overlap": chunk_overlap, "retriever": retriever_name,
+                            "k": k, "chunks": len(splits), "build_seconds": round(build_seconds, 3),
+                            "index_kb": round(index_bytes / 1024, 1), "missing": missing,
+                            **{name: round(value, 4) for name, value in result.items()},
+                        }
+                        rows.append(row)
+                        current = all(row[name] == value for name, value in PRODUCTION.items())
+                        print(f"{'*' if current else ' '} {chunk_size:>5} {chunk_overlap:>5} {retriever_name:<9} {k:>3} "
+                              f"{len(splits):>6} {build_seconds:>8.2f} {row['index_kb']:>9.0f} {missing:>5} "
+                              f"{result['recall']:>9.1%} {result['mrr']:>6.3f} {result['ctx_tokens']:>8.0f} "
+                              f"{result['p50_ms']:>7.2f} {result['p95_ms']:>7.2f}")
+                del vectorstore
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    # ตัวเลือกที่ recall สูงสุด แล้วใช้ token น้อยที่สุด (prompt เล็กลง = เร็วขึ้นและถูกลง)
+    print("\nbest recall, then MRR, then fewest context tokens:")
+    for row in sorted(rows, key=lambda r: (-r["recall"], -r["mrr"], r["ctx_tokens"]))[:5]:
+        print(f"  size={row['chunk_size']} overlap={row['chunk_overlap']} {row['retriever']} k={row['k']}: "
+              f"recall={row['recall']:.1%} MRR={row['mrr']:.3f} ctx≈{row['ctx_tokens']:.0f} tokens")
+
+    if args.csv:
+        with open(args.csv, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
+        print(f"rows written to {args.csv}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""Benchmark: webhook หนึ่งครั้งที่มีหลาย event (คำถาม RAG) ก่อน/หลังประมวลผล event ของผู้ใช้ต่างคนกันพร้อมกัน
+
+รัน: python benchmarks/bench_webhook_batch.py [--events 5] [--rounds 3] [--gemini-latency 1.0] [--server flask|asgi]
+ใช้ LINE API / Gemini จำลองและการตั้งค่าแอปชุดเดียวกับ bench_webhook_load.py (semantic cache, FAQ store และ single-flight ปิด)
+แบบเดิม = WEBHOOK_EVENT_WORKERS=0 (ทีละ event เหมือน WebhookHandler.handle), แบบใหม่ = ค่าเริ่มต้นของแอป
+แต่ละรอบวัด: single = เวลาของ event เดียว (ส่งทีละ delivery), batch = delivery เดียวที่มี --events event จากผู้ใช้คนละคน,
+same user = delivery เดียวที่ทุก event มาจากผู้ใช้คนเดียวกัน (ต้องตอบตามลำดับ จึงควรใกล้ผลรวมเหมือนเดิม)
+latency = ตั้งแต่ยิง webhook จนคำตอบสุดท้ายของ delivery ถึง LINE API จำลอง, ordered = คำตอบของ same user ออกตามลำดับ
+--server asgi: ASGI ไม่มีโหมดทีละ event ให้เทียบ จึงวัดเฉพาะแบบใหม่ (ตอบ 200 ทันทีแล้วประมวลผลเป็น task)
+"""
+import argparse
+import http.client
+import itertools
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_webhook_load import (  # noqa: E402
+    BRANCHES,
+    CHANNEL_SECRET,
+    ROOT,
+    GeminiStubHandler,
+    LineStubHandler,
+    Recorder,
+    free_port,
+    message_event,
+    server_command,
+    signed_payload,
+    start_stub,
+    wait_ready,
+)
+
+QUESTIONS = BRANCHES["rag"]
+
+
+class Bench:
+    def __init__(self, port, recorder, timeout):
+        self.port = port
+        self.recorder = recorder
+        self.timeout = timeout
+        self.seq = itertools.count(1)
+        self.users = itertools.count(1)
+
+    def deliver(self, user_ids):
+        """ส่ง delivery เดียวที่มีหนึ่ง event ต่อ user_id แล้วรอจนทุก event ได้คำตอบ คืน (latency, ตอบตามลำดับหรือไม่)"""
+        events = []
+        seqs = []
+        for index, user_id in enumerate(user_ids):
+            seq = next(self.seq)
+            reply_token = f"{seq:032x}"
+            # เลขลำดับต่อท้ายให้ทุกคำถามไม่ซ้ำกัน: cache แบบตรงตัวยังเปิดอยู่ ทุก event จึงต้องวิ่งครบ RAG
+            text = f"{QUESTIONS[(seq + index) % len(QUESTIONS)]} ({seq})"
+            events.append(message_event(seq, text, reply_token, user_id))
+            seqs.append(seq)
+        body, signature = signed_payload(events)
+        sent = time.perf_counter()
+        for seq, event in zip(seqs, events):
+            self.recorder.register(seq, "rag", event["replyToken"], event["source"]["userId"], sent)
+        connection = http.client.HTTPConnection("127.0.0.1", self.port, timeout=self.timeout)
+        try:
+            connection.request("POST", "/callback", body=body, headers={
+                "Content-Type": "application/json", "X-Line-Signature": signature,
+            })
+            response = connection.getresponse()
+            response.read()
+            if response.status != 200:
+                raise SystemExit(f"/callback returned {response.status}")
+        finally:
+            connection.close()
+        if not self.recorder.wait_all(self.timeout):
+            raise SystemExit("Timed out waiting for LINE replies")
+        with self.recorder.lock:
+            answered = {seq: self.recorder.events[seq]["answered"] for seq in seqs}
+        return max(answered.values()) - sent, sorted(seqs, key=answered.get) == seqs
+
+    def new_user(self):
+        return f"U{next(self.users):032x}"
+
+    def round(self, events):
+        singles = [self.deliver([self.new_user()])[0] for _ in range(events)]
+        batch, _ = self.deliver([self.new_user() for _ in range(events)])
+        user = self.new_user()
+        same_user, ordered = self.deliver([user] * events)
+        return singles, batch, same_user, ordered
+
+
+def run_server(label, args, extra_env, recorder, line_stub, gemini_stub):
+    port = free_port()
+    workdir = tempfile.mkdtemp(prefix="bench_webhook_batch_")
+    env = dict(os.environ)
+    env.update({
+        "LINE_CHANNEL_SECRET": CHANNEL_SECRET,
+        "LINE_CHANNEL_ACCESS_TOKEN": "bench-token",
+        "LINE_API_ENDPOINT": f"http://127.0.0.1:{line_stub.server_port}",
+        "GEMINI_API_KEY": "bench-key",
+        "GEMINI_API_ENDPOINT": f"http://127.0.0.1:{gemini_stub.server_port}",
+        "RAG_EMBEDDINGS_PROVIDER": "local",
+        "CHROMA_PERSIST_DIRECTORY": os.path.join(workdir, "chroma_db"),
+        "ANONYMIZED_TELEMETRY": "False",
+        "SESSION_BACKEND": "memory",
+        "ANSWER_CACHE_SEMANTIC": "false",
+        "FAQ_STORE_ENABLED": "false",
+        "ANSWER_COALESCE_TIMEOUT_SECONDS": "0",
+        # same user ส่งหลายข้อความติดกันทุกรอบ: ไม่ให้ rate limit ต่อผู้ใช้มาบังผลที่วัด
+        "USER_LIMITER_ENABLED": "false",
+        # ให้ทุกคำตอบส่งด้วย reply token (ไม่แตกเป็น placeholder + push)
+        "REPLY_DEADLINE_SECONDS": "0",
+    })
+    if args.server == "asgi":
+        env.update({"RAG_LLM_PROVIDER": "stub", "STUB_LLM_LATENCY_SECONDS": str(args.gemini_latency)})
+    else:
+        env["RAG_LLM_PROVIDER"] = "google"
+    env.update(extra_env)
+    command, server_label = server_command(args.server, port, 1, 16)
+    log_path = os.path.join(workdir, "server.log")
+    with open(log_path, "w") as log:
+        proc = subprocess.Popen(command, cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+    try:
+        if not wait_ready(port, proc):
+            raise SystemExit(f"Server did not become ready, see {log_path}")
+        bench = Bench(port, recorder, args.timeout)
+        bench.round(2)  # warm-up: connection pool ของแอป, import ที่ lazy, session แรก
+        rounds = [bench.round(args.events) for _ in range(args.rounds)]
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+    slowest = statistics.median(max(singles) for singles, _, _, _ in rounds)
+    total = statistics.median(sum(singles) for singles, _, _, _ in rounds)
+    batch = statistics.median(b for _, b, _, _ in rounds)
+    same_user = statistics.median(s for _, _, s, _ in rounds)
+    ordered = all(o for _, _, _, o in rounds)
+    print(f"  {label:<34} {slowest:>10.2f} {total:>10.2f} {batch:>10.2f} {batch / slowest:>8.2f}x "
+          f"{same_user:>10.2f} {str(ordered):>8}   ({server_label})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latency of one webhook delivery carrying several events")
+    parser.add_argument("--server", choices=("flask", "asgi"), default="flask")
+    parser.add_argument("--events", type=int, default=5, help="events per delivery")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--gemini-latency", type=float, default=1.0, help="seconds per Gemini call")
+    parser.add_argument("--line-latency", type=float, default=0.05, help="seconds per LINE API call")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    args = parser.parse_args()
+
+    recorder = Recorder()
+    line_stub = start_stub(LineStubHandler, args.line_latency, recorder=recorder)
+    gemini_stub = start_stub(GeminiStubHandler, args.gemini_latency)
+
+    print(f"{args.events} RAG events per delivery, {args.rounds} rounds (median), "
+          f"gemini {args.gemini_latency}s, LINE {args.line_latency}s")
+    print(f"  {'':<34} {'slowest s':>10} {'sum s':>10} {'batch s':>10} {'/slowest':>9} {'same user s':>10} "
+          f"{'ordered':>8}")
+    if args.server == "flask":
+        variants = [("before: one event at a time", {"WEBHOOK_EVENT_WORKERS": "0"}),
+                    ("after: concurrent per user", {})]
+    else:
+        variants = [("asgi: one task per user", {})]
+    for label, extra_env in variants:
+        run_server(label, args, extra_env, recorder, line_stub, gemini_stub)
+
+
+if __name__ == "__main__":
+    main()
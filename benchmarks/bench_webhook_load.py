@@ -0,0 +1,395 @@
+"""Load test: ยิง webhook ที่เซ็น signature ถูกต้องเข้า /callback ตาม rate ที่กำหนด แล้ววัด latency แยกตาม branch
+
+รัน: python benchmarks/bench_webhook_load.py [--server flask|asgi] [--rate 20] [--duration 30]
+                                             [--events-per-request 1] [--gemini-latency 1.0] [--line-latency 0.05]
+แอปรันเป็น process แยก (gunicorn ถ้าติดตั้งไว้ ไม่เช่นนั้นใช้ flask dev server, --server asgi ใช้ uvicorn)
+LINE Messaging API และ Gemini (ทั้ง RAG chain และ chat ตรง) เป็น HTTP server จำลองใน process นี้ ผ่าน
+LINE_API_ENDPOINT / GEMINI_API_ENDPOINT, embeddings ใช้ HashingNgramEmbeddings (ไม่ต้องใช้ network)
+cache คำตอบ, FAQ store และ single-flight ถูกปิด (เปิดด้วย --with-caches) เพื่อให้ทุกข้อความวิ่งครบ pipeline
+latency = เวลาตั้งแต่ยิง webhook จนคำตอบสุดท้าย (reply หรือ push) ไปถึง LINE API จำลอง
+ตัวแปรอื่นของแอป (เช่น WEBHOOK_ASYNC, WEBHOOK_WORKERS, REPLY_DEADLINE_SECONDS) ส่งต่อจาก environment ได้
+"""
+import argparse
+import base64
+import hashlib
+import hmac
+import http.client
+import importlib.util
+import itertools
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHANNEL_SECRET = "bench-webhook-load-secret"
+
+# ข้อความตัวอย่างของแต่ละ branch ใน handle_message
+BRANCHES = {
+    "contact": [
+        "ขอเบอร์โทรคณะวิทยาศาสตร์ประยุกต์",
+        "ติดต่อคณะวิศวกรรมศาสตร์ยังไง",
+        "อีเมลของภาคคอมพิวเตอร์ศึกษา",
+        "รายชื่ออาจารย์ภาควิชาเทคโนโลยีสารสนเทศ",
+    ],
+    "dress_code": [
+        "การแต่งกายของนักศึกษาชายเป็นอย่างไร",
+        "ขอดูการแต่งกายที่ถูกระเบียบ",
+    ],
+    "map": [
+        "ขอแผนที่มหาวิทยาลัย",
+        "แผนที่อาคาร 81 อยู่ตรงไหน",
+    ],
+    "rag": [
+        "ประวัติการก่อตั้งมหาวิทยาลัย",
+        "ปฏิทินการศึกษาภาคเรียนที่ 1 ปีนี้เริ่มวันไหน",
+        "ค่าเทอมคณะเทคโนโลยีสารสนเทศเท่าไหร่",
+        "ห้องสมุดเปิดกี่โมง",
+        "ยืมหนังสือห้องสมุดได้กี่เล่ม",
+        "ลงทะเบียนเรียนต้องทำอย่างไร",
+    ],
+}
+
+# ข้อความรอของ ReplyDeadline (REPLY_PLACEHOLDER_TEXT ใน app.py) ไม่นับเป็นคำตอบสุดท้าย
+PLACEHOLDER_PREFIX = "KMUTNB Buddy กำลังค้นหาข้อมูล"
+
+LINE_RESPONSE = json.dumps({"sentMessages": [{"id": "1", "quoteToken": "q"}]}).encode()
+GEMINI_RESPONSE = json.dumps({
+    "candidates": [{
+        "content": {"parts": [{"text": "คำตอบจำลองจาก Gemini สำหรับ load test ค่ะ"}], "role": "model"},
+        "finishReason": "STOP",
+        "index": 0,
+    }],
+    "usageMetadata": {"promptTokenCount": 1, "candidatesTokenCount": 1, "totalTokenCount": 2},
+}, ensure_ascii=False).encode()
+
+
+def quantile(samples, q):
+    return samples[min(len(samples) - 1, int(q * len(samples)))] if samples else float("nan")
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive เหมือน API จริง (connection pool ของแอปใช้ซ้ำได้)
+    disable_nagle_algorithm = True
+    latency = 0.0
+
+    def _respond(self, status, body):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class LineStubHandler(StubHandler):
+    """LINE Messaging API จำลอง: จดเวลาที่ได้รับ reply/push ของแต่ละ event"""
+
+    recorder = None
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if self.latency:
+            time.sleep(self.latency)
+        self.recorder.record(self.path, body)
+        self._respond(200, LINE_RESPONSE)
+
+
+class GeminiStubHandler(StubHandler):
+    """Gemini REST API จำลอง (generateContent) สำหรับทั้ง ChatGoogleGenerativeAI และ genai.ChatSession"""
+
+    calls = itertools.count()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if ":generateContent" not in self.path:
+            self._respond(404, b'{"error": {"code": 404, "message": "not implemented in stub"}}')
+            return
+        next(self.calls)
+        if self.latency:
+            time.sleep(self.latency)
+        self._respond(200, GEMINI_RESPONSE)
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.by_token = {}
+        self.by_user = {}
+        self.events = {}  # seq -> dict(branch, sent, answered, deliveries)
+        self.answered = threading.Condition(self.lock)
+        self.unmatched = 0
+
+    def register(self, seq, branch, reply_token, user_id, sent):
+        with self.lock:
+            self.by_token[reply_token] = seq
+            self.by_user[user_id] = seq
+            self.events[seq] = {"branch": branch, "sent": sent, "answered": None, "deliveries": []}
+
+    def record(self, path, body):
+        now = time.perf_counter()
+        with self.lock:
+            if path.endswith("/message/reply"):
+                seq = self.by_token.get(body.get("replyToken"))
+            elif path.endswith("/message/push"):
+                seq = self.by_user.get(body.get("to"))
+            elif path.endswith("/chat/loading/start"):
+                seq = self.by_user.get(body.get("chatId"))
+            else:
+                seq = None
+            if seq is None:
+                self.unmatched += 1
+                return
+            event = self.events[seq]
+            messages = body.get("messages") or [{}]
+            placeholder = "loading" in path or str(messages[0].get("text", "")).startswith(PLACEHOLDER_PREFIX)
+            event["deliveries"].append("placeholder" if placeholder else path.rsplit("/", 1)[-1])
+            if not placeholder:
+                event["answered"] = now
+                self.answered.notify_all()
+
+    def wait_all(self, timeout):
+        deadline = time.perf_counter() + timeout
+        with self.lock:
+            while any(e["answered"] is None for e in self.events.values()):
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    return False
+                self.answered.wait(min(remaining, 0.5))
+        return True
+
+
+def start_stub(handler_cls, latency, **attrs):
+    handler = type(handler_cls.__name__, (handler_cls,), {"latency": latency, **attrs})
+    server = StubServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def server_command(kind, port, workers, threads):
+    if kind == "asgi":
+        return [sys.executable, "-m", "uvicorn", "asgi_app:app", "--host", "127.0.0.1", "--port", str(port),
+                "--workers", str(workers), "--log-level", "warning"], f"uvicorn x{workers}"
+    if importlib.util.find_spec("gunicorn") is not None:
+        return [sys.executable, "-m", "gunicorn", "-w", str(workers), "-k", "gthread", "--threads", str(threads),
+                "-b", f"127.0.0.1:{port}", "app:app"], f"gunicorn {workers}x{threads} gthread"
+    return [sys.executable, "-m", "flask", "--app", "app", "run", "--host", "127.0.0.1", "--port", str(port),
+            "--with-threads", "--no-reload", "--no-debugger"], "flask dev server (threaded)"
+
+
+def wait_ready(port, proc, timeout=300):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            return False
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/ready", timeout=2) as response:
+                if response.status == 200:
+                    return True
+        except OSError:
+            pass
+        time.sleep(0.5)
+    return False
+
+
+def signed_payload(events):
+    body = json.dumps({"destination": "Ubench", "events": events}, ensure_ascii=False).encode("utf-8")
+    signature = base64.b64encode(hmac.new(CHANNEL_SECRET.encode(), body, hashlib.sha256).digest()).decode()
+    return body, signature
+
+
+def message_event(seq, text, reply_token, user_id):
+    return {
+        "type": "message",
+        "mode": "active",
+        "timestamp": int(time.time() * 1000),
+        "source": {"type": "user", "userId": user_id},
+        "webhookEventId": f"01BENCH{seq:016d}",
+        "deliveryContext": {"isRedelivery": False},
+        "replyToken": reply_token,
+        "message": {"id": str(seq), "type": "text", "quoteToken": f"q{seq}", "text": text},
+    }
+
+
+def parse_mix(spec):
+    weights = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in BRANCHES:
+            raise SystemExit(f"Unknown branch '{name}' (choose from {', '.join(BRANCHES)})")
+        weights[name.strip()] = float(weight or 1)
+    return weights
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Webhook load test against app.py / asgi_app.py")
+    parser.add_argument("--server", choices=("flask", "asgi"), default="flask")
+    parser.add_argument("--workers", type=int, default=1, help="server worker processes")
+    parser.add_argument("--threads", type=int, default=8, help="threads per gunicorn worker")
+    parser.add_argument("--rate", type=float, default=10.0, help="events per second")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds of load")
+    parser.add_argument("--events-per-request", type=int, default=1, help="events in one webhook delivery")
+    parser.add_argument("--mix", default="contact=1,dress_code=1,map=1,rag=2", help="branch weights")
+    parser.add_argument("--gemini-latency", type=float, default=1.0, help="seconds per Gemini call")
+    parser.add_argument("--line-latency", type=float, default=0.05, help="seconds per LINE API call")
+    parser.add_argument("--llm", choices=("http", "inprocess"), default=None,
+                        help="RAG LLM: Gemini stand-in over HTTP, or StubChatModel in the app process "
+                             "(default http for flask, inprocess for asgi)")
+    parser.add_argument("--concurrency", type=int, default=64, help="max webhook deliveries in flight")
+    parser.add_argument("--drain-timeout", type=float, default=120.0)
+    parser.add_argument("--with-caches", action="store_true", help="keep answer cache, FAQ store and coalescing on")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    mix = parse_mix(args.mix)
+    recorder = Recorder()
+    line_stub = start_stub(LineStubHandler, args.line_latency, recorder=recorder)
+    gemini_stub = start_stub(GeminiStubHandler, args.gemini_latency)
+
+    port = free_port()
+    workdir = tempfile.mkdtemp(prefix="bench_webhook_")
+    env = dict(os.environ)
+    env.update({
+        "LINE_CHANNEL_SECRET": CHANNEL_SECRET,
+        "LINE_CHANNEL_ACCESS_TOKEN": "bench-token",
+        "LINE_API_ENDPOINT": f"http://127.0.0.1:{line_stub.server_port}",
+        "GEMINI_API_KEY": "bench-key",
+        "GEMINI_API_ENDPOINT": f"http://127.0.0.1:{gemini_stub.server_port}",
+        "RAG_EMBEDDINGS_PROVIDER": "local",
+        "CHROMA_PERSIST_DIRECTORY": os.path.join(workdir, "chroma_db"),
+        "ANONYMIZED_TELEMETRY": "False",
+    })
+    env.setdefault("SESSION_BACKEND", "memory")
+    # google-generativeai ผ่าน REST transport ไม่มี async client จริง (ainvoke จะ block event loop)
+    # asgi จึงใช้ StubChatModel ใน process ของแอปแทน โดยหน่วงเวลาเท่ากับ Gemini จำลอง
+    args.llm = args.llm or ("inprocess" if args.server == "asgi" else "http")
+    if args.llm == "http":
+        env["RAG_LLM_PROVIDER"] = "google"
+    else:
+        env.update({"RAG_LLM_PROVIDER": "stub", "STUB_LLM_LATENCY_SECONDS": str(args.gemini_latency)})
+    if not args.with_caches:
+        env.update({"ANSWER_CACHE_SEMANTIC": "false", "FAQ_STORE_ENABLED": "false",
+                    "ANSWER_COALESCE_TIMEOUT_SECONDS": "0"})
+    command, server_label = server_command(args.server, port, args.workers, args.threads)
+    log_path = os.path.join(workdir, "server.log")
+    with open(log_path, "w") as log:
+        proc = subprocess.Popen(command, cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+    try:
+        if not wait_ready(port, proc):
+            raise SystemExit(f"Server did not become ready, see {log_path}")
+        run_load(args, rng, mix, recorder, port, server_label)
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/stats", timeout=5) as response:
+                stats = json.load(response)
+            print(f"reply paths (server /stats, one worker): {stats['reply_deadline']['paths']}")
+        except OSError as e:
+            print(f"could not read /stats: {e}")
+        print(f"gemini stub calls: {next(GeminiStubHandler.calls)}  unmatched LINE calls: {recorder.unmatched}  "
+              f"server log: {log_path}")
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+def run_load(args, rng, mix, recorder, port, server_label):
+    per_request = max(1, args.events_per_request)
+    deliveries = max(1, int(args.rate * args.duration / per_request))
+    interval = per_request / args.rate
+    branches = list(mix)
+    weights = [mix[name] for name in branches]
+    seq_counter = itertools.count()
+    acks = []
+    ack_errors = []
+    ack_lock = threading.Lock()
+
+    def deliver(index, start):
+        # open-loop: ส่งตามเวลาที่กำหนดไว้ ไม่รอให้ request ก่อนหน้าเสร็จ
+        delay = start + index * interval - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        events = []
+        for _ in range(per_request):
+            seq = next(seq_counter)
+            branch = rng.choices(branches, weights)[0]
+            text = rng.choice(BRANCHES[branch])
+            if not args.with_caches:
+                text = f"{text} #{seq}"
+            reply_token, user_id = f"rt{seq:08d}", f"Ubench{seq:08d}"
+            events.append(message_event(seq, text, reply_token, user_id))
+            recorder.register(seq, branch, reply_token, user_id, time.perf_counter())
+        body, signature = signed_payload(events)
+        t0 = time.perf_counter()
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=120)
+            conn.request("POST", "/callback", body=body,
+                         headers={"Content-Type": "application/json", "X-Line-Signature": signature})
+            status = conn.getresponse().status
+            conn.close()
+        except OSError as e:
+            status = repr(e)
+        with ack_lock:
+            if status == 200:
+                acks.append(time.perf_counter() - t0)
+            else:
+                ack_errors.append(status)
+
+    print(f"server={server_label} rate={args.rate}/s duration={args.duration}s events/request={per_request} "
+          f"gemini={args.gemini_latency}s ({args.llm}) line={args.line_latency}s caches={'on' if args.with_caches else 'off'}")
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        for i in range(deliveries):
+            pool.submit(deliver, i, start)
+    sent_seconds = time.perf_counter() - start
+    complete = recorder.wait_all(args.drain_timeout)
+    elapsed = time.perf_counter() - start
+
+    acks.sort()
+    print(f"sent {deliveries} deliveries in {sent_seconds:.1f}s; ack n={len(acks)} errors={len(ack_errors)} "
+          f"p50={quantile(acks, 0.5) * 1000:.1f} p95={quantile(acks, 0.95) * 1000:.1f} "
+          f"p99={quantile(acks, 0.99) * 1000:.1f} ms" + (f" first error: {ack_errors[0]}" if ack_errors else ""))
+
+    events = list(recorder.events.values())
+    answered = [e for e in events if e["answered"] is not None]
+    last = max((e["answered"] for e in answered), default=start)
+    print(f"answered {len(answered)}/{len(events)}{'' if complete else ' (drain timeout)'} "
+          f"throughput={len(answered) / max(1e-9, last - start):.1f} events/s (wall {elapsed:.1f}s)")
+
+    print(f"{'branch':<12}{'n':>6}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}  (ms, webhook sent -> final answer)")
+    for name in list(BRANCHES) + ["all"]:
+        latencies = sorted(
+            (e["answered"] - e["sent"]) * 1000 for e in answered if name == "all" or e["branch"] == name
+        )
+        if not latencies:
+            continue
+        print(f"{name:<12}{len(latencies):>6}{quantile(latencies, 0.5):>10.1f}{quantile(latencies, 0.95):>10.1f}"
+              f"{quantile(latencies, 0.99):>10.1f}{latencies[-1]:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""สร้างคำตอบของคำถามที่พบบ่อยล่วงหน้า (รันแบบ offline ทุกครั้งที่ kmutnbBuddy.md เปลี่ยน)
+
+รัน: python build_faq_store.py [--questions faq_questions.json] [--workers 4]
+ส่งทุกคำถามใน faq_questions.json เข้า RAG chain จาก setup_rag_chain พร้อมกันหลาย thread
+แล้วเขียนคำตอบลง faq_store/faq-<hash ของเอกสาร>.json ซึ่ง rag_handler โหลดตอนเริ่ม process
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+import rag_handler  # noqa: E402
+from faq_store import artifact_path, source_hash, write_artifact  # noqa: E402
+from providers import EMBEDDINGS_PROVIDER, LLM_PROVIDER  # noqa: E402
+
+logger = logging.getLogger("build_faq_store")
+
+# คำตอบแบบนี้ไม่ควรถูกตรึงไว้ใน store (ให้ runtime ลอง retrieval/Gemini เองดีกว่า)
+NO_ANSWER_PREFIX = "ขออภัยค่ะ KMUTNB Buddy ยังไม่สามารถตอบคำถามนี้ได้"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute FAQ answers for the current knowledge base")
+    parser.add_argument("--source", default="kmutnbBuddy.md")
+    parser.add_argument("--questions", default="faq_questions.json")
+    parser.add_argument("--out-dir", default=rag_handler.FAQ_STORE_DIR)
+    parser.add_argument("--workers", type=int, default=int(os.getenv("FAQ_BUILD_WORKERS", "4")))
+    args = parser.parse_args()
+
+    with open(args.questions, encoding="utf-8") as f:
+        curated = json.load(f)
+    kb_version = source_hash(args.source)
+
+    start = time.perf_counter()
+    chain = rag_handler.setup_rag_chain(args.source)
+    setup_seconds = time.perf_counter() - start
+
+    def answer(item):
+        t0 = time.perf_counter()
+        try:
+            return item, chain.invoke({"input": item["question"]})["answer"], None, time.perf_counter() - t0
+        except Exception as e:
+            return item, None, e, time.perf_counter() - t0
+
+    entries = []
+    failed = 0
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        for item, text, error, seconds in pool.map(answer, curated):
+            if error is not None:
+                failed += 1
+                logger.error(f"Failed: {item['question']} ({error})")
+            elif not text or not text.strip() or text.strip().startswith(NO_ANSWER_PREFIX):
+                failed += 1
+                logger.warning(f"No answer in the document, skipped: {item['question']}")
+            else:
+                entries.append({"question": item["question"], "aliases": item.get("aliases", []), "answer": text.strip()})
+                logger.info(f"Answered in {seconds:.2f}s: {item['question']}")
+    answer_seconds = time.perf_counter() - start
+
+    path = artifact_path(args.out_dir, kb_version)
+    write_artifact(path, kb_version, entries, meta={
+        "source": os.path.basename(args.source),
+        "llm_provider": LLM_PROVIDER,
+        "embeddings_provider": EMBEDDINGS_PROVIDER,
+    })
+    print(f"{len(entries)}/{len(curated)} answers written to {path} ({os.path.getsize(path)} bytes); "
+          f"setup {setup_seconds:.1f}s, answers {answer_seconds:.1f}s with {args.workers} workers")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,172 @@
+import logging
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """เรียก upstream ไม่ได้เพราะ circuit เปิดอยู่ (ผู้เรียกควรตอบแบบ degraded ทันที)"""
+
+
+class CircuitBreaker:
+    """circuit breaker ตามสัดส่วน error / call ที่ช้าเกินใน window ของ call ล่าสุด
+
+    closed: เรียกได้ตามปกติ ถ้าใน window_size call ล่าสุด (อย่างน้อย min_calls) มี error หรือ call ที่ช้ากว่า
+    slow_call_seconds เกิน failure_rate / slow_call_rate -> open
+    open: ปฏิเสธทุก call ทันที (CircuitOpenError) เป็นเวลา open_seconds แล้วเปลี่ยนเป็น half_open
+    half_open: ปล่อย probe ได้ครั้งละ half_open_max_calls ถ้า probe สำเร็จและไม่ช้า -> closed, ไม่เช่นนั้น -> open อีกรอบ
+    """
+
+    def __init__(self, name: str, window_size: int = 20, min_calls: int = 5, failure_rate: float = 0.5,
+                 slow_call_seconds: float = 15.0, slow_call_rate: float = 0.5, open_seconds: float = 30.0,
+                 half_open_max_calls: int = 1, enabled: bool = True):
+        self.name = name
+        self.window_size = max(1, window_size)
+        self.min_calls = max(1, min(min_calls, self.window_size))
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate = slow_call_rate
+        self.open_seconds = open_seconds
+        self.half_open_max_calls = max(1, half_open_max_calls)
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._window = deque(maxlen=self.window_size)  # (failed, slow) ของแต่ละ call
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+
+        # --- สถิติสำหรับ /stats ---
+        self._calls = 0
+        self._failures = 0
+        self._slow_calls = 0
+        self._rejected = 0
+        self._times_opened = 0
+        self._last_open_reason = None
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state(time.monotonic())
+
+    def _current_state(self, now: float) -> str:
+        if self._state == OPEN and now - self._opened_at >= self.open_seconds:
+            self._state = HALF_OPEN
+            self._probes_in_flight = 0
+            logger.info(f"Circuit '{self.name}' half-open, probing upstream")
+        return self._state
+
+    def _acquire(self) -> bool:
+        """คืน True ถ้า call นี้เป็น probe ของ half_open, raise CircuitOpenError ถ้าเรียกไม่ได้"""
+        if not self.enabled:
+            return False
+        with self._lock:
+            state = self._current_state(time.monotonic())
+            if state == CLOSED:
+                return False
+            if state == HALF_OPEN and self._probes_in_flight < self.half_open_max_calls:
+                self._probes_in_flight += 1
+                return True
+            self._rejected += 1
+        raise CircuitOpenError(f"circuit '{self.name}' is {state}")
+
+    def _record(self, probe: bool, failed: bool, duration: float):
+        if not self.enabled:
+            return
+        slow = duration >= self.slow_call_seconds
+        with self._lock:
+            self._calls += 1
+            self._failures += failed
+            self._slow_calls += slow
+            if probe:
+                self._probes_in_flight = max(0, self._probes_in_flight - 1)
+                if failed or slow:
+                    self._trip(time.monotonic(), "probe failed" if failed else f"probe took {duration:.1f}s")
+                elif self._state == HALF_OPEN:
+                    self._state = CLOSED
+                    self._window.clear()
+                    logger.info(f"Circuit '{self.name}' closed, upstream recovered")
+                return
+            if self._state != CLOSED:
+                return
+            self._window.append((failed, slow))
+            if len(self._window) < self.min_calls:
+                return
+            n = len(self._window)
+            failure_ratio = sum(f for f, _ in self._window) / n
+            slow_ratio = sum(s for _, s in self._window) / n
+            if failure_ratio >= self.failure_rate:
+                self._trip(time.monotonic(), f"{failure_ratio:.0%} of the last {n} calls failed")
+            elif slow_ratio >= self.slow_call_rate:
+                self._trip(time.monotonic(), f"{slow_ratio:.0%} of the last {n} calls took >= {self.slow_call_seconds}s")
+
+    def _trip(self, now: float, reason: str):
+        self._state = OPEN
+        self._opened_at = now
+        self._window.clear()
+        self._times_opened += 1
+        self._last_open_reason = reason
+        logger.warning(f"Circuit '{self.name}' opened for {self.open_seconds}s: {reason}")
+
+    def _release(self, probe: bool):
+        # call ถูกยกเลิก (เช่น asyncio.CancelledError): ไม่นับผล แต่คืนสิทธิ์ probe
+        if probe:
+            with self._lock:
+                self._probes_in_flight = max(0, self._probes_in_flight - 1)
+
+    def call(self, func, *args, **kwargs):
+        """เรียก func ผ่าน breaker: raise CircuitOpenError ทันทีถ้า circuit เปิด, exception ของ func นับเป็น failure"""
+        probe = self._acquire()
+        start = time.monotonic()
+        try:
+            result = func(*args, **kwargs)
+        except Exception:
+            self._record(probe, True, time.monotonic() - start)
+            raise
+        except BaseException:
+            self._release(probe)
+            raise
+        self._record(probe, False, time.monotonic() - start)
+        return result
+
+    async def call_async(self, func, *args, **kwargs):
+        probe = self._acquire()
+        start = time.monotonic()
+        try:
+            result = await func(*args, **kwargs)
+        except Exception:
+            self._record(probe, True, time.monotonic() - start)
+            raise
+        except BaseException:
+            self._release(probe)
+            raise
+        self._record(probe, False, time.monotonic() - start)
+        return result
+
+    def stats(self) -> dict:
+        with self._lock:
+            now = time.monotonic()
+            state = self._current_state(now)
+            n = len(self._window)
+            return {
+                "enabled": self.enabled,
+                "state": state,
+                "open_seconds_left": round(max(0.0, self.open_seconds - (now - self._opened_at)), 1)
+                if state == OPEN else 0.0,
+                "window_calls": n,
+                "window_failure_rate": round(sum(f for f, _ in self._window) / n, 3) if n else 0.0,
+                "window_slow_rate": round(sum(s for _, s in self._window) / n, 3) if n else 0.0,
+                "calls": self._calls,
+                "failures": self._failures,
+                "slow_calls": self._slow_calls,
+                "rejected": self._rejected,
+                "times_opened": self._times_opened,
+                "last_open_reason": self._last_open_reason,
+                "failure_rate_threshold": self.failure_rate,
+                "slow_call_seconds": self.slow_call_seconds,
+            }
@@ -1,4 +1,6 @@
 # contact_data.py
+from collections import namedtuple
+from keyword_matcher import KeywordMatcher
 
 contact_info_db = {
     "คณะวิทยาศาสตร์ประยุกต์": {
@@ -163,4 +165,34 @@ contact_info_db = {
             "รศ. ธีรพล เดโชเกียรติถวัลย์": {"ตำแหน่ง": "อาจารย์", "เบอร์โทร": None, "อีเมล": "teerapon.d@eng.kmutnb.ac.th"},
         }
     }
-}
\ No newline at end of file
+}
+
+# --- Compile รายชื่อคณะ/บุคลากรเป็น automaton ครั้งเดียวตอนเริ่มโปรแกรม ---
+
+# kind = "dept" หรือ "person", order = ลำดับใน contact_info_db (ใช้ตัดสินเมื่อเจอหลายรายการ)
+ContactHit = namedtuple("ContactHit", ["kind", "dept_name", "person_name", "start", "end", "dept_order", "person_order"])
+
+
+def build_contact_matcher(db):
+    matcher = KeywordMatcher()
+    for dept_order, (dept_name, dept_data) in enumerate(db.items()):
+        for keyword in dept_data["keywords"]:
+            matcher.add(keyword, ("dept", dept_name, None, dept_order, -1))
+        for person_order, person_name in enumerate(dept_data.get("บุคลากร", {})):
+            matcher.add(person_name, ("person", dept_name, person_name, dept_order, person_order))
+    return matcher.build()
+
+
+CONTACT_MATCHER = build_contact_matcher(contact_info_db)
+
+
+def find_contact_mentions(message: str, matcher=None):
+    """อ่านข้อความรอบเดียว คืน (คณะที่เจอ, บุคลากรที่เจอ) เป็น list ของ ContactHit เรียงตามลำดับใน db"""
+    matcher = matcher or CONTACT_MATCHER
+    departments, people = [], []
+    for start, end, (kind, dept_name, person_name, dept_order, person_order) in matcher.find_all(message):
+        hit = ContactHit(kind, dept_name, person_name, start, end, dept_order, person_order)
+        (departments if kind == "dept" else people).append(hit)
+    departments.sort(key=lambda h: (h.dept_order, h.start))
+    people.sort(key=lambda h: (h.dept_order, h.person_order, h.start))
+    return departments, people
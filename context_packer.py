@@ -0,0 +1,156 @@
+import logging
+import re
+import threading
+
+from langchain_core.documents import Document
+
+logger = logging.getLogger(__name__)
+
+_WS_RE = re.compile(r"\s+")
+
+
+def estimate_tokens(text: str, chars_per_token: float = 3.0) -> int:
+    """ประมาณจำนวน token จากจำนวนตัวอักษร (ไม่ต้องเรียก tokenizer ของโมเดล)"""
+    return int(len(text) / chars_per_token + 0.5) if text else 0
+
+
+def _overlap_length(left: str, right: str, max_overlap: int) -> int:
+    """ความยาวของส่วนท้าย left ที่ซ้ำกับส่วนต้น right (overlap ที่ text splitter ใส่ไว้)"""
+    for size in range(min(len(left), len(right), max_overlap), 0, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+def _shingles(text: str, size: int = 5) -> set:
+    text = _WS_RE.sub(" ", text.lower()).strip()
+    if len(text) <= size:
+        return {text} if text else set()
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+class ContextPacker:
+    """จัด context ก่อนส่งเข้า prompt ของ stuff-documents chain
+
+    1. รวม chunk ที่อยู่ติดกันในหัวข้อเดียวกันเป็นก้อนเดียว และตัดข้อความ overlap ที่ซ้ำออก
+    2. ตัดก้อนที่เนื้อหาเกือบซ้ำกับก้อนที่เลือกไปแล้ว (สัดส่วน character shingle ที่ซ้ำกัน เทียบกับก้อนที่เล็กกว่า)
+    3. ใส่ก้อนเรียงตามอันดับจาก retriever จนกว่าจะเต็ม token_budget (ก้อนที่ใส่ไม่พอดีจะถูกข้าม)
+    """
+
+    def __init__(self, token_budget: int = 2000, duplicate_threshold: float = 0.8,
+                 chars_per_token: float = 3.0, max_overlap: int = 400):
+        self.token_budget = token_budget
+        self.duplicate_threshold = duplicate_threshold
+        self.chars_per_token = chars_per_token
+        self.max_overlap = max_overlap
+        self._positions = {}
+        self._lock = threading.Lock()
+
+        self.requests = 0
+        self.tokens_in = 0
+        self.tokens_out = 0
+        self.chunks_merged = 0
+        self.duplicates_dropped = 0
+        self.budget_dropped = 0
+
+    def index_documents(self, splits):
+        """จำลำดับของ chunk ในเอกสาร (ใช้ตรวจว่า chunk ไหนอยู่ติดกัน) ต้องเรียกทุกครั้งที่สร้าง index ใหม่"""
+        self._positions = {doc.metadata["chunk_id"]: i for i, doc in enumerate(splits) if "chunk_id" in doc.metadata}
+
+    def _merge_adjacent(self, docs):
+        """จัดกลุ่ม chunk ที่ติดกันในหัวข้อเดียวกัน คืน list ของกลุ่ม เรียงตามอันดับดีที่สุดของสมาชิก"""
+        positions = self._positions
+        placed = {}
+        groups = []
+        for rank, doc in enumerate(docs):
+            position = positions.get(doc.metadata.get("chunk_id"))
+            groups.append({"rank": rank, "docs": [(position, doc)]})
+            if position is not None:
+                placed[position] = groups[-1]
+        # รวมกลุ่มของ chunk ที่ตำแหน่งติดกันและ header path เดียวกัน
+        for position in sorted(placed):
+            previous = placed.get(position - 1)
+            current = placed[position]
+            if previous is None or previous is current:
+                continue
+            if previous["docs"][-1][1].metadata.get("header_path") != current["docs"][0][1].metadata.get("header_path"):
+                continue
+            previous["docs"].extend(current["docs"])
+            previous["rank"] = min(previous["rank"], current["rank"])
+            for member_position, _ in current["docs"]:
+                placed[member_position] = previous
+            current["docs"] = []
+        return sorted((group for group in groups if group["docs"]), key=lambda group: group["rank"])
+
+    def _group_document(self, group) -> Document:
+        members = [doc for _, doc in group["docs"]]
+        text = members[0].page_content
+        for doc in members[1:]:
+            overlap = _overlap_length(text, doc.page_content, self.max_overlap)
+            text = text + ("" if overlap else "\n") + doc.page_content[overlap:]
+        metadata = dict(members[0].metadata)
+        if len(members) > 1:
+            metadata["chunk_ids"] = [doc.metadata.get("chunk_id") for doc in members]
+        return Document(page_content=text, metadata=metadata)
+
+    def pack(self, docs):
+        """คืน list ของ Document ที่รวม/ตัดซ้ำแล้ว และมีขนาดรวมไม่เกิน token_budget"""
+        tokens_in = sum(estimate_tokens(doc.page_content, self.chars_per_token) for doc in docs)
+        groups = self._merge_adjacent(docs)
+        merged = len(docs) - len(groups)
+
+        packed = []
+        kept_shingles = []
+        used = 0
+        duplicates = 0
+        over_budget = 0
+        for group in groups:
+            block = self._group_document(group)
+            shingles = _shingles(block.page_content)
+            if any(
+                len(shingles & kept) / max(1, min(len(shingles), len(kept))) >= self.duplicate_threshold
+                for kept in kept_shingles
+            ):
+                duplicates += 1
+                continue
+            tokens = estimate_tokens(block.page_content, self.chars_per_token)
+            if used + tokens > self.token_budget:
+                if packed:
+                    # ก้อนนี้ไม่พอดี แต่ก้อนอันดับถัดไปที่เล็กกว่าอาจยังใส่ได้
+                    over_budget += 1
+                    continue
+                # ก้อนแรก (อันดับดีที่สุด) ต้องได้ใส่เสมอ: ตัดให้พอดีกับ budget
+                block.page_content = block.page_content[:int(self.token_budget * self.chars_per_token)]
+                tokens = estimate_tokens(block.page_content, self.chars_per_token)
+            packed.append(block)
+            kept_shingles.append(shingles)
+            used += tokens
+
+        with self._lock:
+            self.requests += 1
+            self.tokens_in += tokens_in
+            self.tokens_out += used
+            self.chunks_merged += merged
+            self.duplicates_dropped += duplicates
+            self.budget_dropped += over_budget
+        logger.info(
+            "Context packed: %d chunks -> %d blocks, ~%d -> ~%d tokens "
+            "(saved ~%d; merged %d, duplicates %d, over budget %d)",
+            len(docs), len(packed), tokens_in, used, tokens_in - used, merged, duplicates, over_budget,
+            extra={"category": "message"},
+        )
+        return packed
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "token_budget": self.token_budget,
+                "requests": self.requests,
+                "tokens_in": self.tokens_in,
+                "tokens_out": self.tokens_out,
+                "tokens_saved": self.tokens_in - self.tokens_out,
+                "tokens_saved_ratio": round(1 - self.tokens_out / self.tokens_in, 4) if self.tokens_in else 0.0,
+                "chunks_merged": self.chunks_merged,
+                "duplicates_dropped": self.duplicates_dropped,
+                "budget_dropped": self.budget_dropped,
+            }
@@ -0,0 +1,122 @@
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+logger = logging.getLogger(__name__)
+
+
+def is_rate_limit_error(exc: Exception) -> bool:
+    """ตรวจว่า error มาจากการโดนจำกัดอัตรา (HTTP 429 / ResourceExhausted / quota)"""
+    status = getattr(exc, "code", None) or getattr(exc, "status_code", None)
+    if callable(status):
+        try:
+            status = status()
+        except Exception:
+            status = None
+    if status == 429 or getattr(status, "value", None) == 429:
+        return True
+    text = f"{type(exc).__name__} {exc}".lower()
+    return any(marker in text for marker in ("429", "resourceexhausted", "resource exhausted", "rate limit", "quota"))
+
+
+class AdaptiveConcurrency:
+    """จำกัดจำนวน request ที่ยิงพร้อมกันแบบปรับได้ (AIMD)
+
+    โดน rate limit -> ลดครึ่ง, สำเร็จต่อเนื่องครบ limit ครั้ง -> เพิ่มทีละ 1 จนถึง max_limit
+    """
+
+    def __init__(self, max_limit: int):
+        self.max_limit = max(1, max_limit)
+        self.limit = self.max_limit
+        self._active = 0
+        self._successes = 0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            while self._active >= self.limit:
+                self._cond.wait()
+            self._active += 1
+
+    def release(self, rate_limited: bool = False):
+        with self._cond:
+            self._active -= 1
+            if rate_limited:
+                self.limit = max(1, self.limit // 2)
+                self._successes = 0
+            else:
+                self._successes += 1
+                if self._successes >= self.limit and self.limit < self.max_limit:
+                    self.limit += 1
+                    self._successes = 0
+            self._cond.notify_all()
+
+
+def ingest_documents(vectorstore, docs, ids, embeddings=None, batch_size: int = 32, workers: int = 4,
+                     max_retries: int = 6, base_delay: float = 1.0, max_delay: float = 60.0):
+    """embed เอกสารเป็น batch ด้วย thread pool แล้วเขียนลง Chroma ทีละ batch ที่เสร็จ
+
+    - batch ที่โดน rate limit จะรอแบบ exponential backoff + jitter และลด concurrency ลง
+    - ทุก batch ที่เสร็จถูก upsert ลง collection ทันที จึงทำหน้าที่เป็น checkpoint:
+      ถ้า build ถูกขัดจังหวะ การ sync ครั้งถัดไปจะเห็นว่า id เหล่านั้นมีอยู่แล้วและไม่ embed ซ้ำ
+    คืน dict สถิติ (จำนวน chunk, batch ที่ล้มเหลว, retry, chunks/sec)
+    """
+    embeddings = embeddings or vectorstore.embeddings
+    collection = vectorstore._collection
+    batches = [(docs[i:i + batch_size], ids[i:i + batch_size]) for i in range(0, len(docs), batch_size)]
+    limiter = AdaptiveConcurrency(workers)
+    write_lock = threading.Lock()
+    stats = {"chunks": len(docs), "batches": len(batches), "embedded": 0, "failed_batches": 0,
+             "retries": 0, "rate_limited": 0}
+    stats_lock = threading.Lock()
+    start = time.perf_counter()
+
+    def run_batch(batch_docs, batch_ids):
+        texts = [doc.page_content for doc in batch_docs]
+        for attempt in range(max_retries + 1):
+            limiter.acquire()
+            try:
+                vectors = embeddings.embed_documents(texts)
+            except Exception as e:
+                rate_limited = is_rate_limit_error(e)
+                limiter.release(rate_limited)
+                if attempt >= max_retries:
+                    raise
+                delay = min(max_delay, base_delay * (2 ** attempt)) * (0.5 + random.random() / 2)
+                with stats_lock:
+                    stats["retries"] += 1
+                    stats["rate_limited"] += int(rate_limited)
+                logger.warning(f"Embedding batch failed ({'rate limited' if rate_limited else e}), "
+                               f"retry {attempt + 1}/{max_retries} in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+            limiter.release()
+            with write_lock:
+                collection.upsert(
+                    ids=list(batch_ids),
+                    embeddings=vectors,
+                    metadatas=[doc.metadata for doc in batch_docs],
+                    documents=texts,
+                )
+            return len(batch_ids)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="embed") as executor:
+        futures = [executor.submit(run_batch, batch_docs, batch_ids) for batch_docs, batch_ids in batches]
+        for future in as_completed(futures):
+            try:
+                done = future.result()
+            except Exception as e:
+                stats["failed_batches"] += 1
+                logger.error(f"Embedding batch gave up after {max_retries} retries: {e}")
+                continue
+            stats["embedded"] += done
+            logger.info(f"Embedded {stats['embedded']}/{len(docs)} chunks "
+                        f"({stats['embedded'] / max(time.perf_counter() - start, 1e-9):.1f} chunks/sec)")
+
+    elapsed = time.perf_counter() - start
+    stats["seconds"] = round(elapsed, 3)
+    stats["chunks_per_sec"] = round(stats["embedded"] / elapsed, 2) if elapsed > 0 else 0.0
+    stats["final_concurrency"] = limiter.limit
+    return stats
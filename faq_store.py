@@ -0,0 +1,112 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+from answer_cache import normalize_question
+
+logger = logging.getLogger(__name__)
+
+FAQ_STORE_FORMAT = 1
+
+
+def source_hash(file_path: str) -> str:
+    """sha256 ของเนื้อหาเอกสาร (ค่าเดียวกับ kb_version ใน rag_handler.setup_rag_chain)"""
+    with open(file_path, encoding="utf-8") as f:
+        return hashlib.sha256(f.read().encode("utf-8")).hexdigest()
+
+
+def artifact_path(store_dir: str, kb_version: str) -> str:
+    """ไฟล์คำตอบของเอกสารเวอร์ชันนี้ (เอกสารเปลี่ยน = ชื่อไฟล์เปลี่ยน ไฟล์เก่าจะไม่ถูกโหลดอีก)"""
+    return os.path.join(store_dir, f"faq-{kb_version[:16]}.json")
+
+
+def write_artifact(path: str, kb_version: str, entries, meta=None):
+    """เขียน artifact แบบ atomic (เขียนไฟล์ชั่วคราวแล้ว rename) entries = list ของ dict question/aliases/answer"""
+    payload = {
+        "format": FAQ_STORE_FORMAT,
+        "kb_version": kb_version,
+        "generated_at": int(time.time()),
+        **(meta or {}),
+        "entries": entries,
+    }
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp_path, path)
+
+
+class FaqStore:
+    """คำตอบของคำถามที่พบบ่อยที่สร้างไว้ล่วงหน้า (ดู build_faq_store.py) จับคู่ด้วยคำถามที่ normalize แล้วแบบตรงตัว
+
+    โหลดเฉพาะ artifact ที่ kb_version ตรงกับเอกสารปัจจุบัน คำถามที่ไม่อยู่ใน store จะไปที่ cache/retrieval/LLM ตามปกติ
+    """
+
+    def __init__(self):
+        self.kb_version = None
+        self.path = None
+        self._answers = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def load(self, store_dir: str, kb_version: str) -> bool:
+        """โหลด artifact ของ kb_version คืน False (และล้าง store) ถ้าไม่มีไฟล์หรือไฟล์ไม่ตรงเวอร์ชัน"""
+        path = artifact_path(store_dir, kb_version)
+        answers = {}
+        try:
+            with open(path, encoding="utf-8") as f:
+                payload = json.load(f)
+            if payload.get("format") != FAQ_STORE_FORMAT or payload.get("kb_version") != kb_version:
+                raise ValueError("artifact does not match the current document")
+            for entry in payload["entries"]:
+                for question in [entry["question"]] + entry.get("aliases", []):
+                    answers.setdefault(normalize_question(question), entry["answer"])
+        except FileNotFoundError:
+            logger.info(f"No FAQ store for document version {kb_version[:16]} at {path}")
+            path, answers = None, {}
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Ignoring FAQ store {path}: {e}")
+            path, answers = None, {}
+
+        with self._lock:
+            self.kb_version = kb_version if answers else None
+            self.path = path
+            self._answers = answers
+        if answers:
+            logger.info(f"FAQ store loaded from {path}: {len(answers)} question forms")
+        return bool(answers)
+
+    def check_version(self, kb_version: str):
+        """เอกสารถูกแก้หลังโหลด store: คำตอบเดิมอาจผิด จึงล้างทิ้ง"""
+        with self._lock:
+            if self._answers and self.kb_version != kb_version:
+                logger.warning("Document changed since the FAQ store was built, FAQ answers disabled.")
+                self._answers = {}
+                self.kb_version = None
+
+    def peek(self, question: str) -> bool:
+        """มีคำตอบสำเร็จรูปของคำถามนี้หรือไม่ (ไม่นับ hit/miss)"""
+        return normalize_question(question) in self._answers
+
+    def lookup(self, question: str):
+        answer = self._answers.get(normalize_question(question))
+        with self._lock:
+            if answer is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return answer
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "loaded": bool(self._answers),
+                "kb_version": self.kb_version[:16] if self.kb_version else None,
+                "question_forms": len(self._answers),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
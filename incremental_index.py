@@ -0,0 +1,111 @@
+import hashlib
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILENAME = "index_manifest.json"
+MANIFEST_FORMAT_VERSION = 1
+HEADER_KEYS = ("Header 1", "Header 2", "Header 3")
+
+
+def header_path(doc) -> str:
+    """เส้นทาง header ของ chunk เช่น 'บทที่ 1 > ภาพรวมมหาวิทยาลัย > 1.2 ข้อมูลการติดต่อ...'"""
+    return " > ".join(doc.metadata[key] for key in HEADER_KEYS if doc.metadata.get(key))
+
+
+def assign_chunk_ids(splits):
+    """ใส่ chunk_id ที่คงที่ให้ทุก chunk: hash ของ header path + เนื้อหา
+
+    chunk ที่เนื้อหาไม่เปลี่ยนจะได้ id เดิมเสมอ แม้ตำแหน่งในเอกสารจะเลื่อนไป
+    chunk ที่ซ้ำกันทุกตัวอักษรจะต่อท้ายด้วยลำดับ (-1, -2, ...) เพื่อไม่ให้ id ชนกัน
+    """
+    seen = {}
+    for doc in splits:
+        path = header_path(doc)
+        digest = hashlib.sha256(f"{path}\x1f{doc.page_content}".encode("utf-8")).hexdigest()[:32]
+        occurrence = seen.get(digest, 0)
+        seen[digest] = occurrence + 1
+        doc.metadata["chunk_id"] = digest if occurrence == 0 else f"{digest}-{occurrence}"
+        doc.metadata["header_path"] = path
+    return splits
+
+
+def load_manifest(persist_directory: str):
+    path = os.path.join(persist_directory, MANIFEST_FILENAME)
+    try:
+        with open(path, encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get("format_version") != MANIFEST_FORMAT_VERSION:
+        return None
+    return manifest
+
+
+def write_manifest(persist_directory: str, manifest: dict):
+    os.makedirs(persist_directory, exist_ok=True)
+    path = os.path.join(persist_directory, MANIFEST_FILENAME)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, path)
+
+
+def sync_vectorstore(vectorstore, splits, persist_directory: str, source_file: str, source_sha256: str,
+                     add_documents=None):
+    """ทำให้ vector store มี chunk ตรงกับ splits ปัจจุบัน โดย embed เฉพาะ chunk ที่เพิ่ม/เปลี่ยน
+
+    add_documents(vectorstore, docs, ids) ใช้แทน vectorstore.add_documents ได้ (เช่น embedding_ingest)
+    ถ้าคืน dict ที่มี failed_batches > 0 จะไม่เขียน manifest เพื่อให้ครั้งถัดไป sync ส่วนที่ขาดต่อ
+    คืน dict สรุปจำนวน chunk ที่เพิ่ม/ลบ/คงเดิม และเวลาที่ใช้
+    """
+    start = time.perf_counter()
+    wanted = {doc.metadata["chunk_id"]: doc for doc in splits}
+
+    manifest = load_manifest(persist_directory)
+    if manifest and manifest.get("source_sha256") == source_sha256 and set(manifest.get("chunks", {})) == set(wanted):
+        # เอกสารไม่เปลี่ยนตั้งแต่ index ครั้งล่าสุด
+        existing = set(wanted)
+    else:
+        existing = set(vectorstore.get(include=[])["ids"])
+
+    to_delete = [chunk_id for chunk_id in existing if chunk_id not in wanted]
+    to_add = [chunk_id for chunk_id in wanted if chunk_id not in existing]
+
+    if to_delete:
+        logger.info(f"Deleting {len(to_delete)} removed/changed chunks from vector store")
+        vectorstore.delete(ids=to_delete)
+    if to_add:
+        logger.info(f"Embedding {len(to_add)} new/changed chunks (of {len(wanted)})")
+        docs = [wanted[chunk_id] for chunk_id in to_add]
+        if add_documents is None:
+            vectorstore.add_documents(docs, ids=to_add)
+            ingest = None
+        else:
+            ingest = add_documents(vectorstore, docs, to_add)
+
+    result = {
+        "added": len(to_add),
+        "deleted": len(to_delete),
+        "unchanged": len(wanted) - len(to_add),
+        "seconds": round(time.perf_counter() - start, 3),
+    }
+    if to_add and ingest:
+        result["ingest"] = ingest
+        if ingest.get("failed_batches"):
+            logger.warning(f"Vector store sync incomplete, manifest not updated: {result}")
+            return result
+    write_manifest(persist_directory, {
+        "format_version": MANIFEST_FORMAT_VERSION,
+        "source_file": source_file,
+        "source_sha256": source_sha256,
+        "built_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "chunk_count": len(wanted),
+        "last_sync": result,
+        "chunks": {chunk_id: doc.metadata["header_path"] for chunk_id, doc in wanted.items()},
+    })
+    logger.info(f"Vector store sync complete: {result}")
+    return result
@@ -0,0 +1,88 @@
+import threading
+import time
+from collections import namedtuple
+
+from keyword_matcher import KeywordMatcher
+
+# --- ตารางกำหนด intent (ลำดับในตาราง = ลำดับความสำคัญ เหมือน if/elif เดิม) ---
+# exact: ข้อความทั้งหมดต้องตรงกับคำนี้, prefix: ข้อความขึ้นต้นด้วยคำนี้, contains: มีคำนี้อยู่ที่ใดก็ได้
+INTENT_TABLE = [
+    {"name": "greeting", "exact": ["สวัสดี", "นี่ใคร"], "prefix": ["สวัสดี"]},
+    {"name": "contact", "contains": ["เบอร์โทร", "โทรศัพท์", "ติดต่อ", "อีเมล", "email", "ช่องทางติดต่อ", "เบอร์", "อาจารย์", "บุคลากร"]},
+    {"name": "dress_code", "contains": ["การแต่งกาย"]},
+    {"name": "map", "contains": ["แผนที่"]},
+    {"name": "farewell", "contains": ["ขอบคุณ", "พอแล้ว", "จบการสนทนา", "บาย", "ไปละ"]},
+]
+
+RouteResult = namedtuple("RouteResult", ["intent", "handler", "elapsed_ms"])
+
+
+class IntentRouter:
+    """Router แบบ table-driven: keyword ของทุก intent ถูก compile เป็น automaton เดียว
+
+    ลงทะเบียนฟังก์ชันจัดการด้วย @router.handler("ชื่อ intent")
+    route() อ่านข้อความรอบเดียวแล้วเลือก intent ที่มีลำดับความสำคัญสูงสุดที่ match
+    """
+
+    def __init__(self, table=None):
+        self.table = list(table if table is not None else INTENT_TABLE)
+        self._handlers = {}
+        self._matcher = None
+        self._lock = threading.Lock()
+        self._counts = {}
+        self._route_time_total = 0.0
+        self._routes = 0
+
+    def handler(self, intent_name: str):
+        if intent_name not in {spec["name"] for spec in self.table}:
+            raise ValueError(f"Unknown intent '{intent_name}'")
+
+        def decorator(func):
+            self._handlers[intent_name] = func
+            return func
+        return decorator
+
+    def compile(self):
+        matcher = KeywordMatcher()
+        for priority, spec in enumerate(self.table):
+            for mode in ("exact", "prefix", "contains"):
+                for keyword in spec.get(mode, []):
+                    matcher.add(keyword, (priority, spec["name"], mode))
+        self._matcher = matcher.build()
+        return self
+
+    def match(self, message: str):
+        """คืนชื่อ intent ที่ match (หรือ None) โดยอ่านข้อความรอบเดียว"""
+        if self._matcher is None:
+            self.compile()
+        best = None
+        length = len(message)
+        for start, end, (priority, name, mode) in self._matcher.find_all(message):
+            if mode == "exact" and (start != 0 or end != length):
+                continue
+            if mode == "prefix" and start != 0:
+                continue
+            if best is None or priority < best[0]:
+                best = (priority, name)
+                if priority == 0:
+                    break
+        return best[1] if best else None
+
+    def route(self, message: str) -> RouteResult:
+        start = time.perf_counter()
+        intent = self.match(message)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with self._lock:
+            key = intent or "fallback"
+            self._counts[key] = self._counts.get(key, 0) + 1
+            self._route_time_total += elapsed_ms
+            self._routes += 1
+        return RouteResult(intent, self._handlers.get(intent), elapsed_ms)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "routes": self._routes,
+                "by_intent": dict(self._counts),
+                "route_ms_avg": round(self._route_time_total / self._routes, 4) if self._routes else 0.0,
+            }
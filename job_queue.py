@@ -0,0 +1,311 @@
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class JobQueue:
+    """คิวงานแบบจำกัดขนาด (bounded) ที่มี thread pool คอยดึงงานไปประมวลผล
+
+    ใช้สำหรับรับ event จาก LINE webhook แล้วตอบ 200 กลับทันที
+    โดยให้ worker thread เป็นคนเรียก handler ที่ทำงานช้า (RAG, Gemini, reply)
+    """
+
+    def __init__(self, workers: int = 4, maxsize: int = 100, name: str = "jobs"):
+        self.workers = max(1, workers)
+        self.maxsize = max(1, maxsize)
+        self.name = name
+        self._queue = queue.Queue(maxsize=self.maxsize)
+        self._threads = []
+        self._lock = threading.Lock()
+        self._pid = None
+
+        # --- สถิติสำหรับ /stats ---
+        self._submitted = 0
+        self._rejected = 0
+        self._completed = 0
+        self._failed = 0
+        self._in_progress = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._last_wait = 0.0
+
+    def _ensure_started(self):
+        # สร้าง thread แบบ lazy หลัง gunicorn fork แล้ว (thread ไม่ตามไปใน process ลูก)
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue(maxsize=self.maxsize)
+            self._threads = []
+            for i in range(self.workers):
+                t = threading.Thread(target=self._worker, name=f"{self.name}-worker-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+            self._pid = os.getpid()
+            logger.info(f"JobQueue '{self.name}' started with {self.workers} workers (maxsize={self.maxsize})")
+
+    def submit(self, func, *args, **kwargs) -> bool:
+        """ใส่งานลงคิว คืนค่า False ถ้าคิวเต็ม (ผู้เรียกต้องตัดสินใจเองว่าจะทำอย่างไรต่อ)"""
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((time.monotonic(), func, args, kwargs))
+        except queue.Full:
+            with self._lock:
+                self._rejected += 1
+            return False
+        with self._lock:
+            self._submitted += 1
+        return True
+
+    def _worker(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                return
+            enqueued_at, func, args, kwargs = item
+            wait = time.monotonic() - enqueued_at
+            with self._lock:
+                self._in_progress += 1
+                self._wait_total += wait
+                self._last_wait = wait
+                if wait > self._wait_max:
+                    self._wait_max = wait
+            ok = True
+            try:
+                func(*args, **kwargs)
+            except Exception as e:
+                ok = False
+                logger.error(f"JobQueue '{self.name}' job {getattr(func, '__name__', func)} failed: {e}", exc_info=True)
+            finally:
+                with self._lock:
+                    self._in_progress -= 1
+                    if ok:
+                        self._completed += 1
+                    else:
+                        self._failed += 1
+                self._queue.task_done()
+
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    def stats(self) -> dict:
+        with self._lock:
+            started = self._completed + self._failed + self._in_progress
+            return {
+                "workers": self.workers,
+                "maxsize": self.maxsize,
+                "depth": self._queue.qsize(),
+                "in_progress": self._in_progress,
+                "submitted": self._submitted,
+                "rejected": self._rejected,
+                "completed": self._completed,
+                "failed": self._failed,
+                "wait_ms_avg": round(self._wait_total / started * 1000, 2) if started else 0.0,
+                "wait_ms_max": round(self._wait_max * 1000, 2),
+                "wait_ms_last": round(self._last_wait * 1000, 2),
+            }
+
+    def shutdown(self, wait: bool = True, timeout: float = 5.0):
+        """หยุด worker ทุกตัวหลังจากทำงานที่ค้างอยู่ในคิวเสร็จ รอไม่เกิน timeout วินาที
+
+        คิวมีขนาดจำกัด: ถ้ายังเต็มอยู่ (เช่นตอน atexit ขณะ worker ติดงานช้า) จะไม่รอใส่สัญญาณหยุดจนค้าง
+        worker เป็น daemon thread จึงจบไปพร้อม process
+        """
+        if self._pid != os.getpid():
+            return
+        deadline = time.monotonic() + timeout
+        for _ in self._threads:
+            try:
+                self._queue.put(None, timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Full:
+                logger.warning(f"JobQueue '{self.name}' still full at shutdown, abandoning {self._queue.qsize()} queued jobs")
+                break
+        if wait:
+            for t in self._threads:
+                t.join(timeout=max(0.0, deadline - time.monotonic()))
+        self._pid = None
+
+
+def group_by_key(items, key):
+    """แบ่ง items เป็นกลุ่มตาม key(item) โดยคงลำดับเดิมทั้งภายในกลุ่มและลำดับของกลุ่ม (dict รักษาลำดับการ insert)"""
+    groups = {}
+    for item in items:
+        groups.setdefault(key(item), []).append(item)
+    return list(groups.values())
+
+
+class BatchRunner:
+    """รันงานหลายชิ้นของ request เดียวพร้อมกันบน thread pool ขนาดจำกัด แล้วรอจนครบทุกชิ้นก่อนคืนค่า
+
+    ใช้กับ webhook ที่ LINE ส่งมาหลาย event ในครั้งเดียว: ชิ้นแรกรันใน thread ของ request เอง
+    ชิ้นที่เหลือส่งเข้า pool ที่ทุก request ของ process ใช้ร่วมกัน (ไม่เกิน workers thread) ถ้า pool ไม่ว่าง
+    งานจะรอคิวแทนการสร้าง thread เพิ่ม, workers=0 = รันทีละชิ้นตามลำดับแบบเดิม
+    exception ของชิ้นใดถูก raise ต่อหลังจากทุกชิ้นจบแล้ว (ชิ้นอื่นไม่ถูกยกเลิก)
+    """
+
+    def __init__(self, workers: int = 8, name: str = "batch"):
+        self.workers = max(0, workers)
+        self.name = name
+        self._executor = None
+        self._lock = threading.Lock()
+        self._pid = None
+
+        # --- สถิติสำหรับ /stats ---
+        self._batches = 0
+        self._items = 0
+        self._pooled = 0
+        self._failed = 0
+        self._max_items = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def _ensure_started(self):
+        # pool สร้างแบบ lazy หลัง gunicorn fork เหมือน JobQueue (thread ของ pool ไม่ตามไปใน process ลูก)
+        if self._pid == os.getpid():
+            return self._executor
+        with self._lock:
+            if self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=f"{self.name}-worker")
+                self._pid = os.getpid()
+        return self._executor
+
+    def _run_pooled(self, submitted_at, func, item):
+        wait = time.monotonic() - submitted_at
+        with self._lock:
+            self._wait_total += wait
+            if wait > self._wait_max:
+                self._wait_max = wait
+        return func(item)
+
+    def run_all(self, func, items):
+        """เรียก func(item) กับทุก item แล้วรอจนเสร็จทั้งหมด"""
+        items = list(items)
+        with self._lock:
+            self._batches += 1
+            self._items += len(items)
+            if len(items) > self._max_items:
+                self._max_items = len(items)
+        if len(items) <= 1 or self.workers == 0:
+            for item in items:
+                func(item)
+            return
+
+        executor = self._ensure_started()
+        now = time.monotonic()
+        futures = [executor.submit(self._run_pooled, now, func, item) for item in items[1:]]
+        with self._lock:
+            self._pooled += len(futures)
+        errors = []
+        try:
+            func(items[0])
+        except Exception as e:
+            errors.append(e)
+        for future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                errors.append(e)
+        if errors:
+            with self._lock:
+                self._failed += len(errors)
+            raise errors[0]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "batches": self._batches,
+                "items": self._items,
+                "max_items": self._max_items,
+                "pooled": self._pooled,
+                "failed": self._failed,
+                "pool_wait_ms_avg": round(self._wait_total / self._pooled * 1000, 2) if self._pooled else 0.0,
+                "pool_wait_ms_max": round(self._wait_max * 1000, 2),
+            }
+
+
+class KeyedSerializer:
+    """ทำงานของ key เดียวกันทีละชิ้นตามลำดับที่ส่งเข้ามา แม้จะมาจากคนละ thread / คนละ webhook delivery
+
+    thread แรกที่ได้งานของ key หนึ่งเป็นคนทำงานของ key นั้นต่อจนคิวหมด งานที่เข้ามาระหว่างนั้นต่อท้ายคิวไว้
+    (FIFO ต่างจาก Lock ที่ไม่รับประกันลำดับ) จึงไม่มี worker ตัวไหนต้องนั่งรอ lock ของผู้ใช้คนอื่น
+    """
+
+    def __init__(self, name: str = "serial"):
+        self.name = name
+        self._lock = threading.Lock()
+        self._queues = {}
+        self._pid = None
+
+        # --- สถิติสำหรับ /stats ---
+        self._runs = 0
+        self._deferred = 0
+        self._max_backlog = 0
+
+    def _check_pid(self):
+        # key ที่ค้างสถานะ "กำลังทำ" จาก process แม่ไม่มี thread ใน process ลูกมาทำต่อ: เริ่มใหม่หลัง fork
+        if self._pid != os.getpid():
+            self._lock = threading.Lock()
+            self._queues = {}
+            self._pid = os.getpid()
+
+    def run(self, key, func, *args, wait: bool = True):
+        """เรียก func(*args) ต่อจากงานก่อนหน้าของ key เดียวกัน
+
+        ถ้ามีงานของ key นี้กำลังทำอยู่ งานจะถูกต่อคิวให้ thread นั้นทำ: wait=True รอจนงานนี้เสร็จ,
+        wait=False คืนทันที (สำหรับ worker ของคิว) exception ของงานที่ต่อคิวถูก log โดย thread ที่ทำ
+        """
+        self._check_pid()
+        with self._lock:
+            self._runs += 1
+            pending = self._queues.get(key)
+            if pending is not None:
+                done = threading.Event()
+                pending.append((func, args, done))
+                self._deferred += 1
+                if len(pending) > self._max_backlog:
+                    self._max_backlog = len(pending)
+            else:
+                self._queues[key] = deque()
+        if pending is not None:
+            if wait:
+                done.wait()
+            return
+        try:
+            func(*args)
+        finally:
+            self._drain(key)
+
+    def _drain(self, key):
+        while True:
+            with self._lock:
+                pending = self._queues[key]
+                if not pending:
+                    del self._queues[key]
+                    return
+                func, args, done = pending.popleft()
+            try:
+                func(*args)
+            except Exception as e:
+                logger.error(f"KeyedSerializer '{self.name}' job {getattr(func, '__name__', func)} failed: {e}",
+                             exc_info=True)
+            finally:
+                done.set()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "active_keys": len(self._queues),
+                "backlog": sum(len(q) for q in self._queues.values()),
+                "runs": self._runs,
+                "deferred": self._deferred,
+                "max_backlog": self._max_backlog,
+            }
@@ -0,0 +1,75 @@
+from collections import deque
+
+
+class KeywordMatcher:
+    """Aho-Corasick automaton สำหรับค้นหาคำหลายคำในข้อความด้วยการอ่านข้อความรอบเดียว
+
+    เพิ่มคำด้วย add() แล้วเรียก build() ครั้งเดียว จากนั้น find_all() คืนทุกคำที่เจอพร้อมตำแหน่ง
+    เวลาในการค้นหาขึ้นกับความยาวข้อความ + จำนวนคำที่เจอ ไม่ขึ้นกับจำนวนคำในพจนานุกรม
+    """
+
+    def __init__(self, case_insensitive: bool = True):
+        self.case_insensitive = case_insensitive
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+        self._built = False
+        self.pattern_count = 0
+
+    def add(self, pattern: str, payload):
+        """เพิ่มคำค้น pattern ที่จะคืน payload เมื่อเจอ (คำเดียวกันเพิ่มได้หลาย payload)"""
+        if not pattern:
+            return
+        if self.case_insensitive:
+            pattern = pattern.lower()
+        node = 0
+        for ch in pattern:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            node = nxt
+        self._output[node].append((len(pattern), payload))
+        self.pattern_count += 1
+        self._built = False
+
+    def build(self):
+        """คำนวณ failure links (BFS) ต้องเรียกหลัง add() ครบแล้ว"""
+        queue = deque()
+        for nxt in self._goto[0].values():
+            self._fail[nxt] = 0
+            queue.append(nxt)
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                f = self._fail[node]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                self._fail[nxt] = self._goto[f].get(ch, 0)
+                # รวม output ของ failure state เพื่อให้เจอคำที่เป็น suffix ของกันและกัน
+                self._output[nxt] = self._output[nxt] + self._output[self._fail[nxt]]
+        self._built = True
+        return self
+
+    def find_all(self, text: str):
+        """คืน list ของ (start, end, payload) ทุกคำที่เจอ เรียงตามตำแหน่งที่จบคำ"""
+        if not self._built:
+            self.build()
+        if self.case_insensitive:
+            text = text.lower()
+        goto, fail, output = self._goto, self._fail, self._output
+        matches = []
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if output[node]:
+                end = i + 1
+                for length, payload in output[node]:
+                    matches.append((end - length, end, payload))
+        return matches
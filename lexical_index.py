@@ -0,0 +1,111 @@
+import math
+import re
+from collections import Counter
+from typing import Any, List
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+# เลขหัวข้อ (1.2.3), คำภาษาอังกฤษ/ตัวเลข/รหัสห้อง (ICIT, 81-301), และช่วงตัวอักษรไทย
+_TOKEN_RE = re.compile(r"\d+(?:\.\d+)+|[a-z0-9]+(?:[-_/][a-z0-9]+)*|[\u0e00-\u0e7f]+")
+_THAI_RE = re.compile(r"[\u0e00-\u0e7f]")
+
+
+def tokenize(text: str) -> List[str]:
+    """ตัด token แบบรองรับภาษาไทย
+
+    ภาษาไทยไม่มีช่องว่างระหว่างคำ จึงแตกช่วงตัวอักษรไทยเป็น character bigram + trigram
+    ส่วนเลขหัวข้อ ชื่อภาษาอังกฤษ และรหัสต่างๆ เก็บเป็น token ทั้งก้อนเพื่อให้จับคู่ตรงตัวได้
+    """
+    tokens = []
+    for match in _TOKEN_RE.finditer(text.lower()):
+        token = match.group()
+        if not _THAI_RE.match(token):
+            tokens.append(token)
+            if "." in token:
+                # เลขหัวข้อย่อย 1.2.3.1 ต้องค้นเจอด้วย 1.2.3 และ 1.2 ด้วย
+                parts = token.split(".")
+                tokens.extend(".".join(parts[:n]) for n in range(2, len(parts)))
+            continue
+        if len(token) <= 2:
+            tokens.append(token)
+            continue
+        for n in (2, 3):
+            tokens.extend(token[i:i + n] for i in range(len(token) - n + 1))
+    return tokens
+
+
+class LexicalIndex:
+    """Inverted index + BM25 ในหน่วยความจำ สำหรับ chunk ชุดเดียวกับที่อยู่ใน vector store"""
+
+    def __init__(self, docs, k1: float = 1.2, b: float = 0.75):
+        self.docs = list(docs)
+        self.k1 = k1
+        self.b = b
+        self.postings = {}
+        self.doc_lengths = []
+        self._positions = {id(doc): doc_index for doc_index, doc in enumerate(self.docs)}
+        for doc_index, doc in enumerate(self.docs):
+            counts = Counter(tokenize(doc.page_content))
+            self.doc_lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                self.postings.setdefault(term, []).append((doc_index, tf))
+        n_docs = len(self.docs)
+        self.avg_length = (sum(self.doc_lengths) / n_docs) if n_docs else 0.0
+        self.idf = {
+            term: math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            for term, postings in self.postings.items()
+        }
+
+    def search(self, query: str, k: int = 10):
+        """คืน list ของ (document, score) เรียงจากคะแนน BM25 มากไปน้อย"""
+        best = sorted(self._scores(query).items(), key=lambda item: item[1], reverse=True)[:k]
+        return [(self.docs[doc_index], score) for doc_index, score in best]
+
+    def rank(self, query: str, docs):
+        """เรียง docs (ต้องเป็น chunk ชุดเดียวกับใน index) ตามคะแนน BM25 ต่อ query คะแนนเท่ากันคงลำดับเดิม"""
+        scores = self._scores(query)
+        return sorted(docs, key=lambda doc: scores.get(self._positions.get(id(doc)), 0.0), reverse=True)
+
+    def _scores(self, query: str):
+        scores = {}
+        for term, query_tf in Counter(tokenize(query)).items():
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = self.idf[term]
+            for doc_index, tf in postings:
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_index] / self.avg_length)
+                scores[doc_index] = scores.get(doc_index, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm) * query_tf
+        return scores
+
+
+def reciprocal_rank_fusion(result_lists, k: int, rrf_k: int = 60):
+    """รวมผลจากหลาย retriever ด้วย RRF: score = sum(1 / (rrf_k + rank)) โดยระบุเอกสารด้วย chunk_id"""
+    scores = {}
+    docs = {}
+    for results in result_lists:
+        for rank, doc in enumerate(results, start=1):
+            key = doc.metadata.get("chunk_id") or doc.page_content
+            scores[key] = scores.get(key, 0.0) + 1.0 / (rrf_k + rank)
+            docs.setdefault(key, doc)
+    best = sorted(scores, key=scores.get, reverse=True)[:k]
+    return [docs[key] for key in best]
+
+
+class HybridRetriever(BaseRetriever):
+    """Retriever ที่รวมผล vector search กับ BM25 ด้วย reciprocal-rank fusion"""
+
+    vectorstore: Any
+    lexical_index: Any
+    k: int = 8
+    fetch_k: int = 20
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        vector_docs = self.vectorstore.similarity_search(query, k=self.fetch_k)
+        lexical_docs = [doc for doc, _ in self.lexical_index.search(query, k=self.fetch_k)]
+        return reciprocal_rank_fusion([lexical_docs, vector_docs], k=self.k)
@@ -0,0 +1,64 @@
+import logging
+import os
+import socket
+import threading
+
+from linebot.v3.messaging import ApiClient, MessagingApi
+from urllib3.connection import HTTPConnection
+
+logger = logging.getLogger(__name__)
+
+
+class LineClient:
+    """MessagingApi ตัวเดียวต่อ process ที่ใช้ connection pool (keep-alive) ร่วมกันทุก handler
+
+    เดิมทุกการ reply สร้าง ApiClient ใหม่ = connection pool ใหม่ + TLS handshake กับ api.line.me ทุกครั้ง
+    ApiClient สร้างแบบ lazy หลัง gunicorn fork (connection ข้าม process ไม่ได้) และปิดด้วย close() ตอน shutdown
+    """
+
+    def __init__(self, configuration, pool_maxsize: int = 8):
+        self.configuration = configuration
+        # urllib3 จะทิ้ง connection ที่เกิน maxsize หลังใช้งาน จึงควรตั้งให้ >= จำนวน thread ที่ส่งข้อความพร้อมกัน
+        configuration.connection_pool_maxsize = max(1, pool_maxsize)
+        if configuration.socket_options is None:
+            configuration.socket_options = HTTPConnection.default_socket_options + [
+                (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1),
+            ]
+        self._lock = threading.Lock()
+        self._pid = None
+        self._api_client = None
+        self._messaging_api = None
+        self.clients_created = 0
+
+    def api(self) -> MessagingApi:
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    # ไม่ปิด client ที่ได้มาจาก process แม่: socket เป็นของ process แม่
+                    self._api_client = ApiClient(self.configuration)
+                    self._messaging_api = MessagingApi(self._api_client)
+                    self._pid = os.getpid()
+                    self.clients_created += 1
+                    logger.info(f"LINE ApiClient created for pid {self._pid} "
+                                f"(pool maxsize={self.configuration.connection_pool_maxsize})")
+        return self._messaging_api
+
+    def close(self):
+        with self._lock:
+            if self._pid != os.getpid() or self._api_client is None:
+                return
+            self._api_client.rest_client.pool_manager.clear()
+            self._api_client.close()
+            self._api_client = None
+            self._messaging_api = None
+            self._pid = None
+
+    def stats(self) -> dict:
+        pools = 0
+        if self._pid == os.getpid() and self._api_client is not None:
+            pools = len(self._api_client.rest_client.pool_manager.pools)
+        return {
+            "pool_maxsize": self.configuration.connection_pool_maxsize,
+            "clients_created": self.clients_created,
+            "host_pools": pools,
+        }
@@ -0,0 +1,281 @@
+import json
+import logging
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import weakref
+from datetime import datetime, timezone
+
+# --- ตั้งค่า logging ของทั้ง process (configure_logging ถูกเรียกตอน import rag_handler) ---
+# LOG_FORMAT=json: หนึ่งบรรทัดต่อ record เป็น JSON, =text: รูปแบบเดิมของ logging.basicConfig
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+# LOG_ASYNC=true: request thread แค่ใส่ record ลงคิว ส่วนการ format/เขียนทำใน writer thread
+LOG_ASYNC = os.getenv("LOG_ASYNC", "true").lower() in ("1", "true", "yes")
+# คิวเต็ม (writer ตามไม่ทัน) = ทิ้ง record แล้วนับไว้ใน /stats แทนการบล็อก request
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# ข้อความ/ฟิลด์ที่ยาวเกินนี้ถูกตัด (เช่น webhook body ทั้งก้อน)
+LOG_MAX_FIELD_CHARS = int(os.getenv("LOG_MAX_FIELD_CHARS", "512"))
+# สัดส่วนที่เก็บต่อ category (extra={"category": ...}) ที่ไม่ระบุ = เก็บทั้งหมด, WARNING ขึ้นไปไม่ถูก sample
+LOG_SAMPLE_RATES = os.getenv("LOG_SAMPLE_RATES", "webhook_body=0.01,message=0.1")
+# false (ค่าเริ่มต้น): ไม่หา filename/lineno ของผู้เรียกทุก record (sys._getframe) เพราะ JSON ไม่ได้ใช้
+LOG_CALLER_INFO = os.getenv("LOG_CALLER_INFO", "false").lower() in ("1", "true", "yes")
+# จำนวน record สูงสุดที่ writer เขียนรวดเดียวแล้ว flush ครั้งเดียว
+LOG_WRITE_BATCH = 256
+
+# ข้อมูลที่ไม่ควรอยู่ใน log: reply token, LINE user id (เก็บแค่ 4 ตัวหน้าไว้ไล่ปัญหา), access token
+_REDACTIONS = (
+    (re.compile(r'("(?:replyToken|quoteToken)"\s*:\s*")[^"]*'), r"\1***"),
+    (re.compile(r"\b([UCR][0-9a-f]{4})[0-9a-f]{28}\b"), r"\1***"),
+    (re.compile(r"(Bearer\s+)[A-Za-z0-9._~+/=-]+"), r"\1***"),
+)
+
+# attribute มาตรฐานของ LogRecord: ที่เหลือคือฟิลด์จาก extra={...}
+_RECORD_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+def parse_sample_rates(spec: str) -> dict:
+    """"webhook_body=0.01,message=0.1" -> {"webhook_body": 0.01, "message": 0.1}"""
+    rates = {}
+    for part in spec.split(","):
+        if "=" not in part:
+            continue
+        category, rate = part.split("=", 1)
+        rates[category.strip()] = min(1.0, max(0.0, float(rate)))
+    return rates
+
+
+def redact(text: str) -> str:
+    for pattern, replacement in _REDACTIONS:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+def truncate(text: str, limit: int = LOG_MAX_FIELD_CHARS) -> str:
+    if limit <= 0 or len(text) <= limit:
+        return text
+    return f"{text[:limit]}…(+{len(text) - limit} chars)"
+
+
+def _clean(value, limit):
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    return truncate(redact(str(value)), limit)
+
+
+class SamplingFilter(logging.Filter):
+    """เก็บ record ของแต่ละ category ตามสัดส่วนใน LOG_SAMPLE_RATES (ตัดสินก่อน format จึงแทบไม่มีต้นทุน)
+
+    record ที่ผ่านการ sample จะมีฟิลด์ sample_rate ไว้คูณกลับเป็นจำนวนจริงตอนวิเคราะห์ log
+    """
+
+    def __init__(self, rates: dict):
+        super().__init__()
+        self.rates = dict(rates)
+        self._lock = threading.Lock()
+        self._kept = {}
+        self._sampled_out = {}
+
+    def filter(self, record) -> bool:
+        category = getattr(record, "category", None)
+        rate = self.rates.get(category, 1.0) if category else 1.0
+        if rate >= 1.0 or record.levelno >= logging.WARNING:
+            return True
+        keep = random.random() < rate
+        with self._lock:
+            counts = self._kept if keep else self._sampled_out
+            counts[category] = counts.get(category, 0) + 1
+        if keep:
+            record.sample_rate = rate
+        return keep
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"rates": dict(self.rates), "kept": dict(self._kept), "sampled_out": dict(self._sampled_out)}
+
+
+class JsonFormatter(logging.Formatter):
+    """หนึ่งบรรทัดต่อ record: ts, level, logger, msg + ฟิลด์จาก extra (ตัดความยาวและลบข้อมูลลับแล้ว)"""
+
+    def __init__(self, max_field_chars: int = LOG_MAX_FIELD_CHARS):
+        super().__init__()
+        self.max_field_chars = max_field_chars
+
+    def format(self, record) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": _clean(record.getMessage(), self.max_field_chars),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = _clean(value, self.max_field_chars)
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    """รูปแบบเดิม (LEVEL:logger:message) แต่ตัดความยาวและลบข้อมูลลับของข้อความเหมือน JsonFormatter"""
+
+    def __init__(self, max_field_chars: int = LOG_MAX_FIELD_CHARS):
+        super().__init__(logging.BASIC_FORMAT)
+        self.max_field_chars = max_field_chars
+
+    def formatMessage(self, record) -> str:
+        record.message = _clean(record.message, self.max_field_chars)
+        return super().formatMessage(record)
+
+
+# thread ใดก็ log ได้ ถ้า fork ขณะที่ thread อื่นถือ _start_lock อยู่ (เช่น rag-build กำลัง log ครั้งแรก)
+# process ลูกจะได้ lock ที่ล็อกค้างไว้ จึงสร้าง lock ใหม่หลัง fork แบบเดียวกับที่ logging ทำกับ lock ของ handler
+_BACKGROUND_HANDLERS = weakref.WeakSet()
+
+
+def _reinit_after_fork():
+    for handler in list(_BACKGROUND_HANDLERS):
+        handler._start_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reinit_after_fork)
+
+
+class BackgroundLogHandler(logging.Handler):
+    """handler ที่ request thread แค่ใส่ record ลงคิว (ไม่ format ไม่เขียน I/O ไม่แย่ง lock ของ stream)
+
+    writer thread ดึง record ที่ค้างอยู่ทีละชุด format ด้วย formatter ของ target แล้วเขียน + flush ครั้งเดียวต่อชุด
+    thread สร้างแบบ lazy หลัง gunicorn fork เหมือน JobQueue และ drain คิวตอน logging.shutdown (atexit)
+    """
+
+    def __init__(self, target: logging.StreamHandler, maxsize: int = LOG_QUEUE_SIZE):
+        super().__init__()
+        self.target = target
+        self.maxsize = max(1, maxsize)
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        _BACKGROUND_HANDLERS.add(self)
+        self._enqueued = 0
+        self._dropped = 0
+        self._written = 0
+
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue(maxsize=self.maxsize)
+            self._thread = threading.Thread(target=self._writer, args=(self._queue,), name="log-writer", daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def handle(self, record) -> bool:
+        # ไม่ต้องถือ self.lock แบบ logging.Handler.handle: Queue ปลอดภัยต่อหลาย thread อยู่แล้ว
+        keep = self.filter(record)
+        if keep:
+            self.emit(record)
+        return keep
+
+    def emit(self, record):
+        # ตัวนับไม่ถือ lock (ค่าใน /stats เป็นค่าโดยประมาณ) เพื่อไม่ให้ทุก thread มาแย่ง lock เดียวกัน
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(record)
+            self._enqueued += 1
+        except queue.Full:
+            self._dropped += 1
+
+    def _writer(self, records):
+        while True:
+            batch = [records.get()]
+            while len(batch) < LOG_WRITE_BATCH:
+                try:
+                    batch.append(records.get_nowait())
+                except queue.Empty:
+                    break
+            lines = []
+            stopping = False
+            for record in batch:
+                if record is None:
+                    stopping = True
+                    break
+                try:
+                    lines.append(self.target.format(record))
+                except Exception:
+                    self.target.handleError(record)
+            if lines:
+                with self.target.lock:
+                    try:
+                        self.target.stream.write("\n".join(lines) + "\n")
+                        self.target.stream.flush()
+                    except Exception:
+                        self.target.handleError(batch[0])
+                self._written += len(lines)
+            if stopping:
+                return
+
+    def setFormatter(self, fmt):
+        self.target.setFormatter(fmt)
+
+    def flush(self):
+        self.target.flush()
+
+    def close(self):
+        if self._pid == os.getpid():
+            try:
+                self._queue.put(None, timeout=1)
+                self._thread.join(timeout=5)
+            except queue.Full:
+                pass
+            self._pid = None
+        self.target.close()
+        super().close()
+
+    def stats(self) -> dict:
+        return {
+            "maxsize": self.maxsize,
+            "depth": self._queue.qsize() if self._queue is not None else 0,
+            "enqueued": self._enqueued,
+            "written": self._written,
+            "dropped": self._dropped,
+        }
+
+
+SAMPLER = SamplingFilter(parse_sample_rates(LOG_SAMPLE_RATES))
+_HANDLER = None
+
+
+def create_handler(stream=None, log_format: str = LOG_FORMAT, async_writes: bool = LOG_ASYNC,
+                   sampler: SamplingFilter = SAMPLER, max_field_chars: int = LOG_MAX_FIELD_CHARS) -> logging.Handler:
+    target = logging.StreamHandler(stream if stream is not None else sys.stderr)
+    target.setFormatter(JsonFormatter(max_field_chars) if log_format == "json" else TextFormatter(max_field_chars))
+    handler = BackgroundLogHandler(target) if async_writes else target
+    if sampler is not None:
+        handler.addFilter(sampler)
+    return handler
+
+
+def configure_logging(level=logging.INFO):
+    """ใช้แทน logging.basicConfig: ไม่ทำอะไรถ้า root logger มี handler อยู่แล้ว (เช่นสคริปต์ตั้งค่าเอง)"""
+    global _HANDLER
+    root = logging.getLogger()
+    if root.handlers:
+        return
+    if not LOG_CALLER_INFO:
+        logging._srcfile = None  # วิธีที่เอกสาร logging แนะนำเพื่อลดต้นทุนต่อ record
+    _HANDLER = create_handler()
+    root.addHandler(_HANDLER)
+    root.setLevel(level)
+
+
+def logging_stats() -> dict:
+    result = {"format": LOG_FORMAT, "async": LOG_ASYNC, "max_field_chars": LOG_MAX_FIELD_CHARS,
+              "sampling": SAMPLER.stats()}
+    if isinstance(_HANDLER, BackgroundLogHandler):
+        result["queue"] = _HANDLER.stats()
+    return result
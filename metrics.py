@@ -0,0 +1,176 @@
+import bisect
+import os
+import threading
+import time
+
+# METRICS_ENABLED=false ปิดการจับเวลาทั้งหมด (span/counter กลายเป็น no-op และ /metrics ตอบ 404)
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# วินาที: ครอบคลุมตั้งแต่ keyword routing (ระดับ µs) จนถึง Gemini ที่ช้าสุดหลายสิบวินาที
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(names, values, extra=""):
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def render(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} counter"
+        for labelvalues, value in values:
+            yield f"{self.name}{_format_labels(self.labelnames, labelvalues)} {_format_value(value)}"
+
+
+class Histogram:
+    """histogram แบบ bucket คงที่: observe() เป็น O(log จำนวน bucket) เก็บจำนวนต่อ bucket แล้วค่อยสะสมตอน render"""
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # labelvalues -> [จำนวนต่อ bucket (+Inf เป็นช่องสุดท้าย), sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labelvalues):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self):
+        with self._lock:
+            series = sorted((labels, list(counts), total) for labels, (counts, total) in self._series.items())
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        for labelvalues, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound!r}"'
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, labelvalues, le)} {cumulative}"
+            labels = _format_labels(self.labelnames, labelvalues)
+            yield f"{self.name}_sum{labels} {_format_value(total)}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+class Gauge:
+    """ค่า ณ เวลาที่ scrape อ่านจาก callback (เช่น ความยาวคิว) ไม่ต้องอัปเดตใน hot path"""
+
+    def __init__(self, name: str, documentation: str, read):
+        self.name = name
+        self.documentation = documentation
+        self.read = read
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} gauge"
+        yield f"{self.name} {_format_value(self.read())}"
+
+
+class MetricsRegistry:
+    """รวม metric ของ process นี้และแปลงเป็น Prometheus text format (version 0.0.4) สำหรับ /metrics
+
+    แต่ละ gunicorn worker มี registry ของตัวเอง ค่าที่ได้จากการ scrape หนึ่งครั้งจึงเป็นของ worker เดียว
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name, documentation, read) -> Gauge:
+        return self._register(Gauge(name, documentation, read))
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self._metrics):
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                lines.append(f"# {metric.name} unavailable: {_escape(e)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry(enabled=METRICS_ENABLED)
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "kmutnb_stage_duration_seconds", "Time spent in each stage of answering a LINE message.", ("stage",)
+)
+STAGE_ERRORS = REGISTRY.counter(
+    "kmutnb_stage_errors_total", "Exceptions raised inside a stage, by exception type.", ("stage", "type")
+)
+ROUTES = REGISTRY.counter("kmutnb_route_total", "Messages per routing branch.", ("intent",))
+ANSWER_SOURCES = REGISTRY.counter(
+    "kmutnb_answer_source_total", "Where answer_question got its answer from.", ("source",)
+)
+USER_LIMITED = REGISTRY.counter(
+    "kmutnb_user_limited_total", "Messages answered with the canned over-limit reply.", ("reason",)
+)
+REPLY_PATHS = REGISTRY.counter(
+    "kmutnb_reply_path_total", "How answers were delivered (reply, placeholder then push, ...).", ("path",)
+)
+
+
+class span:
+    """with span("stage"): จับเวลาลง STAGE_SECONDS และนับ exception ที่หลุดออกจาก block (แล้วปล่อยต่อ)"""
+
+    __slots__ = ("stage", "start")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if REGISTRY.enabled:
+            STAGE_SECONDS.observe(time.perf_counter() - self.start, self.stage)
+            if exc_type is not None:
+                STAGE_ERRORS.inc(self.stage, exc_type.__name__)
+        return False
+
+
+def count(counter: Counter, *labelvalues):
+    if REGISTRY.enabled:
+        counter.inc(*labelvalues)
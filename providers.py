@@ -0,0 +1,131 @@
+import asyncio
+import hashlib
+import math
+import os
+import re
+import time
+from typing import Any, List, Optional
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+# --- เลือก provider ผ่าน environment variable ---
+# RAG_EMBEDDINGS_PROVIDER = google (ค่าเริ่มต้น) | local
+# RAG_LLM_PROVIDER        = google (ค่าเริ่มต้น) | stub
+EMBEDDINGS_PROVIDER = os.getenv("RAG_EMBEDDINGS_PROVIDER", "google").lower()
+LLM_PROVIDER = os.getenv("RAG_LLM_PROVIDER", "google").lower()
+
+
+class HashingNgramEmbeddings(Embeddings):
+    """Embedding แบบ offline และ deterministic: hash character n-gram ลงใน vector ขนาดคงที่
+
+    ภาษาไทยไม่มีการเว้นวรรคระหว่างคำ จึงใช้ n-gram ระดับตัวอักษรแทนการตัดคำ
+    ไม่ต้องใช้ network หรือ API key เหมาะกับ CI, load test และ benchmark
+    """
+
+    def __init__(self, dim: int = 512, ngram_range=(1, 3)):
+        self.dim = dim
+        self.ngram_range = ngram_range
+
+    def _embed(self, text: str) -> List[float]:
+        text = re.sub(r"\s+", " ", text.lower()).strip()
+        vector = [0.0] * self.dim
+        counts = {}
+        low, high = self.ngram_range
+        for n in range(low, high + 1):
+            for i in range(len(text) - n + 1):
+                gram = text[i:i + n]
+                if gram.strip():
+                    counts[gram] = counts.get(gram, 0) + 1
+        for gram, count in counts.items():
+            digest = hashlib.blake2b(gram.encode("utf-8"), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], "little") % self.dim
+            sign = 1.0 if digest[4] & 1 else -1.0
+            vector[bucket] += sign * (1.0 + math.log(count))
+        norm = math.sqrt(sum(v * v for v in vector))
+        return [v / norm for v in vector] if norm else vector
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+class StubChatModel(BaseChatModel):
+    """LLM จำลองสำหรับทดสอบแบบ offline: ตอบด้วยข้อความต้นๆ ของ Context ใน prompt
+
+    latency_seconds ใช้จำลองเวลาที่ LLM จริงใช้ในการตอบ
+    """
+
+    latency_seconds: float = 0.0
+    max_chars: int = 400
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub"
+
+    def _answer(self, messages) -> ChatResult:
+        prompt = str(messages[-1].content) if messages else ""
+        context = prompt
+        if "**Context:**" in prompt:
+            context = prompt.split("**Context:**", 1)[1].split("**Question:**", 1)[0]
+        context = context.strip()
+        answer = context[: self.max_chars] if context else "ขออภัยค่ะ KMUTNB Buddy ยังไม่สามารถตอบคำถามนี้ได้"
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=answer))])
+
+    def _generate(self, messages, stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> ChatResult:
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+        return self._answer(messages)
+
+    async def _agenerate(self, messages, stop: Optional[List[str]] = None, run_manager=None,
+                         **kwargs: Any) -> ChatResult:
+        if self.latency_seconds:
+            await asyncio.sleep(self.latency_seconds)
+        return self._answer(messages)
+
+
+def gemini_client_kwargs() -> dict:
+    """GEMINI_API_ENDPOINT (เช่น http://127.0.0.1:9000) ส่งคำขอ Gemini ไปที่ endpoint อื่นผ่าน REST
+    ใช้กับ Gemini จำลองใน benchmarks/bench_webhook_load.py ถ้าไม่ตั้งจะใช้ endpoint ปกติของ Google
+    """
+    endpoint = os.getenv("GEMINI_API_ENDPOINT")
+    if not endpoint:
+        return {}
+    return {"transport": "rest", "client_options": {"api_endpoint": endpoint}}
+
+
+def get_embeddings(provider: str = None) -> Embeddings:
+    provider = (provider or EMBEDDINGS_PROVIDER).lower()
+    if provider == "local":
+        return HashingNgramEmbeddings(dim=int(os.getenv("LOCAL_EMBEDDING_DIM", "512")))
+    if provider == "google":
+        from langchain_google_genai import GoogleGenerativeAIEmbeddings
+        return GoogleGenerativeAIEmbeddings(
+            model="models/text-embedding-004",
+            google_api_key=os.environ.get("GEMINI_API_KEY")
+        )
+    raise ValueError(f"Unknown embeddings provider '{provider}'")
+
+
+def get_llm(provider: str = None) -> BaseChatModel:
+    provider = (provider or LLM_PROVIDER).lower()
+    if provider == "stub":
+        return StubChatModel(latency_seconds=float(os.getenv("STUB_LLM_LATENCY_SECONDS", "0")))
+    if provider == "google":
+        from langchain_google_genai import ChatGoogleGenerativeAI
+        return ChatGoogleGenerativeAI(
+            model="gemini-2.5-flash-lite",  # ใช้โมเดลที่เสถียรกว่า
+            google_api_key=os.environ.get("GEMINI_API_KEY"),
+            **gemini_client_kwargs(),
+            temperature=0.3,
+            max_output_tokens=4500,
+            # max_output_tokens=2050,
+            retry_on_throttle=True,
+            # retry ทั้งหมดอยู่ภายใน call เดียวของ circuit breaker (rag_handler.LLM_BREAKER)
+            max_retries=int(os.getenv("GEMINI_MAX_RETRIES", "3"))
+        )
+    raise ValueError(f"Unknown LLM provider '{provider}'")
@@ -1,19 +1,111 @@
+import hashlib
 import os
-from langchain_google_genai import GoogleGenerativeAIEmbeddings, ChatGoogleGenerativeAI
+import threading
+import time
+from collections import OrderedDict
+from operator import itemgetter
 from langchain_community.vectorstores import Chroma
 from langchain_community.document_loaders import TextLoader
-from langchain.text_splitter import MarkdownHeaderTextSplitter
+from langchain.text_splitter import MarkdownHeaderTextSplitter, RecursiveCharacterTextSplitter
 from langchain.chains import create_retrieval_chain
 from langchain.chains.combine_documents import create_stuff_documents_chain
+from langchain_core.embeddings import Embeddings
 from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import RunnableLambda
 import logging
+from answer_cache import AnswerCache, normalize_question
+from incremental_index import assign_chunk_ids, sync_vectorstore
+from embedding_ingest import ingest_documents
+from providers import EMBEDDINGS_PROVIDER, get_embeddings, get_llm
+from lexical_index import HybridRetriever, LexicalIndex
+from context_packer import ContextPacker, estimate_tokens
+from section_index import SectionIndex
+from single_flight import SingleFlight
+from faq_store import FaqStore, source_hash
+from metrics import ANSWER_SOURCES, count, span
+from log_pipeline import configure_logging
+from circuit_breaker import OPEN, CircuitBreaker, CircuitOpenError
+from user_limits import record_llm_usage
 
-# ตั้งค่า Logging เพื่อดูรายละเอียดมากขึ้น
-logging.basicConfig(level=logging.INFO)
+# ตั้งค่า Logging เพื่อดูรายละเอียดมากขึ้น (JSON ผ่านคิว + sampling ดู log_pipeline.py)
+configure_logging(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# --- กำหนดชื่อโฟลเดอร์สำหรับเก็บ DB ---
-CHROMA_PERSIST_DIRECTORY = "chroma_db"
+# --- กำหนดชื่อโฟลเดอร์สำหรับเก็บ DB (แยกตาม embeddings provider เพราะขนาด vector ต่างกัน) ---
+CHROMA_PERSIST_DIRECTORY = os.getenv(
+    "CHROMA_PERSIST_DIRECTORY", "chroma_db" if EMBEDDINGS_PROVIDER == "google" else f"chroma_db_{EMBEDDINGS_PROVIDER}"
+)
+
+# --- Cache คำตอบ (ปิดชั้น semantic ได้ด้วย ANSWER_CACHE_SEMANTIC=false) ---
+ANSWER_CACHE = AnswerCache(
+    max_size=int(os.getenv("ANSWER_CACHE_SIZE", "512")),
+    ttl_seconds=float(os.getenv("ANSWER_CACHE_TTL_SECONDS", str(6 * 3600))),
+    similarity_threshold=float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95")),
+)
+ANSWER_CACHE_SEMANTIC = os.getenv("ANSWER_CACHE_SEMANTIC", "true").lower() in ("1", "true", "yes")
+
+# --- รวมคำถามเดียวกันที่เข้ามาพร้อมกัน (single-flight) follower รอคำตอบของ leader ไม่เกินเวลานี้ (0 = ปิด) ---
+ANSWER_COALESCE_TIMEOUT_SECONDS = float(os.getenv("ANSWER_COALESCE_TIMEOUT_SECONDS", "30"))
+ANSWER_FLIGHTS = SingleFlight(timeout_seconds=ANSWER_COALESCE_TIMEOUT_SECONDS)
+EMBEDDINGS_MODEL = None
+
+# --- การค้นคืน: hybrid = BM25 + vector (ค่าเริ่มต้น), vector = similarity search อย่างเดียว ---
+RAG_RETRIEVER = os.getenv("RAG_RETRIEVER", "hybrid").lower()
+# k=16 ทั้งสองแบบ: ผล sweep ที่ k=8 (recall 87.9%) วัดด้วย embeddings แบบ local เท่านั้น
+# จะลด k ได้ต้องรัน benchmarks/bench_retrieval_sweep.py ด้วย Google embeddings ก่อน
+RAG_TOP_K = int(os.getenv("RAG_TOP_K", "16"))
+
+# --- จัด context ก่อนเข้า prompt: รวม chunk ที่ติดกัน ตัดซ้ำ และจำกัดจำนวน token (0 = ปิด) ---
+RAG_CONTEXT_TOKEN_BUDGET = int(os.getenv("RAG_CONTEXT_TOKEN_BUDGET", "2000"))
+CONTEXT_PACKER = ContextPacker(
+    token_budget=RAG_CONTEXT_TOKEN_BUDGET,
+    duplicate_threshold=float(os.getenv("RAG_CONTEXT_DUPLICATE_THRESHOLD", "0.8")),
+    chars_per_token=float(os.getenv("RAG_CHARS_PER_TOKEN", "3.0")),
+)
+
+# --- คำถามที่ระบุเลข/ชื่อหัวข้อตรงตัว ดึง chunk จาก SectionIndex โดยไม่ต้อง embed หรือค้น vector ---
+RAG_SECTION_LOOKUP = os.getenv("RAG_SECTION_LOOKUP", "true").lower() in ("1", "true", "yes")
+SECTION_INDEX = None
+RAG_ANSWER_CHAIN = None
+# retriever (+ ContextPacker) ที่ RAG_CHAIN ใช้ แยกไว้เพื่อจับเวลา retrieve กับ generate คนละช่วง
+RAG_RETRIEVAL = None
+# token โดยประมาณของ prompt template (ไม่รวม context/คำถาม) สำหรับนับโควตาของผู้ใช้ (ดู user_limits)
+RAG_PROMPT_OVERHEAD_TOKENS = 0
+
+# --- คำตอบ FAQ ที่สร้างไว้ล่วงหน้าด้วย build_faq_store.py (ตอบได้ทันทีแม้ RAG chain ยังสร้างไม่เสร็จ) ---
+FAQ_STORE_ENABLED = os.getenv("FAQ_STORE_ENABLED", "true").lower() in ("1", "true", "yes")
+FAQ_STORE_DIR = os.getenv("FAQ_STORE_DIR", "faq_store")
+FAQ_STORE = FaqStore()
+
+# --- Circuit breaker ของ Gemini (ใช้ร่วมกันระหว่าง RAG chain และ chat ตรงใน app.py/asgi_app.py) ---
+# error หรือ call ที่ช้ากว่า LLM_BREAKER_SLOW_SECONDS เกินสัดส่วนที่กำหนดใน LLM_BREAKER_WINDOW call ล่าสุด = เปิด circuit
+# ระหว่างเปิด ตอบแบบ degraded ทันที (ข้อความของ chunk ที่ตรงที่สุดจาก BM25) แล้วลอง probe ใหม่ทุก LLM_BREAKER_OPEN_SECONDS
+LLM_BREAKER = CircuitBreaker(
+    "gemini",
+    window_size=int(os.getenv("LLM_BREAKER_WINDOW", "20")),
+    min_calls=int(os.getenv("LLM_BREAKER_MIN_CALLS", "5")),
+    failure_rate=float(os.getenv("LLM_BREAKER_FAILURE_RATE", "0.5")),
+    slow_call_seconds=float(os.getenv("LLM_BREAKER_SLOW_SECONDS", "15")),
+    slow_call_rate=float(os.getenv("LLM_BREAKER_SLOW_RATE", "0.5")),
+    open_seconds=float(os.getenv("LLM_BREAKER_OPEN_SECONDS", "30")),
+    enabled=os.getenv("LLM_BREAKER_ENABLED", "true").lower() in ("1", "true", "yes"),
+)
+# BM25 ของ chunk ทั้งหมด ใช้หา chunk สำหรับคำตอบ degraded โดยไม่ต้องเรียก embeddings API
+LEXICAL_INDEX = None
+DEGRADED_MAX_CHARS = 1500
+LLM_UNAVAILABLE_MESSAGE = "ขออภัยค่ะ ขณะนี้ระบบ AI ขัดข้องชั่วคราว โปรดลองถามใหม่อีกครั้งในอีกสักครู่นะคะ"
+RAG_DEGRADED_PREFIX = "ขณะนี้ระบบ AI ขัดข้องชั่วคราว KMUTNB Buddy จึงส่งข้อมูลที่เกี่ยวข้องจากเอกสารให้ก่อนนะคะ"
+
+# --- สถานะการสร้าง RAG chain (สร้างใน background thread ดู start_rag_build) ---
+RAG_CHAIN = None
+RAG_STATUS = {"phase": "pending", "started_at": None, "finished_at": None, "error": None}
+_rag_build_lock = threading.Lock()
+_rag_build_thread = None
+_rag_build_pid = None
+_rag_build_file = None
+
+RAG_NOT_READY_MESSAGE = "ขออภัยค่ะ KMUTNB Buddy กำลังเตรียมข้อมูลอยู่ โปรดลองถามใหม่อีกครั้งในอีกสักครู่นะคะ"
+RAG_FAILED_MESSAGE = "ขออภัยค่ะ ระบบ RAG ยังไม่พร้อมใช้งานเนื่องจากเกิดข้อผิดพลาดในการเริ่มต้น"
 
 # ตรวจสอบว่ามี API Key ใน environment
 if "GEMINI_API_KEY" not in os.environ:
@@ -28,13 +120,40 @@ if "GEMINI_API_KEY" not in os.environ:
         if api_key:
             os.environ["GEMINI_API_KEY"] = api_key
 
-def setup_rag_chain(file_path: str):
-    logger.info(f"Setting up RAG chain from MARKDOWN document: {file_path}")
-    
-    loader = TextLoader(file_path, encoding="utf-8")
-    documents = loader.load()
-    full_text = documents[0].page_content
-    
+class QueryEmbeddingMemo(Embeddings):
+    """ห่อ embeddings model เพื่อจำ query embedding ล่าสุดไว้
+
+    answer_question คำนวณ embedding ของคำถามเพื่อค้น cache ชั้น semantic ก่อน
+    เมื่อ cache miss ตัว retriever จะขอ embedding ของคำถามเดิมซ้ำ จึงใช้ค่าที่จำไว้แทนการเรียก API อีกครั้ง
+    """
+
+    def __init__(self, inner: Embeddings, size: int = 256):
+        self.inner = inner
+        self.size = size
+        self._memo = OrderedDict()
+        self._lock = threading.Lock()
+
+    def embed_documents(self, texts):
+        return self.inner.embed_documents(texts)
+
+    def embed_query(self, text):
+        with self._lock:
+            if text in self._memo:
+                self._memo.move_to_end(text)
+                return self._memo[text]
+        vector = self.inner.embed_query(text)
+        with self._lock:
+            self._memo[text] = vector
+            while len(self._memo) > self.size:
+                self._memo.popitem(last=False)
+        return vector
+
+def _set_phase(phase: str):
+    RAG_STATUS["phase"] = phase
+    logger.info(f"RAG build phase: {phase}")
+
+def split_markdown(full_text: str, chunk_size: int = 1000, chunk_overlap: int = 200):
+    """แบ่งเอกสาร markdown ตาม header แล้วแบ่งย่อยชิ้นที่ยาวเกิน พร้อมใส่ chunk_id ให้ทุกชิ้น"""
     headers_to_split_on = [("#", "Header 1"), ("##", "Header 2"), ("###", "Header 3")]
     markdown_splitter = MarkdownHeaderTextSplitter(headers_to_split_on=headers_to_split_on)
     
@@ -42,40 +161,64 @@ def setup_rag_chain(file_path: str):
     splits = markdown_splitter.split_text(full_text)
     
     # ถ้าชิ้นส่วนใดยาวเกินไป ให้แบ่งย่อยอีกที
-    from langchain.text_splitter import RecursiveCharacterTextSplitter
     text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000,
-        chunk_overlap=200,
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
         length_function=len,
     )
     splits = text_splitter.split_documents(splits)
+    return assign_chunk_ids(splits)
+
+def setup_rag_chain(file_path: str):
+    global EMBEDDINGS_MODEL, SECTION_INDEX, RAG_ANSWER_CHAIN, RAG_RETRIEVAL, LEXICAL_INDEX, RAG_PROMPT_OVERHEAD_TOKENS
+    logger.info(f"Setting up RAG chain from MARKDOWN document: {file_path}")
+    
+    _set_phase("loading_document")
+    loader = TextLoader(file_path, encoding="utf-8")
+    documents = loader.load()
+    full_text = documents[0].page_content
+    kb_version = hashlib.sha256(full_text.encode("utf-8")).hexdigest()
+    
+    _set_phase("splitting")
+    splits = split_markdown(full_text)
     
-    embeddings_model = GoogleGenerativeAIEmbeddings(
-        model="models/text-embedding-004",
-        google_api_key=os.environ.get("GEMINI_API_KEY")
+    embeddings_model = QueryEmbeddingMemo(get_embeddings())
+
+    _set_phase("building_vectorstore")
+    # --- สร้างหรือโหลด Vector Store แล้ว sync เฉพาะ chunk ที่เปลี่ยน (ดู incremental_index) ---
+    logger.info(f"Opening vector store at: {CHROMA_PERSIST_DIRECTORY}")
+    vectorstore = Chroma(
+        persist_directory=CHROMA_PERSIST_DIRECTORY,
+        embedding_function=embeddings_model
     )
 
-    # --- ส่วนที่แก้ไข: สร้างหรือโหลด Vector Store ---
-    if os.path.exists(CHROMA_PERSIST_DIRECTORY):
-        logger.info(f"Loading existing vector store from: {CHROMA_PERSIST_DIRECTORY}")
-        vectorstore = Chroma(
-            persist_directory=CHROMA_PERSIST_DIRECTORY,
-            embedding_function=embeddings_model
+    def add_documents(store, docs, ids):
+        # embed เป็น batch พร้อมกันหลาย thread, backoff เมื่อโดน 429 (ดู embedding_ingest)
+        return ingest_documents(
+            store, docs, ids,
+            embeddings=embeddings_model,
+            batch_size=int(os.getenv("EMBED_BATCH_SIZE", "32")),
+            workers=int(os.getenv("EMBED_WORKERS", "4")),
+        )
+    RAG_STATUS["index_sync"] = sync_vectorstore(
+        vectorstore, splits, CHROMA_PERSIST_DIRECTORY, file_path, kb_version, add_documents=add_documents
+    )
+
+    # --- Retriever: hybrid (BM25 + vector, RRF) เป็นค่าเริ่มต้น หรือ vector อย่างเดียวแบบเดิม ---
+    lexical_index = LexicalIndex(splits)
+    if RAG_RETRIEVER == "hybrid":
+        retriever = HybridRetriever(
+            vectorstore=vectorstore,
+            lexical_index=lexical_index,
+            k=RAG_TOP_K,
+            fetch_k=max(RAG_TOP_K, int(os.getenv("RAG_FETCH_K", "20"))),
         )
     else:
-        logger.info(f"Creating new vector store and persisting to: {CHROMA_PERSIST_DIRECTORY}")
-        vectorstore = Chroma.from_documents(
-            documents=splits, 
-            embedding=embeddings_model,
-            persist_directory=CHROMA_PERSIST_DIRECTORY
+        retriever = vectorstore.as_retriever(
+            search_kwargs={
+                'k': RAG_TOP_K  # เพิ่มจำนวน chunks ที่จะดึงมาเพื่อให้ได้ข้อมูลมากขึ้น
+            }
         )
-        logger.info("Vector store created and persisted.")
-
-    retriever = vectorstore.as_retriever(
-        search_kwargs={
-            'k': 16  # เพิ่มจำนวน chunks ที่จะดึงมาเพื่อให้ได้ข้อมูลมากขึ้น
-        }
-    )
     
     prompt_template = """คุณคือ "KMUTNB Buddy" ผู้ช่วย AI ที่เป็นมิตรและเชี่ยวชาญข้อมูลจากเอกสารของมหาวิทยาลัยเทคโนโลยีพระจอมเกล้าพระนครเหนือ
 หน้าที่ของคุณคือตอบคำถามโดยใช้ข้อมูลจาก "Context" ที่ให้มาเป็นหลัก
@@ -98,41 +241,273 @@ def setup_rag_chain(file_path: str):
 
 **Answer (เขียนคำตอบที่เป็นมิตรและสรุปจาก Context):**
 """
+    _set_phase("building_chain")
     prompt = ChatPromptTemplate.from_template(prompt_template)
     
-    llm = ChatGoogleGenerativeAI(
-            model="gemini-2.5-flash-lite",  # ใช้โมเดลที่เสถียรกว่า
-            google_api_key=os.environ.get("GEMINI_API_KEY"),
-            temperature=0.3,
-            max_output_tokens=4500,
-            # max_output_tokens=2050,
-            retry_on_throttle=True,
-            max_retries=3
-        )
+    llm = get_llm()
     question_answer_chain = create_stuff_documents_chain(llm, prompt)
-    rag_chain = create_retrieval_chain(retriever, question_answer_chain)
+    if RAG_CONTEXT_TOKEN_BUDGET > 0:
+        # ลำดับ chunk ของ splits ชุดนี้: ContextPacker ใช้รวม chunk ที่ติดกันและตัด overlap
+        CONTEXT_PACKER.index_documents(splits)
+        retrieval = retriever | RunnableLambda(CONTEXT_PACKER.pack)
+        # itemgetter แทน lambda: LangChain อ่าน source ของ lambda (inspect.getsource) ทุกครั้งที่ invoke
+        rag_chain = create_retrieval_chain(RunnableLambda(itemgetter("input")) | retrieval, question_answer_chain)
+    else:
+        retrieval = retriever
+        rag_chain = create_retrieval_chain(retriever, question_answer_chain)
     
+    # knowledge base ถูกโหลด/สร้างใหม่ คำตอบเก่าใน cache ใช้ไม่ได้แล้ว
+    ANSWER_CACHE.invalidate(kb_version)
+    FAQ_STORE.check_version(kb_version)
+    EMBEDDINGS_MODEL = embeddings_model
+    RAG_ANSWER_CHAIN = question_answer_chain
+    RAG_RETRIEVAL = retrieval
+    RAG_PROMPT_OVERHEAD_TOKENS = estimate_tokens(prompt_template)
+    LEXICAL_INDEX = lexical_index
+    SECTION_INDEX = (SectionIndex(splits, max_chunks=RAG_TOP_K, lexical_index=lexical_index)
+                     if RAG_SECTION_LOOKUP else None)
+
     logger.info("RAG chain setup complete.")
     
     # --- จุดที่แก้ไข Indentation ---
     return rag_chain
 
-# --- สร้าง Chain ไว้ล่วงหน้าตอนเริ่มโปรแกรม ---
-try:
-    markdown_file_path = "kmutnbBuddy.md"
-    RAG_CHAIN = setup_rag_chain(markdown_file_path)
-except Exception as e:
-    logger.error(f"FATAL: Error setting up RAG chain: {e}", exc_info=True)
-    RAG_CHAIN = None
+def build_rag_chain(file_path: str = "kmutnbBuddy.md"):
+    """สร้าง RAG chain แล้วเก็บไว้ใน RAG_CHAIN พร้อมอัปเดต RAG_STATUS"""
+    global RAG_CHAIN
+    RAG_STATUS.update(started_at=time.time(), finished_at=None, error=None)
+    try:
+        RAG_CHAIN = setup_rag_chain(file_path)
+        _set_phase("ready")
+    except Exception as e:
+        logger.error(f"FATAL: Error setting up RAG chain: {e}", exc_info=True)
+        RAG_STATUS["error"] = str(e)
+        _set_phase("failed")
+    finally:
+        RAG_STATUS["finished_at"] = time.time()
+    return RAG_CHAIN
+
+def start_rag_build(file_path: str = "kmutnbBuddy.md", background: bool = True):
+    """เริ่มสร้าง RAG chain (ครั้งเดียวต่อ process) ถ้า background=True จะไม่บล็อกการเริ่ม Flask app"""
+    global _rag_build_thread, _rag_build_pid, _rag_build_file
+    with _rag_build_lock:
+        if _rag_build_pid == os.getpid():
+            return
+        _rag_build_pid = os.getpid()
+        _rag_build_file = file_path
+        if RAG_CHAIN is not None:
+            # สร้างเสร็จใน process แม่ก่อน fork แล้ว (gunicorn --preload) ใช้ chain ที่ติดมาได้เลย
+            return
+        _rag_build_thread = threading.Thread(target=build_rag_chain, args=(file_path,), name="rag-build", daemon=True)
+    if FAQ_STORE_ENABLED:
+        # อ่านไฟล์ JSON เล็กๆ ไม่กี่ ms จึงโหลดก่อนเริ่มสร้าง chain ได้เลย
+        try:
+            FAQ_STORE.load(FAQ_STORE_DIR, source_hash(file_path))
+        except OSError as e:
+            logger.warning(f"Could not load FAQ store: {e}")
+    if background:
+        _rag_build_thread.start()
+    else:
+        _rag_build_thread.run()
+
+def ensure_rag_build():
+    """เริ่มสร้างใหม่ใน worker ถ้า start_rag_build ถูกเรียกใน process แม่ (gunicorn --preload)
+
+    thread ไม่ตามไปใน process ลูกหลัง fork: ถ้า chain ยังสร้างไม่เสร็จตอน fork worker จะค้างที่ "pending" ตลอด
+    จึงตรวจ pid แบบ lazy เหมือน JobQueue ทุกครั้งที่มีการถามสถานะหรือถามคำถาม
+    """
+    if _rag_build_file is not None and _rag_build_pid != os.getpid():
+        start_rag_build(_rag_build_file)
+
+def is_rag_ready() -> bool:
+    return RAG_CHAIN is not None
+
+def rag_status() -> dict:
+    """สถานะสำหรับ /ready: phase ปัจจุบันและเวลาที่ใช้ไป"""
+    ensure_rag_build()
+    status = dict(RAG_STATUS)
+    started_at = status["started_at"]
+    if started_at is not None:
+        end = status["finished_at"] or time.time()
+        status["elapsed_seconds"] = round(end - started_at, 3)
+    status["ready"] = is_rag_ready()
+    return status
+
+def faq_store_stats():
+    return FAQ_STORE.stats() if FAQ_STORE_ENABLED else None
+
+def section_index_stats():
+    return SECTION_INDEX.stats() if SECTION_INDEX is not None else None
+
+RAG_ERROR_MESSAGE = "เกิดข้อผิดพลาดในการประมวลผลคำถามค่ะ"
+
+def _prepare_answer(question: str):
+    """ขั้นตอนก่อนเรียก LLM ที่ใช้ร่วมกันระหว่าง answer_question และ answer_question_async
+
+    คืน (cache_key, คำตอบที่ได้ทันที หรือ None, chunk จาก section index หรือ None)
+    """
+    ensure_rag_build()
+    faq_answer = FAQ_STORE.lookup(question) if FAQ_STORE_ENABLED else None
+    if faq_answer is not None:
+        logger.info("Answered from FAQ store: '%s'", question, extra={"category": "message"})
+        count(ANSWER_SOURCES, "faq")
+        return None, faq_answer, None
 
-def answer_question(question: str) -> str:
     if RAG_CHAIN is None:
-        return "ขออภัยค่ะ ระบบ RAG ยังไม่พร้อมใช้งานเนื่องจากเกิดข้อผิดพลาดในการเริ่มต้น"
-        
+        # ยังสร้าง chain ไม่เสร็จ: ตอบกลับทันทีแทนการรอ (degraded path)
+        if RAG_STATUS["phase"] == "failed":
+            count(ANSWER_SOURCES, "rag_failed")
+            return None, RAG_FAILED_MESSAGE, None
+        count(ANSWER_SOURCES, "not_ready")
+        return None, RAG_NOT_READY_MESSAGE, None
+
+    cache_key = normalize_question(question)
+    cached_answer = ANSWER_CACHE.get(cache_key)
+    if cached_answer is not None:
+        logger.info("Answer cache hit (exact) for question: '%s'", question, extra={"category": "message"})
+        count(ANSWER_SOURCES, "exact_cache")
+        return cache_key, cached_answer, None
+
+    section_match = SECTION_INDEX.lookup(question) if SECTION_INDEX is not None else None
+    if section_match is not None:
+        logger.info("Answering from section index (%s: %s) for question: '%s'", section_match.kind,
+                    ", ".join(s.number or s.title for s in section_match.sections), question, extra={"category": "message"})
+        docs = section_match.documents
+        if RAG_CONTEXT_TOKEN_BUDGET > 0:
+            docs = CONTEXT_PACKER.pack(docs)
+        return cache_key, None, docs
+    return cache_key, None, None
+
+def has_free_answer(question: str) -> bool:
+    """ตอบได้โดยไม่เรียก LLM หรือไม่ (FAQ store, cache แบบตรงตัว, ข้อความแจ้งว่า chain ยังไม่พร้อม
+    หรือ breaker ของ Gemini เปิดอยู่ ซึ่งจะได้คำตอบสำรองที่ไม่ใช้ token)
+
+    ใช้ตัดสินก่อนนับ rate limit / โควตาของผู้ใช้ จึงไม่นับสถิติของ cache ซ้ำกับ _prepare_answer
+    """
+    if FAQ_STORE_ENABLED and FAQ_STORE.peek(question):
+        return True
+    if RAG_CHAIN is None:
+        return True
+    # ช่วง half-open ยังนับ: คำขอที่เป็น probe เรียก Gemini จริง
+    if LLM_BREAKER.state == OPEN:
+        return True
+    return ANSWER_CACHE.peek(normalize_question(question))
+
+def _semantic_cache_lookup(question: str, query_embedding):
+    cached_answer = ANSWER_CACHE.get_similar(query_embedding)
+    if cached_answer is not None:
+        logger.info("Answer cache hit (semantic) for question: '%s'", question, extra={"category": "message"})
+        count(ANSWER_SOURCES, "semantic_cache")
+    return cached_answer
+
+def answer_question(question: str) -> str:
+    # FAQ store, cache แบบตรงตัว และข้อความ "ยังไม่พร้อม" ตอบจาก _prepare_answer ก่อน single-flight
+    # ส่วน section index แค่เลือก chunk ให้ การเรียก LLM ด้วย chunk นั้นยังผ่าน ANSWER_FLIGHTS เหมือนคำถามอื่น
+    cache_key, answer, section_docs = _prepare_answer(question)
+    if answer is not None:
+        return answer
+    if ANSWER_COALESCE_TIMEOUT_SECONDS <= 0:
+        return _compute_answer(question, cache_key, section_docs)
+    # คำถามเดียวกัน (หลัง normalize) ที่เข้ามาพร้อมกัน เรียก embeddings/LLM แค่ครั้งเดียว
+    return ANSWER_FLIGHTS.do(cache_key, _compute_answer, question, cache_key, section_docs)
+
+def _record_rag_usage(question: str, docs, answer: str):
+    # ChatGoogleGenerativeAI ไม่คืน usage_metadata ผ่าน chain จึงประมาณจากความยาวของ prompt และคำตอบ
+    prompt_tokens = RAG_PROMPT_OVERHEAD_TOKENS + estimate_tokens(question)
+    prompt_tokens += sum(estimate_tokens(doc.page_content) for doc in docs)
+    record_llm_usage(prompt_tokens, estimate_tokens(answer))
+
+def _degraded_answer(question: str, docs=None) -> str:
+    """คำตอบระหว่าง circuit ของ Gemini เปิด: ข้อความของ chunk อันดับแรกตามตัวอักษร (ไม่ผ่าน LLM และไม่เก็บลง cache)"""
+    count(ANSWER_SOURCES, "degraded")
+    if not docs and LEXICAL_INDEX is not None:
+        docs = [doc for doc, _ in LEXICAL_INDEX.search(question, k=1)]
+    if not docs:
+        return LLM_UNAVAILABLE_MESSAGE
+    text = docs[0].page_content.strip()
+    if len(text) > DEGRADED_MAX_CHARS:
+        text = text[:DEGRADED_MAX_CHARS].rstrip() + "…"
+    header_path = docs[0].metadata.get("header_path")
+    if header_path:
+        return f"{RAG_DEGRADED_PREFIX}\n\n{header_path}\n{text}"
+    return f"{RAG_DEGRADED_PREFIX}\n\n{text}"
+
+def _compute_answer(question: str, cache_key: str, section_docs) -> str:
+    if LLM_BREAKER.state == OPEN:
+        # ไม่ต้อง embed/retrieve ผ่าน API ระหว่าง upstream มีปัญหา ตอบจาก BM25 ทันที
+        return _degraded_answer(question, section_docs)
+    cache_version = ANSWER_CACHE.version
+    query_embedding = None
+    if section_docs is None:
+        if ANSWER_CACHE_SEMANTIC and EMBEDDINGS_MODEL is not None:
+            try:
+                with span("rag_embed"):
+                    query_embedding = EMBEDDINGS_MODEL.embed_query(question)
+            except Exception as e:
+                logger.warning(f"Could not embed question for semantic cache lookup: {e}")
+        cached_answer = _semantic_cache_lookup(question, query_embedding)
+        if cached_answer is not None:
+            return cached_answer
+
+    try:
+        docs = section_docs
+        if docs is None:
+            logger.info("Invoking RAG chain with question: '%s'", question, extra={"category": "message"})
+            with span("rag_retrieve"):
+                docs = RAG_RETRIEVAL.invoke(question)
+        with span("rag_generate"):
+            answer = LLM_BREAKER.call(RAG_ANSWER_CHAIN.invoke, {"input": question, "context": docs})
+        _record_rag_usage(question, docs, answer)
+        ANSWER_CACHE.put(cache_key, answer, query_embedding, version=cache_version)
+        count(ANSWER_SOURCES, "rag" if section_docs is None else "section_index")
+        return answer
+    except CircuitOpenError:
+        return _degraded_answer(question, docs)
+    except Exception as e:
+        logger.error(f"Error invoking RAG chain: {e}", exc_info=True)
+        count(ANSWER_SOURCES, "error")
+        return RAG_ERROR_MESSAGE
+
+async def answer_question_async(question: str) -> str:
+    """answer_question แบบ coroutine สำหรับ asgi_app: เรียก embeddings/LLM ผ่าน API แบบ async ของ LangChain"""
+    cache_key, answer, section_docs = _prepare_answer(question)
+    if answer is not None:
+        return answer
+    if ANSWER_COALESCE_TIMEOUT_SECONDS <= 0:
+        return await _compute_answer_async(question, cache_key, section_docs)
+    return await ANSWER_FLIGHTS.do_async(cache_key, _compute_answer_async, question, cache_key, section_docs)
+
+async def _compute_answer_async(question: str, cache_key: str, section_docs) -> str:
+    if LLM_BREAKER.state == OPEN:
+        return _degraded_answer(question, section_docs)
+    cache_version = ANSWER_CACHE.version
+    query_embedding = None
+    if section_docs is None:
+        if ANSWER_CACHE_SEMANTIC and EMBEDDINGS_MODEL is not None:
+            try:
+                with span("rag_embed"):
+                    query_embedding = await EMBEDDINGS_MODEL.aembed_query(question)
+            except Exception as e:
+                logger.warning(f"Could not embed question for semantic cache lookup: {e}")
+        cached_answer = _semantic_cache_lookup(question, query_embedding)
+        if cached_answer is not None:
+            return cached_answer
+
     try:
-        logger.info(f"Invoking RAG chain with question: '{question}'")
-        response = RAG_CHAIN.invoke({"input": question})
-        return response["answer"]
+        docs = section_docs
+        if docs is None:
+            logger.info("Invoking RAG chain (async) with question: '%s'", question, extra={"category": "message"})
+            with span("rag_retrieve"):
+                docs = await RAG_RETRIEVAL.ainvoke(question)
+        with span("rag_generate"):
+            answer = await LLM_BREAKER.call_async(RAG_ANSWER_CHAIN.ainvoke, {"input": question, "context": docs})
+        _record_rag_usage(question, docs, answer)
+        ANSWER_CACHE.put(cache_key, answer, query_embedding, version=cache_version)
+        count(ANSWER_SOURCES, "rag" if section_docs is None else "section_index")
+        return answer
+    except CircuitOpenError:
+        return _degraded_answer(question, docs)
     except Exception as e:
         logger.error(f"Error invoking RAG chain: {e}", exc_info=True)
-        return "เกิดข้อผิดพลาดในการประมวลผลคำถามค่ะ"
\ No newline at end of file
+        count(ANSWER_SOURCES, "error")
+        return RAG_ERROR_MESSAGE
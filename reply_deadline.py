@@ -0,0 +1,202 @@
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from job_queue import JobQueue
+
+logger = logging.getLogger(__name__)
+
+
+class DeadlineTimer:
+    """thread เดียวที่เรียก callback เมื่อถึงเวลา ใช้แทน threading.Timer ที่ต้องสร้าง thread ต่อ 1 ข้อความ"""
+
+    def __init__(self, name: str = "deadline-timer"):
+        self.name = name
+        self._heap = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._pid = None
+
+    def _ensure_started(self):
+        # สร้าง thread แบบ lazy หลัง gunicorn fork แล้ว (เหมือน JobQueue)
+        if self._pid == os.getpid():
+            return
+        with self._cond:
+            if self._pid == os.getpid():
+                return
+            self._heap = []
+            threading.Thread(target=self._run, name=self.name, daemon=True).start()
+            self._pid = os.getpid()
+
+    def schedule(self, when: float, func, *args):
+        """เรียก func(*args) ที่เวลา when (time.time()) คืน entry ไว้ใช้กับ cancel()"""
+        self._ensure_started()
+        entry = [when, next(self._seq), func, args, False]
+        with self._cond:
+            heapq.heappush(self._heap, entry)
+            if self._heap[0] is entry:
+                self._cond.notify()
+        return entry
+
+    def cancel(self, entry):
+        # ไม่ลบออกจาก heap (O(n)) แค่ทำเครื่องหมายไว้ ตอนถึงเวลาจะถูกข้าม
+        entry[4] = True
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._heap:
+                    self._cond.wait()
+                entry = self._heap[0]
+                delay = entry[0] - time.time()
+                if delay > 0:
+                    self._cond.wait(delay)
+                    continue
+                heapq.heappop(self._heap)
+            if entry[4]:
+                continue
+            try:
+                entry[2](*entry[3])
+            except Exception as e:
+                logger.error(f"Deadline callback failed: {e}", exc_info=True)
+
+
+class ReplyTicket:
+    """สถานะการตอบของ 1 ข้อความ: ตอบทันเวลา หรือส่งข้อความรอ (placeholder) ไปก่อนแล้ว"""
+
+    __slots__ = ("started_at", "timer_entry", "lock", "placeholder", "placeholder_ok", "placeholder_done", "done")
+
+    def __init__(self, started_at: float):
+        self.started_at = started_at
+        self.timer_entry = None
+        self.lock = threading.Lock()
+        self.placeholder = False
+        self.placeholder_ok = False
+        self.placeholder_done = threading.Event()
+        self.done = False
+
+
+class ReplyDeadline:
+    """ตอบภายใน deadline ของ reply token: ถ้าคำตอบยังไม่เสร็จจะส่ง placeholder ก่อน แล้ว push คำตอบจริงตามไป
+
+    start() ตั้งเวลาเรียก send_placeholder เมื่อครบ deadline_seconds นับจากเวลาที่ LINE ส่ง event
+    finish() เลือกเส้นทางการส่งคำตอบ และเก็บสถิติจำนวนแต่ละเส้นทาง + latency ตั้งแต่รับ event จนส่งคำตอบ
+    """
+
+    def __init__(self, deadline_seconds: float, placeholder_uses_reply_token: bool = True,
+                 placeholder_workers: int = 2, max_samples: int = 2048):
+        self.deadline_seconds = deadline_seconds
+        self.placeholder_uses_reply_token = placeholder_uses_reply_token
+        self._timer = DeadlineTimer()
+        self._placeholders = JobQueue(workers=placeholder_workers, maxsize=256, name="reply-placeholder")
+        self._lock = threading.Lock()
+        self._paths = {}
+        self._placeholder_failed = 0
+        self._push_requests = 0
+        self._push_messages = 0
+        self._samples = deque(maxlen=max_samples)
+
+    @property
+    def enabled(self) -> bool:
+        return self.deadline_seconds > 0
+
+    def start(self, started_at: float, send_placeholder):
+        """เริ่มนับเวลาของข้อความที่ LINE ส่งมาเมื่อ started_at (epoch วินาที)"""
+        ticket = ReplyTicket(started_at)
+        if self.enabled:
+            ticket.timer_entry = self._timer.schedule(
+                started_at + self.deadline_seconds, self._on_deadline, ticket, send_placeholder
+            )
+        return ticket
+
+    def _on_deadline(self, ticket, send_placeholder):
+        with ticket.lock:
+            if ticket.done:
+                return
+            ticket.placeholder = True
+        # ส่ง HTTP ใน worker แยก เพื่อไม่ให้ timer thread ช้าเมื่อ placeholder หลายอันครบเวลาพร้อมกัน
+        if not self._placeholders.submit(self._send_placeholder, ticket, send_placeholder):
+            self._send_placeholder(ticket, send_placeholder)
+
+    def _send_placeholder(self, ticket, send_placeholder):
+        try:
+            send_placeholder()
+            ticket.placeholder_ok = True
+        except Exception as e:
+            self.record_placeholder_failure()
+            logger.error(f"Failed to send reply placeholder: {e}", exc_info=True)
+        finally:
+            ticket.placeholder_done.set()
+
+    def finish(self, ticket, send_reply, send_push) -> str:
+        """ส่งคำตอบจริง คืนชื่อเส้นทางที่ใช้ ("reply", "placeholder_push", "placeholder_reply")"""
+        with ticket.lock:
+            ticket.done = True
+            placeholder = ticket.placeholder
+        if ticket.timer_entry is not None:
+            self._timer.cancel(ticket.timer_entry)
+
+        if not placeholder:
+            path = "reply"
+            send_reply()
+        else:
+            # รอให้ placeholder ส่งเสร็จก่อน ไม่ให้คำตอบจริงไปถึงก่อนข้อความรอ
+            ticket.placeholder_done.wait(timeout=10)
+            if ticket.placeholder_ok and self.placeholder_uses_reply_token:
+                path = "placeholder_push"
+                send_push()
+            else:
+                # placeholder ไม่ได้ใช้ reply token (หรือส่งไม่สำเร็จ): ลอง reply ก่อน ถ้า token หมดอายุค่อย push
+                try:
+                    send_reply()
+                    path = "placeholder_reply"
+                except Exception as e:
+                    logger.warning(f"Reply after placeholder failed ({e}), pushing the answer instead.")
+                    path = "placeholder_push"
+                    send_push()
+        self.record(path, time.time() - ticket.started_at)
+        return path
+
+    def record(self, path: str, latency_seconds: float):
+        with self._lock:
+            self._paths[path] = self._paths.get(path, 0) + 1
+            self._samples.append(latency_seconds)
+
+    def record_push(self, messages: int):
+        """นับ push ที่ส่งสำเร็จ: LINE คิดโควตาต่อ message object ใน push (reply ไม่นับโควตา)"""
+        with self._lock:
+            self._push_requests += 1
+            self._push_messages += messages
+
+    def record_placeholder_failure(self):
+        with self._lock:
+            self._placeholder_failed += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            samples = sorted(self._samples)
+            paths = dict(self._paths)
+            placeholder_failed = self._placeholder_failed
+            push = {"requests": self._push_requests, "messages": self._push_messages}
+
+        def quantile(q):
+            return round(samples[min(len(samples) - 1, int(q * len(samples)))] * 1000, 1) if samples else None
+
+        return {
+            "deadline_seconds": self.deadline_seconds,
+            "paths": paths,
+            "placeholder_failed": placeholder_failed,
+            "push": push,
+            "latency_ms": {
+                "samples": len(samples),
+                "p50": quantile(0.50),
+                "p90": quantile(0.90),
+                "p95": quantile(0.95),
+                "p99": quantile(0.99),
+                "max": round(samples[-1] * 1000, 1) if samples else None,
+            },
+        }
@@ -0,0 +1,162 @@
+import re
+import threading
+import time
+from collections import namedtuple
+
+from keyword_matcher import KeywordMatcher
+
+# header ที่ MarkdownHeaderTextSplitter ไม่ได้ใช้แบ่ง (####, #####) ยังอยู่ในเนื้อหาของ chunk
+_INLINE_HEADING_RE = re.compile(r"^(#{4,6})\s+(.+?)\s*$", re.MULTILINE)
+_SECTION_NUMBER_RE = re.compile(r"^(\d+(?:\.\d+)+)\s*(.*)$")
+# เลขหัวข้อในคำถาม: 3 ระดับขึ้นไปใช้ได้เลย ส่วน 2 ระดับ (เช่น 2.2) ต้องมีคำว่า ข้อ/หัวข้อ นำหน้า
+# เพื่อไม่ให้สับสนกับตัวเลขทศนิยม เช่น เกรด 3.5
+_DEEP_NUMBER_RE = re.compile(r"(?<![\d.])(\d+(?:\.\d+){2,})(?![\d.]*\d)")
+_CUED_NUMBER_RE = re.compile(r"(?:หัวข้อ|ข้อ|section)\s*(\d+\.\d+)(?![\d.]*\d)", re.IGNORECASE)
+
+Section = namedtuple("Section", ["number", "title", "level", "path", "chunks"])
+SectionMatch = namedtuple("SectionMatch", ["kind", "sections", "documents", "elapsed_ms"])
+
+
+class SectionIndex:
+    """ดัชนีหัวข้อจากโครงสร้าง header ของ kmutnbBuddy.md (Header 1-3 ใน metadata + ####/##### ในเนื้อหา)
+
+    คำถามที่ระบุเลขหัวข้อ (เช่น 2.2.1) หรือชื่อหัวข้อตรงตัว (เช่น "Eduroam") จะได้ chunk ของหัวข้อนั้นทันที
+    โดยไม่ต้อง embed คำถามหรือค้น vector store ชื่อหัวข้อที่ซ้ำกันหลายที่จะไม่ถูกใช้ (ให้ retriever ตัดสินแทน)
+    หัวข้อใหญ่ที่มี chunk เกิน max_chunks เลือก chunk ด้วยคะแนน BM25 ของ lexical_index (ถ้ามี) แทนการตัดตามลำดับไฟล์
+    """
+
+    def __init__(self, splits, max_chunks: int = 8, min_title_chars: int = 6, max_title_chars: int = 80,
+                 lexical_index=None):
+        self.max_chunks = max_chunks
+        self.lexical_index = lexical_index
+        self.sections = {}
+        self.by_number = {}
+        self._by_title = {}
+        self._open = {}
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.number_hits = 0
+        self.title_hits = 0
+        self.ranked = 0
+
+        for doc in splits:
+            for section in self._sections_of(doc):
+                if not section.chunks or section.chunks[-1] is not doc:
+                    section.chunks.append(doc)
+        del self._open
+
+        for section in self.sections.values():
+            if section.number:
+                self.by_number.setdefault(section.number, section)
+            if section.level >= 3 and min_title_chars <= len(section.title) <= max_title_chars:
+                self._by_title.setdefault(section.title.lower(), []).append(section)
+        self._titles = KeywordMatcher()
+        for title, sections in self._by_title.items():
+            if len(sections) == 1:
+                self._titles.add(title, sections[0])
+        self._titles.build()
+
+    def _section(self, path, level, heading):
+        section = self.sections.get(path)
+        if section is None:
+            match = _SECTION_NUMBER_RE.match(heading)
+            number, title = (match.group(1), match.group(2) or heading) if match else (None, heading)
+            section = Section(number, title.strip(), level, path, [])
+            self.sections[path] = section
+        return section
+
+    def _sections_of(self, doc):
+        """หัวข้อทั้งหมดที่ chunk นี้อยู่ภายใน (ตาม metadata) หรือเริ่มต้นขึ้นใน chunk นี้"""
+        stack = []
+        for level in (1, 2, 3):
+            heading = doc.metadata.get(f"Header {level}")
+            if heading:
+                path = (stack[-1].path if stack else ()) + (heading,)
+                stack.append(self._section(path, level, heading))
+        base = stack[-1].path if stack else ()
+        # chunk ที่แบ่งย่อยต่อจาก chunk ก่อนหน้ายังอยู่ใต้หัวข้อย่อยเดิม
+        found = list(stack) + list(self._open.get(base, ()))
+        stack = list(self._open.get(base, ()))
+        for match in _INLINE_HEADING_RE.finditer(doc.page_content):
+            level = len(match.group(1))
+            while stack and stack[-1].level >= level:
+                stack.pop()
+            path = (stack[-1].path if stack else base) + (match.group(2),)
+            stack.append(self._section(path, level, match.group(2)))
+            found.append(stack[-1])
+        self._open[base] = stack
+        return found
+
+    def lookup(self, question: str):
+        """คืน SectionMatch ถ้าคำถามระบุเลขหัวข้อหรือชื่อหัวข้อที่รู้จัก ไม่เช่นนั้นคืน None"""
+        start = time.perf_counter()
+        kind = "number"
+        sections = []
+        for pattern in (_DEEP_NUMBER_RE, _CUED_NUMBER_RE):
+            for match in pattern.finditer(question):
+                section = self.by_number.get(match.group(1))
+                if section is not None and all(section.path != other.path for other in sections):
+                    sections.append(section)
+        if not sections:
+            kind = "title"
+            sections = self._match_titles(question)
+
+        with self._lock:
+            self.lookups += 1
+            if sections:
+                if kind == "number":
+                    self.number_hits += 1
+                else:
+                    self.title_hits += 1
+        if not sections:
+            return None
+
+        documents = []
+        seen = set()
+        for section in sections:
+            for doc in section.chunks:
+                if id(doc) not in seen:
+                    seen.add(id(doc))
+                    documents.append(doc)
+        if len(documents) > self.max_chunks:
+            documents = self._select(question, documents)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        return SectionMatch(kind, sections, documents, elapsed_ms)
+
+    def _select(self, question: str, documents):
+        """เลือก max_chunks chunk ที่ตรงกับคำถามที่สุดในหัวข้อ แล้วเรียงกลับตามลำดับไฟล์ (ContextPacker รวม chunk ที่ติดกันได้)
+
+        ไม่มี lexical index หรือคำถามไม่มีคำที่ช่วยแยก (คะแนนเท่ากันหมด) = chunk ต้นหัวข้อเหมือนเดิม
+        """
+        if self.lexical_index is None:
+            return documents[:self.max_chunks]
+        with self._lock:
+            self.ranked += 1
+        chosen = {id(doc) for doc in self.lexical_index.rank(question, documents)[:self.max_chunks]}
+        return [doc for doc in documents if id(doc) in chosen]
+
+    def _match_titles(self, question: str):
+        hits = self._titles.find_all(question)
+        # เลือกชื่อที่ยาวที่สุด ตัดชื่อที่เป็นส่วนหนึ่งของชื่ออื่นที่เจอ
+        hits.sort(key=lambda hit: (hit[0], -(hit[1] - hit[0])))
+        sections = []
+        covered_end = -1
+        for begin, end, section in hits:
+            if end <= covered_end:
+                continue
+            covered_end = end
+            if all(section.path != other.path for other in sections):
+                sections.append(section)
+        return sections
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "sections": len(self.sections),
+                "numbered_sections": len(self.by_number),
+                "titles": self._titles.pattern_count,
+                "lookups": self.lookups,
+                "number_hits": self.number_hits,
+                "title_hits": self.title_hits,
+                "ranked": self.ranked,
+            }
@@ -0,0 +1,251 @@
+import logging
+import os
+import queue
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+_writer_nonce = None
+_writer_pid = None
+
+
+def _writer_id() -> str:
+    # ระบุ process ที่เขียนข้อมูล: hostname:pid ซ้ำได้หลัง restart (container มักได้ pid เดิม)
+    # จึงต่อด้วย nonce สุ่มที่สร้างใหม่เมื่อ pid เปลี่ยน (gunicorn fork หลัง import)
+    global _writer_nonce, _writer_pid
+    if _writer_pid != os.getpid():
+        _writer_nonce = uuid.uuid4().hex
+        _writer_pid = os.getpid()
+    return f"{socket.gethostname()}:{_writer_pid}:{_writer_nonce}"
+
+
+class SessionBackend:
+    """ที่เก็บประวัติบทสนทนาที่ทุก worker ใช้ร่วมกัน
+
+    load() คืน (รายการ (role, text) เรียงจากเก่าไปใหม่, head) โดย head ใช้ตรวจว่ามี worker อื่นเขียนเพิ่มหรือไม่
+    """
+
+    def load(self, user_id: str, limit: int):
+        return [], None
+
+    def head(self, user_id: str):
+        """ตัวระบุล่าสุดของข้อมูลที่ process อื่นเขียน (None = ไม่ต้องตรวจ)"""
+        return None
+
+    def append_turn(self, user_id: str, user_text: str, model_text: str):
+        pass
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+    def stats(self) -> dict:
+        return {"backend": "memory"}
+
+
+class SQLiteSessionBackend(SessionBackend):
+    """เก็บประวัติใน SQLite (WAL mode) ให้หลาย gunicorn worker อ่าน/เขียนไฟล์เดียวกันได้
+
+    การเขียนถูกรวมเป็น batch โดย writer thread เพื่อไม่ให้ request thread ต้องรอ disk
+    แถวที่ยังรอเขียนเก็บไว้ในหน่วยความจำแยกตามผู้ใช้ load() จึงอ่านส่วนที่ commit แล้วต่อด้วยแถวที่ค้างของผู้ใช้นั้น
+    โดยไม่ต้องรอ writer
+    """
+
+    def __init__(self, path: str = "sessions.db", keep_contents: int = 20,
+                 batch_size: int = 64, flush_interval: float = 0.2):
+        self.path = path
+        self.keep_contents = max(2, keep_contents)
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._pid = None
+        self._queue = None
+        self._writer = None
+        self._pending = {}  # user_id -> deque ของแถวที่อยู่ในคิวแต่ยังไม่ถูกเขียน (เรียงตามลำดับในคิว)
+
+        self.rows_written = 0
+        self.batches_written = 0
+        self.write_errors = 0
+        self.loads = 0
+
+        conn = self._connect()
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS turns (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id TEXT NOT NULL,
+                role TEXT NOT NULL,
+                text TEXT NOT NULL,
+                writer TEXT NOT NULL,
+                created_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_turns_user ON turns(user_id, id);
+        """)
+        conn.close()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _reader(self):
+        # แต่ละ thread/process มี connection ของตัวเอง (sqlite connection ข้าม fork ไม่ได้)
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = self._connect()
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _ensure_writer(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue()
+            self._pending = {}
+            self._writer = threading.Thread(target=self._write_loop, name="session-writer", daemon=True)
+            self._writer.start()
+            self._pid = os.getpid()
+
+    def load(self, user_id: str, limit: int):
+        # จับแถวที่ค้างก่อนอ่าน disk: แถวที่ writer commit ระหว่างนี้จะอยู่ทั้งสองฝั่ง แล้วถูกตัดซ้ำด้านล่าง
+        with self._lock:
+            pending = list(self._pending.get(user_id, ())) if self._pid == os.getpid() else []
+            self.loads += 1
+        conn = self._reader()
+        rows = conn.execute(
+            "SELECT id, role, text, writer, created_at FROM "
+            "(SELECT id, role, text, writer, created_at FROM turns WHERE user_id = ? ORDER BY id DESC LIMIT ?) ORDER BY id",
+            (user_id, limit),
+        ).fetchall()
+        committed = {(role, text, writer, created_at) for _, role, text, writer, created_at in rows}
+        turns = [(role, text) for _, role, text, _, _ in rows]
+        turns.extend((role, text) for _, role, text, writer, created_at in pending
+                     if (role, text, writer, created_at) not in committed)
+        turns = turns[-limit:] if limit > 0 else turns
+        # ประวัติต้องขึ้นต้นด้วยข้อความของ user
+        while turns and turns[0][0] != "user":
+            turns.pop(0)
+        return turns, self.head(user_id)
+
+    def head(self, user_id: str):
+        row = self._reader().execute(
+            "SELECT MAX(id) FROM turns WHERE user_id = ? AND writer <> ?", (user_id, _writer_id())
+        ).fetchone()
+        return row[0] or 0
+
+    def append_turn(self, user_id: str, user_text: str, model_text: str):
+        self._ensure_writer()
+        now = time.time()
+        writer = _writer_id()
+        rows = ((user_id, "user", user_text, writer, now), (user_id, "model", model_text, writer, now))
+        with self._lock:
+            self._pending.setdefault(user_id, deque()).extend(rows)
+        for row in rows:
+            self._queue.put(row)
+
+    def _release_pending(self, batch):
+        # writer เขียนตามลำดับคิว แถวของ batch จึงเป็นแถวแรกๆ ใน deque ของผู้ใช้แต่ละคนเสมอ
+        with self._lock:
+            for row in batch:
+                rows = self._pending.get(row[0])
+                if rows:
+                    rows.popleft()
+                    if not rows:
+                        del self._pending[row[0]]
+
+    def flush(self):
+        """รอให้ writer thread เขียนข้อมูลที่ค้างอยู่ลง disk (load ไม่ต้องเรียก)"""
+        if self._pid == os.getpid() and self._queue is not None:
+            self._queue.join()
+
+    def _write_loop(self):
+        conn = self._connect()
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                conn.close()
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            stop = False
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    nxt = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if nxt is None:
+                    stop = True
+                    break
+                batch.append(nxt)
+            try:
+                self._write_batch(conn, batch)
+            except Exception as e:
+                self.write_errors += 1
+                logger.error(f"Failed to write {len(batch)} session rows to {self.path}: {e}", exc_info=True)
+            finally:
+                self._release_pending(batch)
+                for _ in batch:
+                    self._queue.task_done()
+            if stop:
+                self._queue.task_done()
+                conn.close()
+                return
+
+    def _write_batch(self, conn, batch):
+        with conn:
+            conn.executemany(
+                "INSERT INTO turns (user_id, role, text, writer, created_at) VALUES (?, ?, ?, ?, ?)", batch
+            )
+            # ลบประวัติเก่าที่เกินจำนวนที่ต้องใช้ของผู้ใช้ที่เพิ่งเขียน
+            for user_id in {row[0] for row in batch}:
+                conn.execute(
+                    "DELETE FROM turns WHERE user_id = ? AND id <= "
+                    "(SELECT id FROM turns WHERE user_id = ? ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                    (user_id, user_id, self.keep_contents),
+                )
+        self.rows_written += len(batch)
+        self.batches_written += 1
+
+    def close(self):
+        if self._pid != os.getpid() or self._queue is None:
+            return
+        self._queue.put(None)
+        self._writer.join(timeout=5)
+        self._pid = None
+
+    def stats(self) -> dict:
+        return {
+            "backend": "sqlite",
+            "path": self.path,
+            "pending_rows": self._queue.qsize() if self._pid == os.getpid() and self._queue is not None else 0,
+            "rows_written": self.rows_written,
+            "batches_written": self.batches_written,
+            "write_errors": self.write_errors,
+            "loads": self.loads,
+        }
+
+
+def create_session_backend(name: str, **kwargs) -> SessionBackend:
+    """สร้าง backend ตามชื่อ: "sqlite" (ค่าเริ่มต้น) หรือ "memory" (ไม่แชร์ข้าม worker, ไม่ใช้ kwargs)"""
+    name = (name or "sqlite").lower()
+    if name == "sqlite":
+        return SQLiteSessionBackend(**kwargs)
+    if name == "memory":
+        return SessionBackend()
+    raise ValueError(f"Unknown session backend '{name}'")
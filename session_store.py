@@ -0,0 +1,125 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class SessionStore:
+    """เก็บ Gemini ChatSession ต่อผู้ใช้แบบจำกัดขนาด
+
+    - max_users: จำนวนผู้ใช้สูงสุด เกินแล้วไล่ session ที่ไม่ได้ใช้นานที่สุดออก (LRU)
+    - idle_ttl_seconds: session ที่ไม่มีการใช้งานนานเกินกำหนดจะถูกลบ
+    - max_turns: เก็บประวัติไว้แค่ N รอบล่าสุด (1 รอบ = user + model) เพื่อไม่ให้ prompt โตไม่สิ้นสุด
+    """
+
+    def __init__(self, max_users: int = 1000, idle_ttl_seconds: float = 1800, max_turns: int = 10):
+        self.max_users = max(1, max_users)
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self.max_turns = max(1, max_turns)
+        self._sessions = OrderedDict()  # user_id -> (session, last_access, token)
+        self._lock = threading.Lock()
+
+        self.created = 0
+        self.reloaded = 0
+        self.evicted_lru = 0
+        self.evicted_idle = 0
+        self.trimmed_contents = 0
+
+    def _expired(self, last_access: float, now: float) -> bool:
+        return self.idle_ttl_seconds > 0 and now - last_access > self.idle_ttl_seconds
+
+    def _sweep_idle(self, now: float):
+        # OrderedDict เรียงตามเวลาใช้งานล่าสุด จึงหยุดได้ทันทีเมื่อเจอ session ที่ยังไม่หมดอายุ
+        while self._sessions:
+            user_id, (_, last_access, _) = next(iter(self._sessions.items()))
+            if not self._expired(last_access, now):
+                break
+            self._sessions.popitem(last=False)
+            self.evicted_idle += 1
+
+    def get_or_create(self, user_id, factory, token=None):
+        """คืน session ของผู้ใช้ ถ้าไม่มี (หรือหมดอายุแล้ว) จะสร้างใหม่ด้วย factory()
+
+        token: ตัวระบุเวอร์ชันของประวัติใน backend ที่แชร์กัน ถ้าไม่ตรงกับตอนสร้าง session จะสร้างใหม่
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._sweep_idle(now)
+            entry = self._sessions.get(user_id)
+            if entry is not None:
+                if token is None or entry[2] == token:
+                    self._sessions[user_id] = (entry[0], now, entry[2])
+                    self._sessions.move_to_end(user_id)
+                    return entry[0]
+                self.reloaded += 1
+
+        session = factory()
+        with self._lock:
+            entry = self._sessions.get(user_id)
+            if entry is not None and (token is None or entry[2] == token):  # thread อื่นสร้างไว้ก่อนแล้ว
+                self._sessions.move_to_end(user_id)
+                return entry[0]
+            if entry is None:
+                self.created += 1
+            self._sessions[user_id] = (session, now, token)
+            self._sessions.move_to_end(user_id)
+            while len(self._sessions) > self.max_users:
+                self._sessions.popitem(last=False)
+                self.evicted_lru += 1
+        return session
+
+    def discard(self, user_id):
+        with self._lock:
+            self._sessions.pop(user_id, None)
+
+    def trim(self, session):
+        """ตัดประวัติให้เหลือ max_turns รอบล่าสุด โดยให้ข้อความแรกเป็นของ user เสมอ"""
+        try:
+            history = session.history
+        except Exception as e:
+            logger.warning(f"Cannot read chat history for trimming: {e}")
+            return
+        limit = self.max_turns * 2
+        if len(history) <= limit:
+            return
+        cut = len(history) - limit
+        while cut < len(history) and getattr(history[cut], "role", "user") != "user":
+            cut += 1
+        del history[:cut]
+        with self._lock:
+            self.trimmed_contents += cut
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __contains__(self, user_id):
+        return user_id in self._sessions
+
+    def stats(self) -> dict:
+        with self._lock:
+            sessions = [entry[0] for entry in self._sessions.values()]
+            stats = {
+                "users": len(sessions),
+                "max_users": self.max_users,
+                "idle_ttl_seconds": self.idle_ttl_seconds,
+                "max_turns": self.max_turns,
+                "created": self.created,
+                "reloaded": self.reloaded,
+                "evicted_lru": self.evicted_lru,
+                "evicted_idle": self.evicted_idle,
+                "trimmed_contents": self.trimmed_contents,
+            }
+        history_contents = 0
+        history_bytes = 0
+        for session in sessions:
+            # อ่าน _history ตรงๆ เพราะ property history มี side effect (รวมคำตอบล่าสุดเข้าประวัติ)
+            history = getattr(session, "_history", None) or []
+            history_contents += len(history)
+            for content in history:
+                for part in getattr(content, "parts", []):
+                    history_bytes += len(getattr(part, "text", "").encode("utf-8"))
+        stats["history_contents"] = history_contents
+        stats["history_text_bytes"] = history_bytes
+        return stats
@@ -0,0 +1,135 @@
+import asyncio
+import threading
+
+
+class _Call:
+    __slots__ = ("done", "result", "error", "followers")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.followers = 0
+
+
+class _AsyncCall:
+    __slots__ = ("future", "followers")
+
+    def __init__(self, future):
+        self.future = future
+        self.followers = 0
+
+
+class SingleFlight:
+    """รวมการเรียกที่ key เดียวกันและเกิดขึ้นพร้อมกันให้เหลือการเรียกจริงครั้งเดียว
+
+    ผู้เรียกคนแรก (leader) เป็นคนคำนวณ ผู้เรียกที่มาระหว่างนั้น (follower) รอผลเดียวกันไม่เกิน timeout_seconds
+    ถ้ารอเกินเวลาจะคำนวณเองแทน (ไม่ผูกผู้ใช้ไว้กับ leader ที่ค้าง) ผลจะไม่ถูกเก็บไว้หลัง leader ทำเสร็จ
+    (ใช้ AnswerCache สำหรับเรื่องนั้น) do() ใช้กับ thread ส่วน do_async() ใช้ใน event loop ของ asgi_app
+    """
+
+    def __init__(self, timeout_seconds: float = 30.0):
+        self.timeout_seconds = timeout_seconds
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._async_calls = {}
+
+        self.leaders = 0
+        self.coalesced = 0
+        self.timeouts = 0
+        self.max_followers = 0
+
+    def _finish(self, calls, key, call):
+        with self._lock:
+            if calls.get(key) is call:
+                del calls[key]
+            self.max_followers = max(self.max_followers, call.followers)
+
+    def do(self, key, func, *args):
+        """คืนผลของ func(*args) โดยเรียก func จริงเพียงครั้งเดียวต่อกลุ่มผู้เรียก key เดียวกันที่มาพร้อมกัน"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+                leader = True
+            else:
+                call.followers += 1
+                leader = False
+
+        if not leader:
+            if call.done.wait(self.timeout_seconds):
+                with self._lock:
+                    self.coalesced += 1
+                if call.error is not None:
+                    raise call.error
+                return call.result
+            with self._lock:
+                self.timeouts += 1
+            return func(*args)
+
+        try:
+            call.result = func(*args)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            self._finish(self._calls, key, call)
+            call.done.set()
+
+    async def do_async(self, key, func, *args):
+        """do() สำหรับ coroutine: func(*args) ต้องคืน awaitable"""
+        with self._lock:
+            call = self._async_calls.get(key)
+            if call is None:
+                call = self._async_calls[key] = _AsyncCall(asyncio.get_running_loop().create_future())
+                self.leaders += 1
+                leader = True
+            else:
+                call.followers += 1
+                leader = False
+        future = call.future
+
+        if not leader:
+            try:
+                # shield: follower ที่ timeout หรือถูก cancel ต้องไม่ยกเลิกผลของคนอื่น
+                result = await asyncio.wait_for(asyncio.shield(future), self.timeout_seconds)
+            except asyncio.TimeoutError:
+                with self._lock:
+                    self.timeouts += 1
+                return await func(*args)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+                # leader ถูก cancel (เช่น ตอน shutdown) แต่ follower ยังต้องการคำตอบ
+                return await func(*args)
+            with self._lock:
+                self.coalesced += 1
+            return result
+
+        try:
+            result = await func(*args)
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # follower ได้ exception ไปแล้ว ไม่ต้องให้ asyncio เตือนว่าไม่มีใครอ่าน
+            future.exception()
+            raise
+        finally:
+            self._finish(self._async_calls, key, call)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "timeout_seconds": self.timeout_seconds,
+                "in_flight": len(self._calls) + len(self._async_calls),
+                "leaders": self.leaders,
+                "upstream_calls_saved": self.coalesced,
+                "follower_timeouts": self.timeouts,
+                "max_followers": self.max_followers,
+            }
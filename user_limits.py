@@ -0,0 +1,159 @@
+import heapq
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from context_packer import estimate_tokens
+
+# token ที่ LLM ใช้ระหว่างประมวลผลข้อความหนึ่ง: rag_handler/app เรียก record_llm_usage
+# แล้ว UserLimiter.metered บวกเข้าบัญชีของผู้ใช้เจ้าของข้อความ (ใช้ได้ทั้ง thread และ asyncio task)
+_CURRENT_USAGE = ContextVar("llm_usage", default=None)
+
+
+def record_llm_usage(prompt_tokens: int, output_tokens: int):
+    """บันทึก token ของ LLM call หนึ่งครั้งให้ข้อความที่กำลังประมวลผลอยู่ (ไม่มีผลถ้าไม่ได้อยู่ใน metered)"""
+    usage = _CURRENT_USAGE.get()
+    if usage is not None:
+        usage[0] += prompt_tokens
+        usage[1] += output_tokens
+
+
+def gemini_usage(response, prompt_text: str, output_text: str):
+    """(prompt, output) token จาก usage_metadata ของ genai response ถ้าไม่มีให้ประมาณจากความยาวข้อความ"""
+    metadata = getattr(response, "usage_metadata", None)
+    prompt_tokens = getattr(metadata, "prompt_token_count", 0) or estimate_tokens(prompt_text)
+    output_tokens = getattr(metadata, "candidates_token_count", 0) or estimate_tokens(output_text)
+    return prompt_tokens, output_tokens
+
+
+class _UserUsage:
+    __slots__ = ("tokens", "refilled_at", "day", "prompt_tokens", "output_tokens", "messages")
+
+    def __init__(self, burst: float, now: float, day: int):
+        self.tokens = burst
+        self.refilled_at = now
+        self.day = day
+        self.prompt_tokens = 0
+        self.output_tokens = 0
+        self.messages = 0
+
+
+class UserLimiter:
+    """จำกัดข้อความที่ต้องเรียก RAG/Gemini ต่อผู้ใช้: token bucket (rate_per_minute, burst) + โควตา token ของ LLM ต่อวัน
+
+    state ของผู้ใช้เก็บใน OrderedDict (LRU ไม่เกิน max_users) ทุกข้อความจึงเป็น O(1): หา entry, เติม bucket
+    ตามเวลาที่ผ่านไป, เทียบโควตา แล้วย้ายไปท้าย ไม่มีการวนผู้ใช้ทั้งหมดนอกจากตอนเรียก stats()
+    วันเปลี่ยนตามเวลาท้องถิ่น (utc_offset_hours) และนับแยกต่อ worker process เหมือน SessionStore
+    """
+
+    def __init__(self, rate_per_minute: float = 6, burst: int = 5, daily_token_budget: int = 100000,
+                 max_users: int = 10000, utc_offset_hours: float = 7, enabled: bool = True):
+        self.rate_per_second = max(0.0, rate_per_minute) / 60
+        self.burst = max(1, burst)
+        self.daily_token_budget = daily_token_budget
+        self.max_users = max(1, max_users)
+        self.utc_offset_seconds = utc_offset_hours * 3600
+        self.enabled = enabled
+        self._users = OrderedDict()  # user_id -> _UserUsage
+        self._lock = threading.Lock()
+
+        # --- สถิติสำหรับ /stats ---
+        self._day = self._today()
+        self._day_prompt_tokens = 0
+        self._day_output_tokens = 0
+        self._allowed = 0
+        self._limited = {"rate": 0, "budget": 0}
+        self._evicted = 0
+
+    def _today(self) -> int:
+        return int((time.time() + self.utc_offset_seconds) // 86400)
+
+    def _entry(self, user_id, now: float, day: int) -> _UserUsage:
+        if day != self._day:
+            self._day = day
+            self._day_prompt_tokens = 0
+            self._day_output_tokens = 0
+        entry = self._users.get(user_id)
+        if entry is None:
+            entry = self._users[user_id] = _UserUsage(self.burst, now, day)
+            if len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+                self._evicted += 1
+        else:
+            self._users.move_to_end(user_id)
+            if entry.day != day:
+                entry.day = day
+                entry.prompt_tokens = 0
+                entry.output_tokens = 0
+                entry.messages = 0
+        return entry
+
+    def check(self, user_id):
+        """ใช้ 1 token ของ bucket: คืน None ถ้าผ่าน, "rate" ถ้าส่งถี่เกิน หรือ "budget" ถ้าใช้ token ของวันนี้ครบแล้ว"""
+        if not self.enabled or not user_id:
+            return None
+        now = time.monotonic()
+        day = self._today()
+        with self._lock:
+            entry = self._entry(user_id, now, day)
+            if 0 < self.daily_token_budget <= entry.prompt_tokens + entry.output_tokens:
+                self._limited["budget"] += 1
+                return "budget"
+            entry.tokens = min(self.burst, entry.tokens + (now - entry.refilled_at) * self.rate_per_second)
+            entry.refilled_at = now
+            if entry.tokens < 1:
+                self._limited["rate"] += 1
+                return "rate"
+            entry.tokens -= 1
+            entry.messages += 1
+            self._allowed += 1
+        return None
+
+    def record_usage(self, user_id, prompt_tokens: int, output_tokens: int):
+        if not self.enabled or not user_id:
+            return
+        day = self._today()
+        with self._lock:
+            entry = self._entry(user_id, time.monotonic(), day)
+            entry.prompt_tokens += prompt_tokens
+            entry.output_tokens += output_tokens
+            self._day_prompt_tokens += prompt_tokens
+            self._day_output_tokens += output_tokens
+
+    @contextmanager
+    def metered(self, user_id):
+        """รวม token จาก record_llm_usage ภายใน block แล้วบวกเข้าบัญชีของ user_id ครั้งเดียวตอนจบ"""
+        usage = [0, 0]
+        reset_token = _CURRENT_USAGE.set(usage)
+        try:
+            yield usage
+        finally:
+            _CURRENT_USAGE.reset(reset_token)
+            if usage[0] or usage[1]:
+                self.record_usage(user_id, usage[0], usage[1])
+
+    def stats(self) -> dict:
+        day = self._today()
+        with self._lock:
+            today = [(e.prompt_tokens + e.output_tokens, user_id, e) for user_id, e in self._users.items()
+                     if e.day == day]
+            top = heapq.nlargest(5, today, key=lambda item: item[0])
+            return {
+                "enabled": self.enabled,
+                "rate_per_minute": round(self.rate_per_second * 60, 2),
+                "burst": self.burst,
+                "daily_token_budget": self.daily_token_budget,
+                "users": len(self._users),
+                "max_users": self.max_users,
+                "evicted": self._evicted,
+                "allowed": self._allowed,
+                "limited": dict(self._limited),
+                "prompt_tokens_today": self._day_prompt_tokens if self._day == day else 0,
+                "output_tokens_today": self._day_output_tokens if self._day == day else 0,
+                # แสดงแค่ส่วนต้นของ user id เหมือน log_pipeline
+                "top_users_today": [
+                    {"user": f"{user_id[:5]}***", "tokens": total, "messages": e.messages} for total, user_id, e in top
+                ],
+            }